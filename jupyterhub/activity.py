@@ -0,0 +1,144 @@
+"""Write-behind buffering of last_activity updates"""
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+import time
+
+from sqlalchemy import bindparam
+from sqlalchemy import or_
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm.attributes import set_committed_value
+from tornado.log import app_log
+
+from .metrics import ACTIVITY_BUFFER_SIZE
+from .metrics import ACTIVITY_FLUSH_DURATION_SECONDS
+
+
+class ActivityBuffer:
+    """Accumulate last_activity updates and write them in bulk
+
+    Activity is recorded on the in-memory ORM object immediately,
+    without marking it as modified,
+    so the Hub sees the new value right away.
+    Only the most recent timestamp per object is kept,
+    and pending timestamps are written to the database by :meth:`flush`
+    with one UPDATE statement per table.
+
+    Tables must have `id` and `last_activity` columns.
+    """
+
+    def __init__(self, db, log=app_log):
+        self.db = db
+        self.log = log
+        # {orm class: {id: last_activity}}
+        self._pending = {}
+
+    def __len__(self):
+        return sum(len(pending) for pending in self._pending.values())
+
+    def record(self, obj, timestamp):
+        """Record activity on an ORM object
+
+        last_activity is never moved backward.
+
+        Args:
+            obj: ORM object with `id` and `last_activity` attributes
+            timestamp (datetime): the time of the activity
+        Returns:
+            recorded (bool): True if last_activity was updated, False if not.
+        """
+        if obj.last_activity and obj.last_activity >= timestamp:
+            return False
+        set_committed_value(obj, 'last_activity', timestamp)
+        pending = self._pending.setdefault(type(obj), {})
+        pending[obj.id] = max(pending.get(obj.id, timestamp), timestamp)
+        ACTIVITY_BUFFER_SIZE.set(len(self))
+        return True
+
+    def _restore(self, pending):
+        """Put pending updates back in the buffer after a failed write"""
+        for orm_class, timestamps in pending.items():
+            current = self._pending.setdefault(orm_class, {})
+            for id, timestamp in timestamps.items():
+                current[id] = max(current.get(id, timestamp), timestamp)
+
+    @staticmethod
+    def _write(db, pending):
+        """Write pending updates with one UPDATE per table and commit"""
+        count = 0
+        for orm_class, timestamps in pending.items():
+            table = orm_class.__table__
+            # only move last_activity forward,
+            # in case another writer has recorded more recent activity
+            update = (
+                table.update()
+                .where(table.c.id == bindparam('_id'))
+                .where(
+                    or_(
+                        table.c.last_activity == None,
+                        table.c.last_activity < bindparam('_last_activity'),
+                    )
+                )
+                .values(last_activity=bindparam('_last_activity'))
+            )
+            db.execute(
+                update,
+                [
+                    {'_id': id, '_last_activity': timestamp}
+                    for id, timestamp in timestamps.items()
+                ],
+            )
+            count += len(timestamps)
+        db.commit()
+        return count
+
+    def _flushed(self, count, tic):
+        ACTIVITY_FLUSH_DURATION_SECONDS.observe(time.perf_counter() - tic)
+        self.log.debug(
+            "Wrote %i activity updates in %.3fs", count, time.perf_counter() - tic
+        )
+
+    def flush(self):
+        """Write all pending activity to the database
+
+        Returns the number of pending updates that were written.
+        """
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        tic = time.perf_counter()
+        try:
+            count = self._write(self.db, pending)
+        except SQLAlchemyError:
+            self.log.exception("Rolling back session due to database error")
+            self.db.rollback()
+            # keep the updates for the next flush
+            self._restore(pending)
+            return 0
+        finally:
+            ACTIVITY_BUFFER_SIZE.set(len(self))
+        self._flushed(count, tic)
+        return count
+
+    async def flush_async(self, db_executor):
+        """Write all pending activity to the database with a DatabaseExecutor
+
+        Like :meth:`flush`, but the updates are written
+        without blocking the event loop.
+        Activity recorded while the write is in progress
+        is kept for the next flush.
+        """
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        tic = time.perf_counter()
+        try:
+            count = await db_executor.run(self._write, pending)
+        except SQLAlchemyError:
+            self.log.exception("Error writing activity to the database")
+            # keep the updates for the next flush
+            self._restore(pending)
+            return 0
+        finally:
+            ACTIVITY_BUFFER_SIZE.set(len(self))
+        self._flushed(count, tic)
+        return count
@@ -0,0 +1,35 @@
+"""Add indexed lookup digest to token tables
+
+Revision ID: a3f1b2c4d5e6
+Revises: 4dc2d5a8c53c
+Create Date: 2020-06-02 10:12:41.316542
+
+"""
+# revision identifiers, used by Alembic.
+revision = 'a3f1b2c4d5e6'
+down_revision = '4dc2d5a8c53c'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    # existing tokens keep a null digest and are found by prefix,
+    # generated tokens are assigned a digest the next time they are used
+    tables = op.get_bind().engine.table_names()
+    for table in ('api_tokens', 'oauth_access_tokens'):
+        if table in tables:
+            op.add_column(
+                table, sa.Column('lookup_digest', sa.Unicode(length=64), nullable=True)
+            )
+            op.create_index(
+                'ix_%s_lookup_digest' % table, table, ['lookup_digest'], unique=True
+            )
+
+
+def downgrade():
+    for table in ('api_tokens', 'oauth_access_tokens'):
+        op.drop_index('ix_%s_lookup_digest' % table, table_name=table)
+        op.drop_column(table, 'lookup_digest')
@@ -0,0 +1,46 @@
+"""Add indexes for foreign keys, expiry and activity lookups
+
+Revision ID: b7d2c4e1f0a9
+Revises: a3f1b2c4d5e6
+Create Date: 2020-06-16 14:03:27.518204
+
+"""
+# revision identifiers, used by Alembic.
+revision = 'b7d2c4e1f0a9'
+down_revision = 'a3f1b2c4d5e6'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+# table: columns to index
+indexed_columns = {
+    'users': ['last_activity'],
+    'user_group_map': ['group_id'],
+    'spawners': ['user_id', 'server_id', 'last_activity'],
+    'api_tokens': ['user_id', 'service_id', 'expires_at'],
+    'oauth_access_tokens': ['user_id', 'client_id', 'expires_at'],
+    'oauth_codes': ['user_id', 'client_id', 'code', 'expires_at'],
+}
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = inspector.get_table_names()
+    for table, columns in indexed_columns.items():
+        if table not in tables:
+            continue
+        # indexes may have been added by hand on large deployments
+        existing = {index['name'] for index in inspector.get_indexes(table)}
+        for column in columns:
+            name = 'ix_%s_%s' % (table, column)
+            if name not in existing:
+                op.create_index(name, table, [column])
+
+
+def downgrade():
+    for table, columns in indexed_columns.items():
+        for column in columns:
+            op.drop_index('ix_%s_%s' % (table, column), table_name=table)
@@ -15,6 +15,8 @@ from tornado import web
 from .. import orm
 from ..user import User
 from ..utils import compare_token
+from ..utils import identity_key
+from ..utils import sign_identity
 from ..utils import token_authenticated
 from .base import APIHandler
 from .base import BaseHandler
@@ -42,6 +44,11 @@ class TokenAPIHandler(APIHandler):
             self.db.commit()
             raise web.HTTPError(404)
         self.db.commit()
+        if self.identity_token_max_age and self.get_argument('identity', ''):
+            # sign the model for the service that asked
+            model['identity'] = sign_identity(
+                identity_key(self.get_auth_token()), model, self.identity_token_max_age,
+            )
         self.write(json.dumps(model))
 
     async def post(self):
@@ -89,6 +96,25 @@ class TokenAPIHandler(APIHandler):
         )
 
 
+class IdentityRevocationsAPIHandler(APIHandler):
+    @token_authenticated
+    def get(self):
+        """Return recent revocations of identity tokens
+
+        Identity tokens for a user issued before the time of revocation
+        should not be trusted, nor should any identity token
+        issued before `since`, when the Hub started.
+        """
+        self.write(
+            json.dumps(
+                {
+                    'revoked': self.identity_revocations,
+                    'since': self.identity_revocations_since,
+                }
+            )
+        )
+
+
 class CookieAPIHandler(APIHandler):
     @token_authenticated
     def get(self, cookie_name, cookie_value=None):
@@ -313,6 +339,7 @@ class OAuthTokenHandler(OAuthHandler, APIHandler):
 
 
 default_handlers = [
+    (r"/api/authorizations/revocations", IdentityRevocationsAPIHandler),
     (r"/api/authorizations/cookie/([^/]+)(?:/([^/]+))?", CookieAPIHandler),
     (r"/api/authorizations/token/([^/]+)", TokenAPIHandler),
     (r"/api/authorizations/token", TokenAPIHandler),
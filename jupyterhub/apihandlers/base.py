@@ -4,12 +4,16 @@
 import json
 from datetime import datetime
 from http.client import responses
+from urllib.parse import parse_qsl
+from urllib.parse import urlencode
 
 from sqlalchemy.exc import SQLAlchemyError
 from tornado import web
 
 from .. import orm
 from ..handlers import BaseHandler
+from ..pagination import decode_cursor
+from ..pagination import encode_cursor
 from ..utils import isoformat
 from ..utils import url_path_join
 
@@ -85,6 +89,102 @@ class APIHandler(BaseHandler):
             raise web.HTTPError(400, 'Invalid JSON in body of request')
         return model
 
+    # number of records fetched and written at a time
+    # when streaming responses
+    stream_chunk_size = 100
+
+    @property
+    def accepts_ndjson(self):
+        """Whether the client asked for newline-delimited JSON
+
+        via `Accept: application/x-ndjson`
+        """
+        accept = self.request.headers.get('Accept', '')
+        return 'application/x-ndjson' in accept
+
+    def _get_int_argument(self, name, minimum):
+        value = self.get_argument(name, None)
+        if value is None:
+            return None
+        try:
+            value = int(value)
+        except ValueError:
+            raise web.HTTPError(400, "%s must be an integer, not %r" % (name, value))
+        if value < minimum:
+            raise web.HTTPError(400, "%s must be at least %i" % (name, minimum))
+        return value
+
+    def get_after_id(self, sort):
+        """Get the id of the last item of the previous page, if any
+
+        from the opaque `after` cursor of a paginated list,
+        sorted by id and identified by `sort`.
+        """
+        cursor = self.get_argument('after', None)
+        if cursor is None:
+            return None
+        try:
+            (after_id,) = decode_cursor(cursor, sort, length=1)
+        except ValueError as e:
+            raise web.HTTPError(400, str(e))
+        if not isinstance(after_id, int):
+            raise web.HTTPError(400, "Invalid cursor: %r" % cursor)
+        return after_id
+
+    def set_next_link(self, sort, last_id):
+        """Set the Link header to the next page of a paginated list
+
+        The next page starts after `last_id`,
+        with an opaque `after` cursor replacing any offset.
+        """
+        query = [
+            (key, value)
+            for key, value in parse_qsl(self.request.query)
+            if key not in {'after', 'offset'}
+        ]
+        query.append(('after', encode_cursor([last_id], sort)))
+        self.set_header(
+            'Link', '<%s?%s>; rel="next"' % (self.request.path, urlencode(query))
+        )
+
+    def iter_query(self, query):
+        """Iterate over the results of an ORM query, in order of id
+
+        Results are fetched `stream_chunk_size` at a time,
+        each chunk with its own query,
+        so no cursor is held open while the response is being written.
+        """
+        entity = query.column_descriptions[0]['entity']
+        query = query.order_by(entity.id)
+        last_id = None
+        while True:
+            chunk_query = query
+            if last_id is not None:
+                chunk_query = chunk_query.filter(entity.id > last_id)
+            chunk = chunk_query.limit(self.stream_chunk_size).all()
+            yield from chunk
+            if len(chunk) < self.stream_chunk_size:
+                return
+            last_id = chunk[-1].id
+
+    async def write_models(self, models):
+        """Write a collection of JSON models
+
+        By default, a JSON list is written.
+        If the client accepts `application/x-ndjson`,
+        one model is written per line,
+        and the response is flushed every `stream_chunk_size` models,
+        so the whole collection is never held in memory.
+        """
+        if not self.accepts_ndjson:
+            self.write(json.dumps(list(models)))
+            return
+        self.set_header('Content-Type', 'application/x-ndjson')
+        for i, model in enumerate(models, 1):
+            self.write(json.dumps(model) + '\n')
+            if i % self.stream_chunk_size == 0:
+                await self.flush()
+
     def write_error(self, status_code, **kwargs):
         """Write JSON errors instead of HTML"""
         exc_info = kwargs.get('exc_info')
@@ -184,7 +284,8 @@ class APIHandler(BaseHandler):
     def user_model(self, user, include_servers=False, include_state=False):
         """Get the JSON model for a User object"""
         if isinstance(user, orm.User):
-            user = self.users[user.id]
+            # wrap the loaded orm.User, instead of loading it again by id
+            user = self.users[user]
 
         model = {
             'kind': 'user',
@@ -2,6 +2,7 @@
 # Copyright (c) Jupyter Development Team.
 # Distributed under the terms of the Modified BSD License.
 import json
+from itertools import islice
 
 from tornado import gen
 from tornado import web
@@ -23,6 +24,14 @@ class _GroupAPIHandler(APIHandler):
             users.append(user.orm_user)
         return users
 
+    def _revoke_members(self, users):
+        """Revoke identity tokens of users whose group membership changed
+
+        Identity tokens include the user's groups.
+        """
+        for user in users:
+            self.revoke_identity_tokens(user.name)
+
     def find_group(self, name):
         """Find and return a group by name.
 
@@ -36,10 +45,27 @@ class _GroupAPIHandler(APIHandler):
 
 class GroupListAPIHandler(_GroupAPIHandler):
     @admin_only
-    def get(self):
-        """List groups"""
-        data = [self.group_model(g) for g in self.db.query(orm.Group)]
-        self.write(json.dumps(data))
+    async def get(self):
+        """List groups
+
+        Query parameters (all optional):
+
+        - limit: return a page of groups, ordered by id
+        - after: start the page after the opaque cursor
+          from the `Link: <...>; rel="next"` header of the previous page
+        """
+        limit = self._get_int_argument('limit', 1)
+        query = self.db.query(orm.Group).options(*orm.Group.eager_load_options())
+        after_id = self.get_after_id('groups')
+        if after_id is not None:
+            query = query.filter(orm.Group.id > after_id)
+        if self.accepts_ndjson:
+            query = islice(self.iter_query(query), limit)
+        elif limit is not None:
+            query = query.order_by(orm.Group.id).limit(limit).all()
+            if len(query) == limit:
+                self.set_next_link('groups', query[-1].id)
+        await self.write_models(self.group_model(g) for g in query)
 
     @admin_only
     async def post(self):
@@ -66,6 +92,7 @@ class GroupListAPIHandler(_GroupAPIHandler):
             group = orm.Group(name=name, users=users)
             self.db.add(group)
             self.db.commit()
+            self._revoke_members(users)
             created.append(group)
         self.write(json.dumps([self.group_model(group) for group in created]))
         self.set_status(201)
@@ -102,6 +129,7 @@ class GroupAPIHandler(_GroupAPIHandler):
         group = orm.Group(name=name, users=users)
         self.db.add(group)
         self.db.commit()
+        self._revoke_members(users)
         self.write(json.dumps(self.group_model(group)))
         self.set_status(201)
 
@@ -110,8 +138,10 @@ class GroupAPIHandler(_GroupAPIHandler):
         """Delete a group by name"""
         group = self.find_group(name)
         self.log.info("Deleting group %s", name)
+        members = list(group.users)
         self.db.delete(group)
         self.db.commit()
+        self._revoke_members(members)
         self.set_status(204)
 
 
@@ -128,12 +158,15 @@ class GroupUsersAPIHandler(_GroupAPIHandler):
             raise web.HTTPError(400, "Must specify users to add")
         self.log.info("Adding %i users to group %s", len(data['users']), name)
         self.log.debug("Adding: %s", data['users'])
+        added = []
         for user in self._usernames_to_users(data['users']):
             if user not in group.users:
                 group.users.append(user)
+                added.append(user)
             else:
                 self.log.warning("User %s already in group %s", user.name, name)
         self.db.commit()
+        self._revoke_members(added)
         self.write(json.dumps(self.group_model(group)))
 
     @admin_only
@@ -146,12 +179,15 @@ class GroupUsersAPIHandler(_GroupAPIHandler):
             raise web.HTTPError(400, "Must specify users to delete")
         self.log.info("Removing %i users from group %s", len(data['users']), name)
         self.log.debug("Removing: %s", data['users'])
+        removed = []
         for user in self._usernames_to_users(data['users']):
             if user in group.users:
                 group.users.remove(user)
+                removed.append(user)
             else:
                 self.log.warning("User %s already not in group %s", user.name, name)
         self.db.commit()
+        self._revoke_members(removed)
         self.write(json.dumps(self.group_model(group)))
 
 
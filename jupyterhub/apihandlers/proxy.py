@@ -21,7 +21,11 @@ class ProxyAPIHandler(APIHandler):
         but without clients needing to maintain separate
         """
         routes = await self.proxy.get_all_routes()
-        self.write(json.dumps(routes))
+        if self.accepts_ndjson:
+            # one route per line, each including its routespec
+            await self.write_models(routes.values())
+        else:
+            self.write(json.dumps(routes))
 
     @admin_only
     async def post(self):
@@ -6,6 +6,7 @@ import json
 from datetime import datetime
 from datetime import timedelta
 from datetime import timezone
+from itertools import islice
 
 from async_generator import aclosing
 from dateutil.parser import parse as parse_date
@@ -39,13 +40,167 @@ class SelfAPIHandler(APIHandler):
 
 
 class UserListAPIHandler(APIHandler):
+    # keys of the user model that can be selected with ?fields=
+    # 'servers.state' selects servers, including their state
+    _user_fields = {
+        'kind',
+        'name',
+        'admin',
+        'groups',
+        'server',
+        'pending',
+        'created',
+        'last_activity',
+        'servers',
+        'servers.state',
+    }
+
+    def _user_has_ready_spawner(self, orm_user):
+        """Return True if a user has *any* ready spawners
+
+        Used for filtering from active -> ready
+        """
+        user = self.users[orm_user]
+        return any(spawner.ready for spawner in user.spawners.values())
+
+    def _get_fields(self):
+        """Return the set of user model fields requested, or None for all"""
+        fields = self.get_argument('fields', None)
+        if fields is None:
+            return None
+        fields = {field.strip() for field in fields.split(',') if field.strip()}
+        unrecognized = fields.difference(self._user_fields)
+        if unrecognized:
+            raise web.HTTPError(
+                400, "Unrecognized fields: %s" % ', '.join(sorted(unrecognized))
+            )
+        return fields
+
+    def _user_query(self):
+        """Build the query for users, applying filters from the request
+
+        Returns (query, post_filter), where post_filter is
+        an optional callable for filtering that can't be done in SQL.
+        """
+        # load relationships used by user_model with the users
+        query = self.db.query(orm.User).options(*orm.User.eager_load_options())
+        post_filter = None
+
+        state_filter = self.get_argument('state', None)
+        if state_filter in {'active', 'ready'}:
+            # only get users with active servers
+            # an 'active' Spawner has a server record in the database
+            # which means Spawner.server != None
+            active = self.db.query(orm.Spawner.user_id).filter(
+                orm.Spawner.server_id != None
+            )
+            query = query.filter(orm.User.id.in_(active))
+            if state_filter == 'ready':
+                # have to post-process query results because active vs ready
+                # can only be distinguished with in-memory Spawner properties
+                post_filter = self._user_has_ready_spawner
+        elif state_filter == 'inactive':
+            # only get users with *no* active servers,
+            # as opposed to users with *any* inactive servers
+            active = self.db.query(orm.Spawner.user_id).filter(
+                orm.Spawner.server_id != None
+            )
+            query = query.filter(~orm.User.id.in_(active))
+        elif state_filter:
+            raise web.HTTPError(400, "Unrecognized state filter: %r" % state_filter)
+
+        group_name = self.get_argument('group', None)
+        if group_name is not None:
+            query = query.filter(orm.User.groups.any(orm.Group.name == group_name))
+
+        before = self.get_argument('last_activity_before', None)
+        after = self.get_argument('last_activity_after', None)
+        if before or after:
+            # filtering is done in the database,
+            # so write activity that hasn't been written yet
+            if self.activity_buffer is not None:
+                self.activity_buffer.flush()
+        if before:
+            before = _parse_timestamp(before, allow_future=True)
+            query = query.filter(orm.User.last_activity < before)
+        if after:
+            after = _parse_timestamp(after, allow_future=True)
+            query = query.filter(orm.User.last_activity >= after)
+        return query, post_filter
+
     @admin_only
-    def get(self):
-        data = [
-            self.user_model(u, include_servers=True, include_state=True)
-            for u in self.db.query(orm.User)
-        ]
-        self.write(json.dumps(data))
+    async def get(self):
+        """List users
+
+        Query parameters (all optional):
+
+        - state: 'active', 'ready', or 'inactive'
+        - group: only users in the given group
+        - last_activity_before, last_activity_after: ISO8601 timestamps
+        - offset, limit: return a page of users, ordered by id
+        - after: start the page after the opaque cursor
+          from the `Link: <...>; rel="next"` header of the previous page,
+          which is set when a full page of `limit` users is returned
+        - fields: comma-separated list of fields to include in user models.
+          Server state is only included if 'servers.state' is requested.
+
+        With no parameters, all users are returned with all fields.
+
+        If the client accepts `application/x-ndjson`,
+        users are streamed, one model per line.
+        """
+        offset = self._get_int_argument('offset', 0)
+        limit = self._get_int_argument('limit', 1)
+        fields = self._get_fields()
+        query, post_filter = self._user_query()
+        after_id = self.get_after_id('users')
+        if after_id is not None:
+            query = query.filter(orm.User.id > after_id)
+
+        paginate = offset is not None or limit is not None
+        if self.accepts_ndjson:
+            # fetch users a chunk at a time while streaming the response
+            users = self.iter_query(query)
+        elif paginate and post_filter is None:
+            # paginate in the database
+            users = query.order_by(orm.User.id).offset(offset).limit(limit)
+            paginate = False
+        elif paginate:
+            users = query.order_by(orm.User.id)
+        else:
+            users = query
+        if post_filter is not None:
+            users = filter(post_filter, users)
+        if paginate:
+            start = offset or 0
+            stop = None if limit is None else start + limit
+            users = islice(users, start, stop)
+        if limit is not None and not self.accepts_ndjson:
+            users = list(users)
+            if len(users) == limit:
+                self.set_next_link('users', users[-1].id)
+
+        if fields is None:
+            include_servers = include_state = True
+        else:
+            include_state = 'servers.state' in fields
+            include_servers = include_state or 'servers' in fields
+            fields.discard('servers.state')
+            if include_servers:
+                fields.add('servers')
+
+        def models():
+            for orm_user in users:
+                model = self.user_model(
+                    orm_user,
+                    include_servers=include_servers,
+                    include_state=include_state,
+                )
+                if fields is not None:
+                    model = {key: model[key] for key in model if key in fields}
+                yield model
+
+        await self.write_models(models())
 
     @admin_only
     async def post(self):
@@ -103,16 +258,33 @@ class UserListAPIHandler(APIHandler):
         self.set_status(201)
 
 
+def _check_admin_or_self(handler, name):
+    current = handler.current_user
+    if current is None:
+        raise web.HTTPError(403)
+    if not (current.name == name or current.admin):
+        raise web.HTTPError(403)
+
+
 def admin_or_self(method):
-    """Decorator for restricting access to either the target user or admin"""
+    """Decorator for restricting access to either the target user or admin
 
-    def m(self, name, *args, **kwargs):
-        current = self.current_user
-        if current is None:
-            raise web.HTTPError(403)
-        if not (current.name == name or current.admin):
-            raise web.HTTPError(403)
+    For coroutine methods, the target user is found with find_user_async.
+    """
 
+    if asyncio.iscoroutinefunction(method):
+
+        async def m(self, name, *args, **kwargs):
+            _check_admin_or_self(self, name)
+            # raise 404 if not found
+            if not await self.find_user_async(name):
+                raise web.HTTPError(404)
+            return await method(self, name, *args, **kwargs)
+
+        return m
+
+    def m(self, name, *args, **kwargs):
+        _check_admin_or_self(self, name)
         # raise 404 if not found
         if not self.find_user(name):
             raise web.HTTPError(404)
@@ -124,7 +296,7 @@ def admin_or_self(method):
 class UserAPIHandler(APIHandler):
     @admin_or_self
     async def get(self, name):
-        user = self.find_user(name)
+        user = await self.find_user_async(name)
         model = self.user_model(
             user, include_servers=True, include_state=self.current_user.admin
         )
@@ -184,6 +356,7 @@ class UserAPIHandler(APIHandler):
         await maybe_future(self.authenticator.delete_user(user))
         # remove from registry
         self.users.delete(user)
+        self.revoke_identity_tokens(name)
 
         self.set_status(204)
 
@@ -207,6 +380,8 @@ class UserAPIHandler(APIHandler):
             else:
                 setattr(user, key, value)
         self.db.commit()
+        # the user model in identity tokens may have changed
+        self.revoke_identity_tokens(name)
         user_ = self.user_model(user)
         user_['auth_state'] = await user.get_auth_state()
         self.write(json.dumps(user_))
@@ -364,6 +539,7 @@ class UserTokenAPIHandler(APIHandler):
         for token in tokens:
             self.db.delete(token)
         self.db.commit()
+        self.revoke_identity_tokens(user.name)
         self.set_header('Content-Type', 'text/plain')
         self.set_status(204)
 
@@ -620,12 +796,14 @@ class SpawnProgressAPIHandler(APIHandler):
             await self.send_event(failed_event)
 
 
-def _parse_timestamp(timestamp):
+def _parse_timestamp(timestamp, allow_future=False):
     """Parse and return a utc timestamp
 
     - raise HTTPError(400) on parse error
     - handle and strip tz info for internal consistency
       (we use naive utc timestamps everywhere)
+    - reject timestamps more than an hour in the future,
+      unless allow_future is True
     """
     try:
         dt = parse_date(timestamp)
@@ -635,6 +813,8 @@ def _parse_timestamp(timestamp):
         # strip timezone info to naive UTC datetime
         dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
 
+    if allow_future:
+        return dt
     now = datetime.utcnow()
     if (dt - now) > timedelta(minutes=59):
         raise web.HTTPError(
@@ -647,6 +827,13 @@ def _parse_timestamp(timestamp):
 
 
 class ActivityAPIHandler(APIHandler):
+    def _set_last_activity(self, obj, last_activity):
+        """Set last_activity on an ORM object, via the activity buffer if enabled"""
+        if self.activity_buffer is not None:
+            self.activity_buffer.record(obj, last_activity)
+        else:
+            obj.last_activity = last_activity
+
     def _validate_servers(self, user, servers):
         """Validate servers dict argument
 
@@ -679,8 +866,8 @@ class ActivityAPIHandler(APIHandler):
         return servers
 
     @admin_or_self
-    def post(self, username):
-        user = self.find_user(username)
+    async def post(self, username):
+        user = await self.find_user_async(username)
         if user is None:
             # no such user
             raise web.HTTPError(404, "No such user: %r", username)
@@ -710,7 +897,7 @@ class ActivityAPIHandler(APIHandler):
                 self.log.debug(
                     "Activity for user %s: %s", user.name, isoformat(last_activity)
                 )
-                user.last_activity = last_activity
+                self._set_last_activity(user.orm_user, last_activity)
             else:
                 self.log.debug(
                     "Not updating activity for %s: %s < %s",
@@ -731,7 +918,7 @@ class ActivityAPIHandler(APIHandler):
                         server_name,
                         isoformat(last_activity),
                     )
-                    spawner.last_activity = last_activity
+                    self._set_last_activity(spawner, last_activity)
                 else:
                     self.log.debug(
                         "Not updating server activity on %s/%s: %s < %s",
@@ -5,6 +5,7 @@
 import asyncio
 import atexit
 import binascii
+import inspect
 import json
 import logging
 import os
@@ -33,6 +34,7 @@ if sys.version_info[:2] < (3, 3):
 from dateutil.parser import parse as parse_date
 from jinja2 import Environment, FileSystemLoader, PrefixLoader, ChoiceLoader
 from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from sqlalchemy.sql.expression import bindparam
 
 from tornado.httpclient import AsyncHTTPClient
 import tornado.httpserver
@@ -73,8 +75,12 @@ from .services.service import Service
 
 from . import crypto
 from . import dbutil, orm
+from .activity import ActivityBuffer
+from .dbexecutor import DatabaseExecutor
+from .user import AuthStateCache
 from .user import UserDict
 from .oauth.provider import make_provider
+from .poller import PollScheduler
 from ._data import DATA_FILES_PATH
 from .log import CoroutineLogFormatter, log_request
 from .proxy import Proxy, ConfigurableHTTPProxy
@@ -86,8 +92,12 @@ from .utils import (
     print_ps_info,
     make_ssl_context,
 )
+from .metrics import EVENT_LOOP_LAG_SECONDS
 from .metrics import HUB_STARTUP_DURATION_SECONDS
+from .metrics import HUB_STARTUP_PHASE_DURATION_SECONDS
 from .metrics import INIT_SPAWNERS_DURATION_SECONDS
+from .metrics import PURGE_EXPIRED_DURATION_SECONDS
+from .metrics import PURGE_EXPIRED_ROWS
 from .metrics import RUNNING_SERVERS
 from .metrics import TOTAL_USERS
 
@@ -238,6 +248,164 @@ class UpgradeDB(Application):
         dbutil.upgrade_if_needed(hub.db_url, log=self.log)
 
 
+class RotateAuthStateKey(Application):
+    """Re-encrypt all users' auth_state with the current key"""
+
+    name = 'jupyterhub-rotate-auth-state-key'
+    version = jupyterhub.__version__
+    description = """Re-encrypt auth_state with the first key in JUPYTERHUB_CRYPT_KEY.
+
+    After adding a new key at the start of JUPYTERHUB_CRYPT_KEY,
+    run this to re-encrypt all stored auth_state with it.
+    The old keys can be removed once it has completed.
+
+    The Hub may keep running, as long as it is configured with the new keys.
+    Users whose auth_state is saved by the Hub during rotation
+    are not overwritten, but re-encrypted again afterwards.
+
+    Usage:
+
+        JUPYTERHUB_CRYPT_KEY="$new_key;$old_key" jupyterhub rotate-auth-state-key
+    """
+
+    batch_size = Integer(
+        1000,
+        config=True,
+        help="The number of users whose auth_state is re-encrypted per transaction",
+    )
+
+    aliases = dict(common_aliases, **{'batch-size': 'RotateAuthStateKey.batch_size'})
+    classes = []
+
+    retries = Integer(
+        3,
+        config=True,
+        help="""The number of times to retry users whose auth_state changed during rotation
+
+        The Hub may save new auth_state for a user (e.g. on login)
+        between reading and writing a batch.
+        Those users are not overwritten, but re-encrypted again afterwards.
+        """,
+    )
+
+    async def _rotate_rows(self, db, ck, rows):
+        """Re-encrypt a batch of (id, encrypted_auth_state) rows
+
+        A row is only updated if its auth_state is unchanged since it was read.
+
+        Returns the ids of the rows that were changed concurrently, and not updated.
+        """
+        update = (
+            orm.User.__table__.update()
+            .where(orm.User.id == bindparam('_id'))
+            .where(orm.User.encrypted_auth_state == bindparam('_old_auth_state'))
+            .values(encrypted_auth_state=bindparam('_auth_state'))
+        )
+        rotated = await ck.rotate_many([row[1] for row in rows])
+        db.execute(
+            update,
+            [
+                {'_id': row[0], '_old_auth_state': row[1], '_auth_state': auth_state}
+                for row, auth_state in zip(rows, rotated)
+            ],
+        )
+        db.commit()
+        # rowcount of executemany isn't reliable on all databases,
+        # so check which rows hold the re-encrypted value
+        current = dict(
+            db.query(orm.User.id, orm.User.encrypted_auth_state).filter(
+                orm.User.id.in_([row[0] for row in rows])
+            )
+        )
+        return [
+            row[0]
+            for row, auth_state in zip(rows, rotated)
+            if row[0] in current and current[row[0]] != auth_state
+        ]
+
+    async def rotate(self, db, ck):
+        """Re-encrypt auth_state, one batch of users at a time
+
+        Users whose auth_state changed while their batch was being re-encrypted
+        are retried up to `retries` times.
+
+        Returns the number of users whose auth_state was re-encrypted,
+        and a list of the ids of users that could not be re-encrypted.
+        """
+        query = db.query(orm.User.id, orm.User.encrypted_auth_state).filter(
+            orm.User.encrypted_auth_state != None
+        )
+        count = 0
+        changed = []
+        last_id = 0
+        while True:
+            rows = (
+                query.filter(orm.User.id > last_id)
+                .order_by(orm.User.id)
+                .limit(self.batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            skipped = await self._rotate_rows(db, ck, rows)
+            changed.extend(skipped)
+            count += len(rows) - len(skipped)
+            last_id = rows[-1][0]
+            self.log.info("Re-encrypted auth_state for %i users", count)
+
+        for attempt in range(self.retries):
+            if not changed:
+                break
+            self.log.info(
+                "Retrying %i users whose auth_state changed during rotation",
+                len(changed),
+            )
+            retry_ids = changed
+            changed = []
+            for i in range(0, len(retry_ids), self.batch_size):
+                rows = query.filter(
+                    orm.User.id.in_(retry_ids[i : i + self.batch_size])
+                ).all()
+                skipped = await self._rotate_rows(db, ck, rows)
+                changed.extend(skipped)
+                count += len(rows) - len(skipped)
+        return count, changed
+
+    def start(self):
+        hub = JupyterHub(parent=self)
+        hub.load_config_file(hub.config_file)
+        self.log = hub.log
+        hub.init_db()
+        ck = CryptKeeper.instance(parent=hub)
+        try:
+            ck.check_available()
+        except crypto.EncryptionUnavailable as e:
+            print("Cannot rotate auth_state: %s" % e, file=sys.stderr)
+            self.exit(1)
+
+        def rotate():
+            loop = asyncio.new_event_loop()
+            try:
+                return loop.run_until_complete(self.rotate(hub.db, ck))
+            finally:
+                loop.close()
+
+        tic = time.perf_counter()
+        count, changed = ThreadPoolExecutor(1).submit(rotate).result()
+        duration = time.perf_counter() - tic
+        print(
+            "Re-encrypted auth_state for %i users in %.1fs (%.0f users/s)"
+            % (count, duration, count / duration if duration else 0)
+        )
+        if changed:
+            print(
+                "auth_state of %i users kept changing during rotation."
+                " Run rotate-auth-state-key again to re-encrypt them." % len(changed),
+                file=sys.stderr,
+            )
+            self.exit(1)
+
+
 class JupyterHub(Application):
     """An Application for starting a Multi-User Jupyter Notebook server."""
 
@@ -273,6 +441,10 @@ class JupyterHub(Application):
             UpgradeDB,
             "Upgrade your JupyterHub state database to the current version.",
         ),
+        'rotate-auth-state-key': (
+            RotateAuthStateKey,
+            "Re-encrypt auth_state with the current encryption key.",
+        ),
     }
 
     classes = List()
@@ -311,6 +483,19 @@ class JupyterHub(Application):
         """,
     ).tag(config=True)
 
+    init_users_concurrency = Integer(
+        10,
+        help="""The number of Authenticator.add_user calls to run concurrently at startup.
+
+        At startup, add_user is called for every user in the database.
+        Authenticators whose add_user is slow (e.g. checking an external service)
+        can be called for several users at once.
+        Set to 1 to call add_user for one user at a time.
+
+        .. versionadded:: 1.2
+        """,
+    ).tag(config=True)
+
     config_file = Unicode('jupyterhub_config.py', help="The config file to load").tag(
         config=True
     )
@@ -346,6 +531,29 @@ class JupyterHub(Application):
         Default is two weeks.
         """,
     ).tag(config=True)
+    identity_token_max_age = Integer(
+        0,
+        help="""Lifetime (in seconds) of signed identity tokens issued to services.
+
+        If set, the Hub includes a signed identity token
+        when a service or single-user server checks an OAuth token with the Hub.
+        HubOAuth stores it in a cookie and verifies it without asking the Hub again
+        until it expires, or the user logs out or has their tokens revoked.
+
+        Identity tokens are signed with a key derived from the API token
+        of the service or server that asked for it,
+        so they can only be verified by the service that received them.
+
+        Revocations are kept in memory by the Hub.
+        When the Hub restarts, services stop trusting identity tokens
+        issued before the restart the next time they check for revocations
+        (HubAuth.identity_revocation_interval).
+
+        Set to 0 (default) to disable identity tokens.
+
+        .. versionadded:: 1.2
+        """,
+    ).tag(config=True)
     redirect_to_server = Bool(
         True, help="Redirect user to server (if running), instead of control panel."
     ).tag(config=True)
@@ -364,6 +572,21 @@ class JupyterHub(Application):
     last_activity_interval = Integer(
         300, help="Interval (in seconds) at which to update last-activity timestamps."
     ).tag(config=True)
+    activity_flush_interval = Integer(
+        10,
+        help="""
+        Interval (in seconds) at which buffered activity is written to the database.
+
+        Activity from requests, tokens, and the proxy is accumulated in memory,
+        keeping only the most recent timestamp for each user, server, and token,
+        and written with one UPDATE per table every activity_flush_interval seconds.
+        Any remaining activity is written on shutdown.
+
+        Set to 0 to write activity to the database on every request.
+
+        .. versionadded:: 1.2
+        """,
+    ).tag(config=True)
     proxy_check_interval = Integer(
         30, help="Interval (in seconds) at which to check if the proxy is running."
     ).tag(config=True)
@@ -371,6 +594,64 @@ class JupyterHub(Application):
         60,
         help="Interval (in seconds) at which to check connectivity of services with web endpoints.",
     ).tag(config=True)
+    server_count_check_interval = Integer(
+        300,
+        help="""Interval (in seconds) at which to verify counts of active servers.
+
+        Counts of active, pending, and ready servers are maintained
+        as servers change state, so checking spawn limits is cheap.
+        Every server_count_check_interval seconds, the counts are checked
+        against a full scan of all servers, and corrected if they have drifted.
+
+        Set to 0 to disable the check.
+
+        .. versionadded:: 1.2
+        """,
+    ).tag(config=True)
+    query_count_warning_threshold = Integer(
+        0,
+        help="""Warn about requests that make more than this many database queries.
+
+        The warning includes the most repeated query,
+        to help find N+1 query patterns,
+        where a relationship is loaded separately for each item in a list.
+
+        The number of queries and the time spent in the database
+        are always included in the access log,
+        and exported as the `request_db_queries` and `request_db_duration_seconds`
+        prometheus metrics.
+        They are only collected on Python 3.7 or later.
+
+        Set to 0 (default) to disable the warning.
+
+        .. versionadded:: 1.2
+        """,
+    ).tag(config=True)
+    loop_lag_interval = Integer(
+        1,
+        help="""Interval (in seconds) at which to measure event loop lag.
+
+        Lag is the delay between scheduling a callback on the event loop
+        and the callback running, i.e. how long other work blocks the event loop.
+        It is reported as the `event_loop_lag_seconds` prometheus metric.
+
+        Set to 0 to disable the measurement.
+
+        .. versionadded:: 1.2
+        """,
+    ).tag(config=True)
+    poll_concurrency = Integer(
+        100,
+        help="""The maximum number of single-user server polls outstanding at once.
+
+        Running servers are polled every `Spawner.poll_interval` seconds
+        by a single scheduler, which spreads polls evenly across the interval.
+        Spawner classes that implement `Spawner.poll_many`
+        count one batch of servers as a single poll.
+
+        .. versionadded:: 1.2
+        """,
+    ).tag(config=True)
     active_user_window = Integer(
         30 * 60, help="Duration (in seconds) to determine the number of active users."
     ).tag(config=True)
@@ -1110,6 +1391,29 @@ class JupyterHub(Application):
         """
     ).tag(config=True)
 
+    sqlite_pragmas = Dict(
+        help="""PRAGMAs to set on each connection to a sqlite database.
+
+        By default, sqlite waits for each commit to be written to disk,
+        which limits how fast the Hub can record spawns and activity.
+        For faster commits, use write-ahead logging with less frequent syncs::
+
+            from jupyterhub.orm import SQLITE_PERFORMANCE_PRAGMAS
+            c.JupyterHub.sqlite_pragmas = SQLITE_PERFORMANCE_PRAGMAS
+
+        which sets `journal_mode=WAL`, `synchronous=NORMAL`,
+        and larger `cache_size` and `mmap_size`,
+        plus a `busy_timeout` for waiting on locks.
+        In this mode, the last commits before a power failure may be lost,
+        and the database should not be on a network filesystem.
+
+        Individual PRAGMAs can be set or overridden with a dict of `{name: value}`,
+        e.g. `{'synchronous': 'FULL'}`.
+
+        .. versionadded:: 1.2
+        """
+    ).tag(config=True)
+
     upgrade_db = Bool(
         False,
         help="""Upgrade the database automatically on start.
@@ -1122,14 +1426,102 @@ class JupyterHub(Application):
     debug_db = Bool(
         False, help="log all database transactions. This has A LOT of output"
     ).tag(config=True)
+    db_threads = Integer(
+        0,
+        help="""Number of threads for running database queries off the event loop.
+
+        If set, the heaviest database work of request handlers
+        (verifying API tokens, listing users on the admin page,
+        looking up users that are not in memory, and writing buffered activity)
+        runs in a separate database session on a pool of this many threads,
+        so a slow query does not block other requests.
+        This is most useful with a database server, such as PostgreSQL or MySQL.
+        The database connection pool should allow at least this many connections
+        in addition to the Hub's own connection (see `db_kwargs`).
+
+        Ignored for in-memory sqlite databases,
+        which only support a single connection.
+
+        Set to 0 (default) to run all database queries on the event loop.
+
+        .. versionadded:: 1.2
+        """,
+    ).tag(config=True)
     session_factory = Any()
+    db_executor = Instance(DatabaseExecutor, allow_none=True)
 
     users = Instance(UserDict)
+    poll_scheduler = Instance(PollScheduler, allow_none=True)
 
     @default('users')
     def _users_default(self):
         assert self.tornado_settings
-        return UserDict(db_factory=lambda: self.db, settings=self.tornado_settings)
+        return UserDict(
+            db_factory=lambda: self.db,
+            settings=self.tornado_settings,
+            max_size=self.max_cached_users,
+            min_idle=self.cached_user_min_idle,
+        )
+
+    max_cached_users = Integer(
+        0,
+        help="""Maximum number of users to keep in memory.
+
+        The Hub keeps a User wrapper (and Spawner objects) in memory
+        for each user it has seen.
+        If set, the least-recently-used users without active or pending servers
+        are evicted from memory once more than max_cached_users are loaded,
+        so memory tracks active users rather than all users who have ever logged in.
+        Evicted users are reloaded from the database when needed.
+
+        0 means no limit.
+
+        .. versionadded:: 1.2
+        """,
+    ).tag(config=True)
+
+    cached_user_min_idle = Integer(
+        300,
+        help="""Seconds a user must go unused before it can be evicted from memory.
+
+        Only used if max_cached_users is set.
+        A request may hold a user across several awaits,
+        and evicting it meanwhile would load a second copy of the user
+        and its Spawners on the next request.
+        Users used more recently than this are kept in memory,
+        even if more than max_cached_users are loaded.
+
+        .. versionadded:: 1.2
+        """,
+    ).tag(config=True)
+
+    auth_state_cache_ttl = Integer(
+        0,
+        help="""Seconds to keep decrypted auth_state in memory.
+
+        auth_state is decrypted each time it is used,
+        e.g. on every visit to the home page and on every spawn.
+        If set, decrypted auth_state is reused for up to this many seconds,
+        as long as the encrypted auth_state in the database is unchanged.
+        The cache is cleared if the encryption keys are changed.
+
+        Set to 0 (default) to decrypt auth_state every time.
+
+        .. versionadded:: 1.2
+        """,
+    ).tag(config=True)
+
+    auth_state_cache_size = Integer(
+        1000,
+        help="""Maximum number of users whose decrypted auth_state is cached.
+
+        See auth_state_cache_ttl.
+
+        .. versionadded:: 1.2
+        """,
+    ).tag(config=True)
+
+    auth_state_cache = Instance(AuthStateCache, allow_none=True)
 
     admin_access = Bool(
         False,
@@ -1581,9 +1973,24 @@ class JupyterHub(Application):
 
         try:
             self.session_factory = orm.new_session_factory(
-                self.db_url, reset=self.reset_db, echo=self.debug_db, **self.db_kwargs
+                self.db_url,
+                reset=self.reset_db,
+                echo=self.debug_db,
+                sqlite_pragmas=self.sqlite_pragmas,
+                **self.db_kwargs
             )
             self.db = self.session_factory()
+            self.activity_buffer = ActivityBuffer(self.db, log=self.log)
+            db_threads = self.db_threads
+            if db_threads and self.db_url.endswith(':memory:'):
+                self.log.warning(
+                    "Ignoring JupyterHub.db_threads=%i for in-memory database",
+                    db_threads,
+                )
+                db_threads = 0
+            self.db_executor = DatabaseExecutor(
+                self.session_factory, self.db, max_workers=db_threads, log=self.log
+            )
         except OperationalError as e:
             self.log.error("Failed to connect to db: %s", db_log_url)
             self.log.debug("Database error was:", exc_info=True)
@@ -1688,15 +2095,16 @@ class JupyterHub(Application):
                 "Add any administrative users to `c.Authenticator.admin_users` in config."
             )
 
-        new_users = []
+        # look up configured users with a few IN queries,
+        # rather than one query per user
+        existing_users = orm.User.find_many(db, admin_users)
+        new_users = {}
 
         for name in admin_users:
             # ensure anyone specified as admin in config is admin in db
-            user = orm.User.find(db, name)
+            user = existing_users.get(name)
             if user is None:
-                user = orm.User(name=name, admin=True)
-                new_users.append(user)
-                db.add(user)
+                new_users[name] = {'name': name, 'admin': True}
             else:
                 user.admin = True
 
@@ -1718,13 +2126,19 @@ class JupyterHub(Application):
             )
 
         # add allowed users to the db
+        existing_users.update(
+            orm.User.find_many(
+                db, [name for name in allowed_users if name not in new_users]
+            )
+        )
         for name in allowed_users:
-            user = orm.User.find(db, name)
-            if user is None:
-                user = orm.User(name=name)
-                new_users.append(user)
-                db.add(user)
+            if name not in existing_users and name not in new_users:
+                new_users[name] = {'name': name, 'admin': False}
 
+        if new_users:
+            self.log.info("Adding %i users to the database", len(new_users))
+            # one bulk INSERT, without creating ORM objects
+            db.execute(orm.User.__table__.insert(), list(new_users.values()))
         db.commit()
 
         # Notify authenticator of all users.
@@ -1732,14 +2146,27 @@ class JupyterHub(Application):
         # This lets .allowed_users be used to set up initial list,
         # but changes to the allowed_users set can occur in the database,
         # and persist across sessions.
-        total_users = 0
-        for user in db.query(orm.User):
-            try:
+        semaphore = asyncio.Semaphore(max(self.init_users_concurrency, 1))
+
+        async def add_user(user):
+            async with semaphore:
                 f = self.authenticator.add_user(user)
                 if f:
                     await maybe_future(f)
-            except Exception:
-                self.log.exception("Error adding user %s already in db", user.name)
+
+        users = db.query(orm.User).all()
+        results = await asyncio.gather(
+            *(add_user(user) for user in users), return_exceptions=True
+        )
+        total_users = 0
+        for user, result in zip(users, results):
+            if isinstance(result, BaseException) and not isinstance(result, Exception):
+                # e.g. cancelled
+                raise result
+            if isinstance(result, Exception):
+                self.log.error(
+                    "Error adding user %s already in db", user.name, exc_info=result
+                )
                 if self.authenticator.delete_invalid_users:
                     self.log.warning(
                         "Deleting invalid user %s from the Hub database", user.name
@@ -1776,26 +2203,45 @@ class JupyterHub(Application):
     async def init_groups(self):
         """Load predefined groups into the database"""
         db = self.db
-        for name, usernames in self.load_groups.items():
-            group = orm.Group.find(db, name)
+        if not self.load_groups:
+            return
+        group_usernames = {
+            name: [
+                self.authenticator.normalize_username(username)
+                for username in usernames
+            ]
+            for name, usernames in self.load_groups.items()
+        }
+        all_usernames = {
+            username for usernames in group_usernames.values() for username in usernames
+        }
+        for username in sorted(all_usernames):
+            if not (
+                await maybe_future(self.authenticator.check_allowed(username, None))
+            ):
+                raise ValueError(
+                    "Username %r is not in Authenticator.allowed_users" % username
+                )
+
+        users = orm.User.find_many(db, all_usernames)
+        for username in sorted(all_usernames.difference(users)):
+            if not self.authenticator.validate_username(username):
+                raise ValueError("Group username %r is not valid" % username)
+            users[username] = user = orm.User(name=username)
+            db.add(user)
+
+        groups = orm.Group.find_many(db, group_usernames)
+        for name, usernames in group_usernames.items():
+            group = groups.get(name)
             if group is None:
                 group = orm.Group(name=name)
                 db.add(group)
+            members = set(group.users)
             for username in usernames:
-                username = self.authenticator.normalize_username(username)
-                if not (
-                    await maybe_future(self.authenticator.check_allowed(username, None))
-                ):
-                    raise ValueError(
-                        "Username %r is not in Authenticator.allowed_users" % username
-                    )
-                user = orm.User.find(db, name=username)
-                if user is None:
-                    if not self.authenticator.validate_username(username):
-                        raise ValueError("Group username %r is not valid" % username)
-                    user = orm.User(name=username)
-                    db.add(user)
-                group.users.append(user)
+                user = users[username]
+                if user not in members:
+                    members.add(user)
+                    group.users.append(user)
         db.commit()
 
     async def _add_tokens(self, token_dict, kind):
@@ -1808,9 +2254,16 @@ class JupyterHub(Application):
             raise ValueError("kind must be user or service, not %r" % kind)
 
         db = self.db
-        for token, name in token_dict.items():
+        if not token_dict:
+            return
+        if kind == 'user':
+            token_dict = {
+                token: self.authenticator.normalize_username(name)
+                for token, name in token_dict.items()
+            }
+        names = set(token_dict.values())
+        for name in sorted(names):
             if kind == 'user':
-                name = self.authenticator.normalize_username(name)
                 if not (
                     await maybe_future(self.authenticator.check_allowed(name, None))
                 ):
@@ -1826,14 +2279,17 @@ class JupyterHub(Application):
                         "Warning: service '%s' not in services, creating implicitly. It is recommended to register services using services list."
                         % name
                     )
+
+        existing = Class.find_many(db, names)
+        for token, name in token_dict.items():
             orm_token = orm.APIToken.find(db, token)
             if orm_token is None:
-                obj = Class.find(db, name)
+                obj = existing.get(name)
                 created = False
                 if obj is None:
                     created = True
                     self.log.debug("Adding %s %s to database", kind, name)
-                    obj = Class(name=name)
+                    obj = existing[name] = Class(name=name)
                     db.add(obj)
                     db.commit()
                 self.log.info("Adding API token for %s: %s", kind, name)
@@ -1850,6 +2306,7 @@ class JupyterHub(Application):
                         # don't allow bad tokens to create users
                         db.delete(obj)
                         db.commit()
+                        existing.pop(name)
                         raise
             else:
                 self.log.debug("Not duplicating token %s", orm_token)
@@ -1858,22 +2315,39 @@ class JupyterHub(Application):
     # purge expired tokens hourly
     purge_expired_tokens_interval = 3600
 
-    def purge_expired_tokens(self):
+    async def purge_expired_tokens(self):
         """purge all expiring token objects from the database
 
         run periodically
+
+        Expired rows are deleted in batches of `Expiring.purge_batch_size`
+        with the database executor, yielding to the event loop between batches,
+        so that a large backlog of expired rows doesn't block the Hub.
         """
+        tic = time.perf_counter()
         # this should be all the subclasses of Expiring
         for cls in (orm.APIToken, orm.OAuthAccessToken, orm.OAuthCode):
             self.log.debug("Purging expired {name}s".format(name=cls.__name__))
-            cls.purge_expired(self.db)
+            deleted = 0
+            while True:
+                ids = await self.db_executor.run(cls.delete_expired_batch)
+                cls.forget_deleted(self.db, ids)
+                deleted += len(ids)
+                PURGE_EXPIRED_ROWS.labels(table=cls.__tablename__).inc(len(ids))
+                if len(ids) < cls.purge_batch_size:
+                    break
+                # let other work run between batches
+                await asyncio.sleep(0)
+            if deleted:
+                self.log.info("Purged %i expired %ss", deleted, cls.__name__)
+        PURGE_EXPIRED_DURATION_SECONDS.observe(time.perf_counter() - tic)
 
     async def init_api_tokens(self):
         """Load predefined API tokens (for services) into database"""
         await self._add_tokens(self.service_tokens, kind='service')
         await self._add_tokens(self.api_tokens, kind='user')
 
-        self.purge_expired_tokens()
+        await self.purge_expired_tokens()
         # purge expired tokens hourly
         # we don't need to be prompt about this
         # because expired tokens cannot be used anyway
@@ -2219,6 +2693,19 @@ class JupyterHub(Application):
                 )
                 oauth_no_confirm_list.add(service.oauth_client_id)
 
+        self.poll_scheduler = PollScheduler(
+            concurrency=self.poll_concurrency, log=self.log
+        )
+
+        if self.auth_state_cache_ttl:
+            self.auth_state_cache = AuthStateCache(
+                max_size=self.auth_state_cache_size, ttl=self.auth_state_cache_ttl
+            )
+            # values decrypted with old keys must not outlive key rotation
+            crypto.CryptKeeper.instance().observe(
+                lambda change: self.auth_state_cache.clear(), names='keys'
+            )
+
         settings = dict(
             log_function=log_request,
             config=self.config,
@@ -2227,6 +2714,13 @@ class JupyterHub(Application):
             proxy=self.proxy,
             hub=self.hub,
             activity_resolution=self.activity_resolution,
+            activity_buffer=self.activity_buffer
+            if self.activity_flush_interval
+            else None,
+            db_executor=self.db_executor,
+            query_count_warning_threshold=self.query_count_warning_threshold,
+            poll_scheduler=self.poll_scheduler,
+            auth_state_cache=self.auth_state_cache,
             admin_users=self.authenticator.admin_users,
             admin_access=self.admin_access,
             authenticator=self.authenticator,
@@ -2235,6 +2729,9 @@ class JupyterHub(Application):
             default_url=self.default_url,
             cookie_secret=self.cookie_secret,
             cookie_max_age_days=self.cookie_max_age_days,
+            identity_token_max_age=self.identity_token_max_age,
+            identity_revocations={},
+            identity_revocations_since=time.time(),
             redirect_to_server=self.redirect_to_server,
             login_url=login_url,
             logout_url=logout_url,
@@ -2366,21 +2863,45 @@ class JupyterHub(Application):
         _log_cls("Spawner", self.spawner_class)
         _log_cls("Proxy", self.proxy_class)
 
-        self.init_eventlog()
-        self.init_pycurl()
-        self.init_secrets()
-        self.init_internal_ssl()
-        self.init_db()
-        self.init_hub()
-        self.init_proxy()
-        self.init_oauth()
-        await self.init_users()
-        await self.init_groups()
-        self.init_services()
-        await self.init_api_tokens()
-        self.init_tornado_settings()
-        self.init_handlers()
-        self.init_tornado_application()
+        # run each phase of startup, recording how long it takes
+        startup_phases = [
+            self.init_eventlog,
+            self.init_pycurl,
+            self.init_secrets,
+            self.init_internal_ssl,
+            self.init_db,
+            self.init_hub,
+            self.init_proxy,
+            self.init_oauth,
+            self.init_users,
+            self.init_groups,
+            self.init_services,
+            self.init_api_tokens,
+            self.init_tornado_settings,
+            self.init_handlers,
+            self.init_tornado_application,
+        ]
+        phase_durations = []
+        for init_phase in startup_phases:
+            tic = time.perf_counter()
+            result = init_phase()
+            if inspect.isawaitable(result):
+                await result
+            duration = time.perf_counter() - tic
+            HUB_STARTUP_PHASE_DURATION_SECONDS.labels(phase=init_phase.__name__).observe(
+                duration
+            )
+            phase_durations.append((init_phase.__name__, duration))
+        self.log.info(
+            "Initialized Hub in %.3f seconds: %s",
+            sum(duration for name, duration in phase_durations),
+            ", ".join(
+                "%s=%.3fs" % (name, duration)
+                for name, duration in sorted(
+                    phase_durations, key=itemgetter(1), reverse=True
+                )
+            ),
+        )
 
         # init_spawners can take a while
         init_spawners_timeout = self.init_spawners_timeout
@@ -2431,6 +2952,9 @@ class JupyterHub(Application):
                 # To avoid races with partially-complete start,
                 # ensure that start is complete before running this check.
                 await self._start_future
+                # servers that were still being checked when the proxy's
+                # expected route table was first loaded are ready now
+                self.proxy.load_expected_routes(self.users, self._service_map)
                 await self.proxy.check_routes(self.users, self._service_map)
 
             asyncio.ensure_future(finish_init_spawners())
@@ -2473,6 +2997,13 @@ class JupyterHub(Application):
             except Exception as e:
                 self.log.error("Failed to stop user: %s", e)
 
+        if self.poll_scheduler is not None:
+            self.poll_scheduler.stop()
+
+        # finish database work in progress,
+        # and write any activity that hasn't been flushed yet
+        self.db_executor.shutdown()
+        self.activity_buffer.flush()
         self.db.commit()
 
         if self.pid_file and os.path.exists(self.pid_file):
@@ -2515,6 +3046,18 @@ class JupyterHub(Application):
         with open(self.config_file, mode='w') as f:
             f.write(config_text)
 
+    def check_server_counts(self):
+        """Verify incrementally maintained server counts with a full scan"""
+        active_counts = self.users.check_active_users()
+        RUNNING_SERVERS.set(active_counts['active'])
+
+    def measure_loop_lag(self):
+        """Record how long a callback waits for the event loop"""
+        scheduled = time.perf_counter()
+        IOLoop.current().add_callback(
+            lambda: EVENT_LOOP_LAG_SECONDS.observe(time.perf_counter() - scheduled)
+        )
+
     async def update_last_activity(self):
         """Update User.last_activity timestamps from the proxy"""
         routes = await self.proxy.get_all_routes()
@@ -2545,14 +3088,18 @@ class JupyterHub(Application):
                 # strip timezone info to naive UTC datetime
                 dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
 
-            if user.last_activity:
-                user.last_activity = max(user.last_activity, dt)
-            else:
-                user.last_activity = dt
-            if spawner.last_activity:
-                spawner.last_activity = max(spawner.last_activity, dt)
+            if self.activity_flush_interval:
+                self.activity_buffer.record(user, dt)
+                self.activity_buffer.record(spawner, dt)
             else:
-                spawner.last_activity = dt
+                if user.last_activity:
+                    user.last_activity = max(user.last_activity, dt)
+                else:
+                    user.last_activity = dt
+                if spawner.last_activity:
+                    spawner.last_activity = max(spawner.last_activity, dt)
+                else:
+                    spawner.last_activity = dt
             if (now - user.last_activity).total_seconds() < self.active_user_window:
                 active_users_count += 1
         self.statsd.gauge('users.running', users_count)
@@ -2718,6 +3265,24 @@ class JupyterHub(Application):
             self.last_activity_callback = pc
             pc.start()
 
+        if self.loop_lag_interval:
+            pc = PeriodicCallback(self.measure_loop_lag, 1e3 * self.loop_lag_interval)
+            pc.start()
+
+        if self.server_count_check_interval:
+            pc = PeriodicCallback(
+                self.check_server_counts, 1e3 * self.server_count_check_interval
+            )
+            pc.start()
+
+        if self.activity_flush_interval:
+            pc = PeriodicCallback(
+                partial(self.activity_buffer.flush_async, self.db_executor),
+                1e3 * self.activity_flush_interval,
+            )
+            self.activity_flush_callback = pc
+            pc.start()
+
         self.log.info("JupyterHub is now running at %s", self.proxy.public_url)
         # Use atexit for Windows, it doesn't have signal handling support
         if _mswindows:
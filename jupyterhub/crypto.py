@@ -1,10 +1,15 @@
+import asyncio
 import base64
 import json
+import multiprocessing
 import os
 from binascii import a2b_hex
+from concurrent.futures import ProcessPoolExecutor
 from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 from traitlets import Any
+from traitlets import CaselessStrEnum
 from traitlets import default
 from traitlets import Dict
 from traitlets import Integer
@@ -79,6 +84,38 @@ def _validate_key(key):
     return key
 
 
+# Batches are encrypted by these module-level functions,
+# rather than CryptKeeper methods,
+# so that they can be sent to a process pool with only the keys.
+
+
+@lru_cache(maxsize=4)
+def _fernet_for_keys(keys):
+    """Return a MultiFernet for a tuple of raw keys, cached per process"""
+    return MultiFernet([Fernet(base64.urlsafe_b64encode(key)) for key in keys])
+
+
+def _encrypt_one(keys, data):
+    return _fernet_for_keys(keys).encrypt(json.dumps(data).encode('utf8'))
+
+
+def _decrypt_one(keys, encrypted):
+    return json.loads(_fernet_for_keys(keys).decrypt(encrypted).decode('utf8'))
+
+
+def _encrypt_items(keys, items):
+    return [_encrypt_one(keys, data) for data in items]
+
+
+def _decrypt_items(keys, items):
+    return [_decrypt_one(keys, encrypted) for encrypted in items]
+
+
+def _rotate_items(keys, items):
+    fernet = _fernet_for_keys(keys)
+    return [fernet.rotate(encrypted) for encrypted in items]
+
+
 class CryptKeeper(SingletonConfigurable):
     """Encapsulate encryption configuration
 
@@ -88,7 +125,33 @@ class CryptKeeper(SingletonConfigurable):
     n_threads = Integer(
         max(os.cpu_count(), 1),
         config=True,
-        help="The number of threads to allocate for encryption",
+        help="""The number of threads to allocate for encryption
+
+        If executor_type is 'process', this is the number of processes.
+        """,
+    )
+
+    executor_type = CaselessStrEnum(
+        ['thread', 'process'],
+        default_value='thread',
+        config=True,
+        help="""Whether to encrypt in a pool of threads or of processes
+
+        A process pool avoids contention for the GIL with the rest of the Hub
+        when a lot of data is encrypted at once, e.g. in encrypt_many,
+        at the cost of sending each item to another process.
+
+        .. versionadded:: 1.2
+        """,
+    )
+
+    batch_size = Integer(
+        100,
+        config=True,
+        help="""The number of items encrypted per task in encrypt_many and decrypt_many
+
+        .. versionadded:: 1.2
+        """,
     )
 
     @default('config')
@@ -104,6 +167,11 @@ class CryptKeeper(SingletonConfigurable):
     executor = Any()
 
     def _executor_default(self):
+        if self.executor_type == 'process':
+            # don't fork a process that may be running threads
+            return ProcessPoolExecutor(
+                self.n_threads, mp_context=multiprocessing.get_context('spawn')
+            )
         return ThreadPoolExecutor(self.n_threads)
 
     keys = List(config=True)
@@ -150,6 +218,8 @@ class CryptKeeper(SingletonConfigurable):
     def encrypt(self, data):
         """Encrypt an object with cryptography"""
         self.check_available()
+        if self.executor_type == 'process':
+            return self._submit(_encrypt_one, data)
         return maybe_future(self.executor.submit(self._encrypt, data))
 
     def _decrypt(self, encrypted):
@@ -159,8 +229,52 @@ class CryptKeeper(SingletonConfigurable):
     def decrypt(self, encrypted):
         """Decrypt an object with cryptography"""
         self.check_available()
+        if self.executor_type == 'process':
+            return self._submit(_decrypt_one, encrypted)
         return maybe_future(self.executor.submit(self._decrypt, encrypted))
 
+    def _submit(self, f, arg):
+        """Submit f(keys, arg) to the executor, returning an asyncio Future"""
+        return maybe_future(self.executor.submit(f, tuple(self.keys), arg))
+
+    async def _map_batches(self, f, items):
+        """Apply f to items in batches of batch_size, preserving order"""
+        self.check_available()
+        items = list(items)
+        batches = [
+            items[i : i + self.batch_size]
+            for i in range(0, len(items), self.batch_size)
+        ]
+        results = await asyncio.gather(
+            *[self._submit(f, batch) for batch in batches]
+        )
+        return [result for batch in results for result in batch]
+
+    async def encrypt_many(self, items):
+        """Encrypt a list of objects
+
+        Items are encrypted in batches, concurrently.
+        Returns a list of bytes, in the same order as items.
+        """
+        return await self._map_batches(_encrypt_items, items)
+
+    async def decrypt_many(self, items):
+        """Decrypt a list of encrypted objects
+
+        Returns a list of the decrypted objects, in the same order as items.
+        InvalidToken is raised if any item cannot be decrypted.
+        """
+        return await self._map_batches(_decrypt_items, items)
+
+    async def rotate_many(self, items):
+        """Re-encrypt a list of encrypted values with the current key
+
+        Items encrypted with any of the keys are re-encrypted
+        with the first key, without deserializing them.
+        Returns a list of bytes, in the same order as items.
+        """
+        return await self._map_batches(_rotate_items, items)
+
 
 def encrypt(data):
     """encrypt some data with the crypt keeper.
@@ -177,3 +291,19 @@ def decrypt(data):
     Returns a Future whose result will be the decrypted, deserialized data.
     """
     return CryptKeeper.instance().decrypt(data)
+
+
+def encrypt_many(items):
+    """encrypt a list of objects with the crypt keeper
+
+    Returns a Future whose result will be a list of bytes.
+    """
+    return asyncio.ensure_future(CryptKeeper.instance().encrypt_many(items))
+
+
+def decrypt_many(items):
+    """decrypt a list of encrypted objects with the crypt keeper
+
+    Returns a Future whose result will be a list of decrypted, deserialized data.
+    """
+    return asyncio.ensure_future(CryptKeeper.instance().decrypt_many(items))
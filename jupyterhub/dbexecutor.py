@@ -0,0 +1,91 @@
+"""Run database work off the event loop"""
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from sqlalchemy.exc import SQLAlchemyError
+from tornado.log import app_log
+
+from .metrics import DB_EXECUTOR_DURATION_SECONDS
+from .metrics import DB_EXECUTOR_WAIT_SECONDS
+from .querystats import bind_query_stats
+
+
+class DatabaseExecutor:
+    """Run units of database work on a bounded pool of threads
+
+    A unit of work is a callable that takes a database session as its
+    first argument. Each unit of work gets its own session from
+    `session_factory`, which is closed when the work is done, and rolled back
+    if the work raises. Work that modifies the database must commit.
+
+    Sessions are not shared with the event loop thread,
+    so units of work must not return ORM objects.
+    Return plain data (ids, names, dicts) instead,
+    and look up ORM objects in the Hub's own session if needed.
+
+    With `max_workers=0`, units of work run on the calling thread
+    in the shared session `db`, which is not closed,
+    and only rolled back on database errors.
+    This is required for in-memory sqlite,
+    where all sessions share a single connection.
+    """
+
+    def __init__(self, session_factory, db=None, max_workers=4, log=app_log):
+        self.session_factory = session_factory
+        self.db = db
+        self.max_workers = max_workers
+        self.log = log
+        if max_workers:
+            self._executor = ThreadPoolExecutor(
+                max_workers, thread_name_prefix='jupyterhub-db'
+            )
+        else:
+            self._executor = None
+
+    def _run_in_session(self, work, args, kwargs, submitted):
+        """Run one unit of work in a new session, in a worker thread"""
+        DB_EXECUTOR_WAIT_SECONDS.observe(time.perf_counter() - submitted)
+        tic = time.perf_counter()
+        db = self.session_factory()
+        try:
+            return work(db, *args, **kwargs)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+            DB_EXECUTOR_DURATION_SECONDS.observe(time.perf_counter() - tic)
+
+    async def run(self, work, *args, **kwargs):
+        """Run `work(db, *args, **kwargs)` and return its result
+
+        The event loop is not blocked while the work runs,
+        unless the executor was created with `max_workers=0`.
+        """
+        if self._executor is None:
+            tic = time.perf_counter()
+            try:
+                return work(self.db, *args, **kwargs)
+            except SQLAlchemyError:
+                self.db.rollback()
+                raise
+            finally:
+                DB_EXECUTOR_DURATION_SECONDS.observe(time.perf_counter() - tic)
+        return await asyncio.get_event_loop().run_in_executor(
+            self._executor,
+            bind_query_stats(
+                partial(self._run_in_session, work, args, kwargs, time.perf_counter())
+            ),
+        )
+
+    def shutdown(self, wait=True):
+        """Stop the worker threads
+
+        If `wait`, wait for pending work to finish.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
@@ -44,6 +44,7 @@ from ..metrics import ServerPollStatus
 from ..metrics import ServerSpawnStatus
 from ..metrics import ServerStopStatus
 from ..objects import Server
+from ..querystats import start_query_stats
 from ..spawner import LocalProcessSpawner
 from ..user import User
 from ..utils import get_accepted_mimetype
@@ -66,9 +67,26 @@ reasons = {
 SESSION_COOKIE_NAME = 'jupyterhub-session-id'
 
 
+def _find_token_id(db, orm_class, token):
+    """Find the id of a token, for running with the database executor"""
+    orm_token = orm_class.find(db, token)
+    if orm_token is not None:
+        return orm_token.id
+
+
+def _find_user_id(db, name):
+    """Find the id of a user by name, for running with the database executor"""
+    orm_user = orm.User.find(db, name)
+    if orm_user is not None:
+        return orm_user.id
+
+
 class BaseHandler(RequestHandler):
     """Base Handler class with access to common methods and properties."""
 
+    # database queries made while handling the request
+    query_stats = None
+
     async def prepare(self):
         """Identify the user during the prepare stage of each request
 
@@ -81,6 +99,7 @@ class BaseHandler(RequestHandler):
         The current user (None if not logged in) may be accessed
         via the `self.current_user` property during the handling of any request.
         """
+        self.query_stats = start_query_stats()
         try:
             await self.get_current_user()
         except Exception:
@@ -150,6 +169,14 @@ class BaseHandler(RequestHandler):
     def proxy(self):
         return self.settings['proxy']
 
+    @property
+    def activity_buffer(self):
+        return self.settings.get('activity_buffer', None)
+
+    @property
+    def db_executor(self):
+        return self.settings.get('db_executor', None)
+
     @property
     def statsd(self):
         return self.settings['statsd']
@@ -230,6 +257,39 @@ class BaseHandler(RequestHandler):
     def cookie_max_age_days(self):
         return self.settings.get('cookie_max_age_days', None)
 
+    @property
+    def identity_token_max_age(self):
+        return self.settings.get('identity_token_max_age', 0)
+
+    @property
+    def identity_revocations(self):
+        """{username: time} of the most recent revocation of identity tokens
+
+        Only revocations within the lifetime of identity tokens are kept,
+        since any token issued before then has already expired.
+        """
+        revocations = self.settings.setdefault('identity_revocations', {})
+        cutoff = time.time() - self.identity_token_max_age
+        for name, revoked in list(revocations.items()):
+            if revoked < cutoff:
+                revocations.pop(name)
+        return revocations
+
+    @property
+    def identity_revocations_since(self):
+        """Time from which identity revocations are known
+
+        Revocations are kept in memory, so the Hub cannot know
+        about revocations from before it started.
+        Identity tokens issued before then should not be trusted.
+        """
+        return self.settings.get('identity_revocations_since', 0)
+
+    def revoke_identity_tokens(self, name):
+        """Revoke identity tokens issued for a user until now"""
+        if self.identity_token_max_age:
+            self.identity_revocations[name] = time.time()
+
     @property
     def redirect_to_server(self):
         return self.settings.get('redirect_to_server', True)
@@ -272,26 +332,33 @@ class BaseHandler(RequestHandler):
         If last_activity was more recent than self.activity_resolution seconds ago,
         do nothing to avoid unnecessarily frequent database commits.
 
+        If the activity buffer is enabled, activity is written to the database
+        by the next flush of the buffer, and no commit is needed.
+
         Args:
             obj: an ORM object with a last_activity attribute
             timestamp (datetime, optional): the timestamp of activity to register.
         Returns:
-            recorded (bool): True if activity was recorded, False if not.
+            recorded (bool): True if activity was recorded and needs to be committed,
+                False if not.
         """
         if timestamp is None:
             timestamp = datetime.utcnow()
         resolution = self.settings.get("activity_resolution", 0)
         if not obj.last_activity or resolution == 0:
             self.log.debug("Recording first activity for %s", obj)
-            obj.last_activity = timestamp
-            return True
-        if (timestamp - obj.last_activity).total_seconds() > resolution:
+        elif (timestamp - obj.last_activity).total_seconds() > resolution:
             # this debug line will happen just too often
             # uncomment to debug last_activity updates
             # self.log.debug("Recording activity for %s", obj)
-            obj.last_activity = timestamp
-            return True
-        return False
+            pass
+        else:
+            return False
+        if self.activity_buffer is not None:
+            self.activity_buffer.record(obj, timestamp)
+            return False
+        obj.last_activity = timestamp
+        return True
 
     async def refresh_auth(self, user, force=False):
         """Refresh user authentication info
@@ -358,6 +425,34 @@ class BaseHandler(RequestHandler):
         if token is None:
             return None
         orm_token = orm.APIToken.find(self.db, token)
+        return self._user_for_api_token(orm_token)
+
+    async def _get_current_user_token_async(self):
+        """get_current_user_token, verifying the token with the database executor
+
+        Tokens that have not been verified recently are looked up
+        without blocking the event loop,
+        then loaded in the Hub's session by id.
+        Without database threads, only the hash comparisons of
+        user-provided tokens run off the event loop.
+        """
+        token = self.get_auth_token()
+        if token is None:
+            return None
+        if self.db_executor is None or orm.APIToken.is_verified(token):
+            orm_token = orm.APIToken.find(self.db, token)
+        elif not self.db_executor.max_workers:
+            # queries run on the event loop, but hashing doesn't have to
+            orm_token = await orm.APIToken.find_async(self.db, token)
+        else:
+            token_id = await self.db_executor.run(_find_token_id, orm.APIToken, token)
+            if token_id is None:
+                return None
+            orm_token = self.db.query(orm.APIToken).get(token_id)
+        return self._user_for_api_token(orm_token)
+
+    def _user_for_api_token(self, orm_token):
+        """Return the user or service owning an API token, recording activity"""
         if orm_token is None:
             return None
 
@@ -393,15 +488,14 @@ class BaseHandler(RequestHandler):
                 clear()
             return
         cookie_id = cookie_id.decode('utf8', 'replace')
-        u = self.db.query(orm.User).filter(orm.User.cookie_id == cookie_id).first()
-        user = self._user_from_orm(u)
+        user = self.users.find_by_cookie_id(cookie_id)
         if user is None:
             self.log.warning("Invalid cookie token")
             # have cookie, but it's not valid. Clear it and start over.
             clear()
             return
         # update user activity
-        if self._record_activity(user):
+        if self._record_activity(user.orm_user):
             self.db.commit()
         return user
 
@@ -419,7 +513,7 @@ class BaseHandler(RequestHandler):
         """get current username"""
         if not hasattr(self, '_jupyterhub_user'):
             try:
-                user = self.get_current_user_token()
+                user = await self._get_current_user_token_async()
                 if user is None:
                     user = self.get_current_user_cookie()
                 if user and isinstance(user, User):
@@ -449,6 +543,28 @@ class BaseHandler(RequestHandler):
         orm_user = orm.User.find(db=self.db, name=name)
         return self._user_from_orm(orm_user)
 
+    async def find_user_async(self, name):
+        """Get a user by name, without querying the database on the event loop
+
+        Users in memory are returned directly.
+        Other users are looked up with the database executor,
+        then loaded in the Hub's session by id.
+
+        return None if no such user
+        """
+        if name in self.users:
+            return self.users[name]
+        if self.db_executor is None:
+            return self.find_user(name)
+        user_id = await self.db_executor.run(_find_user_id, name)
+        if user_id is None:
+            return None
+        try:
+            return self.users[user_id]
+        except KeyError:
+            # deleted in the meantime
+            return None
+
     def user_from_username(self, username):
         """Get User for username, creating if it doesn't exist"""
         user = self.find_user(username)
@@ -485,6 +601,7 @@ class BaseHandler(RequestHandler):
                 if count:
                     self.log.debug("Deleted %s access tokens for %s", count, user.name)
                     self.db.commit()
+                    self.revoke_identity_tokens(user.name)
 
         # clear hub cookie
         self.clear_cookie(self.hub.cookie_name, path=self.hub.base_url, **kwargs)
@@ -805,9 +922,8 @@ class BaseHandler(RequestHandler):
             raise RuntimeError("%s pending %s" % (user_server_name, pending))
 
         # count active servers and pending spawns
-        # we could do careful bookkeeping to avoid
-        # but for 10k users this takes ~5ms
-        # and saves us from bookkeeping errors
+        # counts are maintained by Spawner state transitions,
+        # and periodically verified by JupyterHub.check_server_counts
         active_counts = self.users.count_active_users()
         spawn_pending_count = (
             active_counts['spawn_pending'] + active_counts['proxy_pending']
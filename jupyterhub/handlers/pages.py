@@ -19,7 +19,13 @@ from .. import __version__
 from .. import orm
 from ..metrics import SERVER_POLL_DURATION_SECONDS
 from ..metrics import ServerPollStatus
-from ..pagination import Pagination
+from ..pagination import CountCache
+from ..pagination import decode_cursor
+from ..pagination import encode_cursor
+from ..pagination import keyset_filter
+from ..pagination import keyset_order
+from ..pagination import KeysetPagination
+from ..pagination import SortKey
 from ..utils import admin_only
 from ..utils import maybe_future
 from ..utils import url_path_join
@@ -450,13 +456,55 @@ class SpawnPendingHandler(BaseHandler):
         self.redirect(next_url)
 
 
+def _admin_page_user_ids(
+    db, sort_keys, limit, offset=0, after=None, before=None, count=False
+):
+    """Get the ids of users on one page of the admin page
+
+    The page starts after the row whose sort key values are `after`,
+    ends before the row whose sort key values are `before`,
+    or else starts at `offset`.
+
+    Returns (ids, first, last, has_more, total), where
+    first and last are the sort key values of the first and last rows,
+    has_more is whether there are more rows in the direction of paging,
+    and total is the number of users, if `count`.
+
+    for running with the database executor
+    """
+    if before is not None:
+        # page backwards, then put the rows back in order
+        sort_keys = [key.reversed() for key in sort_keys]
+    query = (
+        db.query(orm.User.id, *[key.column for key in sort_keys])
+        .outerjoin(orm.Spawner)
+        .order_by(*keyset_order(sort_keys))
+    )
+    cursor = after if after is not None else before
+    if cursor is not None:
+        query = query.filter(keyset_filter(sort_keys, cursor))
+    else:
+        query = query.offset(offset)
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        rows.reverse()
+    # users with more than one server may appear more than once
+    ids = list(dict.fromkeys(row[0] for row in rows))
+    first = list(rows[0][1:]) if rows else None
+    last = list(rows[-1][1:]) if rows else None
+    total = db.query(orm.User.id).count() if count else None
+    return ids, first, last, has_more, total
+
+
 class AdminHandler(BaseHandler):
     """Render the admin page."""
 
     @web.authenticated
     @admin_only
     async def get(self):
-        page, per_page, offset = Pagination.get_page_args(self)
+        page, per_page, offset = KeysetPagination.get_page_args(self)
 
         available = {'name', 'admin', 'running', 'last_activity'}
         default_sort = ['admin', 'name']
@@ -493,29 +541,73 @@ class AdminHandler(BaseHandler):
         else:
             orders = orders[: len(sorts)]
 
-        # this could be one incomprehensible nested list comprehension
-        # get User columns
-        cols = [mapping[c] for c in sorts]
-        # get User.col.desc() order objects
-        ordered = [getattr(c, o)() for c, o in zip(cols, orders)]
-
-        users = (
-            self.db.query(orm.User)
-            .outerjoin(orm.Spawner)
-            .order_by(*ordered)
-            .limit(per_page)
-            .offset(offset)
+        # paginate by the sort columns, then the ids of users and their servers,
+        # which are unique
+        sort_keys = [
+            SortKey(mapping[c], ascending=o == 'asc', nullable=c != 'name')
+            for c, o in zip(sorts, orders)
+        ]
+        sort_keys.append(SortKey(orm.User.id))
+        sort_keys.append(SortKey(orm.Spawner.id, nullable=True))
+        cursor_sort = ','.join('%s:%s' % (c, o) for c, o in zip(sorts, orders))
+
+        after, before = KeysetPagination.get_cursor_args(self)
+        try:
+            if after:
+                after = decode_cursor(after, cursor_sort, len(sort_keys))
+            if before:
+                before = decode_cursor(before, cursor_sort, len(sort_keys))
+        except ValueError as e:
+            raise web.HTTPError(400, str(e))
+
+        count_cache = self.settings.setdefault('count_cache', CountCache())
+        total = count_cache.get('users')
+        user_ids, first, last, has_more, counted = await self.db_executor.run(
+            _admin_page_user_ids,
+            sort_keys,
+            per_page,
+            offset,
+            after=after or None,
+            before=before or None,
+            count=total is None,
         )
-        users = [self._user_from_orm(u) for u in users]
-        from itertools import chain
+        if total is None:
+            total = counted
+            count_cache.set('users', total)
+        if before and not has_more:
+            # reached the beginning
+            page = 1
+        # load users that aren't in memory with one query,
+        # along with the relationships rendered on the page
+        missing = [user_id for user_id in user_ids if user_id not in self.users]
+        if missing:
+            for orm_user in (
+                self.db.query(orm.User)
+                .filter(orm.User.id.in_(missing))
+                .options(*orm.User.eager_load_options())
+            ):
+                self.users[orm_user]
+        users = []
+        for user_id in user_ids:
+            try:
+                users.append(self.users[user_id])
+            except KeyError:
+                # deleted in the meantime
+                continue
 
         running = []
         for u in users:
             running.extend(s for s in u.spawners.values() if s.active)
 
-        total = self.db.query(orm.User.id).count()
-        pagination = Pagination(
-            url=self.request.uri, total=total, page=page, per_page=per_page,
+        pagination = KeysetPagination(
+            url=self.request.uri,
+            total=total,
+            page=page,
+            per_page=per_page,
+            first_cursor=first and encode_cursor(first, cursor_sort),
+            last_cursor=last and encode_cursor(last, cursor_sort),
+            # paging backwards came from the next page
+            has_more=True if before else has_more,
         )
 
         auth_state = await self.current_user.get_auth_state()
@@ -114,6 +114,28 @@ def _scrub_headers(headers):
     return headers
 
 
+def _check_query_count(handler, query_stats, uri):
+    """Warn about requests that made too many database queries
+
+    Many queries for one request often means a lazy relationship
+    is loaded separately for each item in a list (N+1 queries).
+    """
+    threshold = handler.settings.get('query_count_warning_threshold', 0)
+    if not threshold or query_stats.count <= threshold:
+        return
+    statement, repeated = query_stats.most_repeated()
+    access_log.warning(
+        "%s %s made %i database queries (more than %i)."
+        " Most repeated query (%i times): %s",
+        handler.request.method,
+        uri,
+        query_stats.count,
+        threshold,
+        repeated,
+        ' '.join(statement.split()),
+    )
+
+
 # log_request adapted from IPython (BSD)
 
 
@@ -169,6 +191,11 @@ def log_request(handler):
         location='',
     )
     msg = "{status} {method} {uri}{location} ({user}@{ip}) {request_time:.2f}ms"
+    query_stats = getattr(handler, 'query_stats', None)
+    if query_stats is not None and query_stats.count:
+        ns['queries'] = query_stats.count
+        ns['query_time'] = 1000.0 * query_stats.duration
+        msg += " ({queries} queries, {query_time:.2f}ms)"
     if status >= 500 and status not in {502, 503}:
         log_method(json.dumps(headers, indent=2))
     elif status in {301, 302}:
@@ -179,4 +206,6 @@ def log_request(handler):
         if location:
             ns['location'] = ' -> {}'.format(_scrub_uri(location))
     log_method(msg.format(**ns))
+    if query_stats is not None and query_stats.count:
+        _check_query_count(handler, query_stats, uri)
     prometheus_log_method(handler)
@@ -17,6 +17,7 @@ them manually here.
 """
 from enum import Enum
 
+from prometheus_client import Counter
 from prometheus_client import Gauge
 from prometheus_client import Histogram
 
@@ -26,6 +27,19 @@ REQUEST_DURATION_SECONDS = Histogram(
     ['method', 'handler', 'code'],
 )
 
+REQUEST_DB_QUERIES = Histogram(
+    'request_db_queries',
+    'number of database queries made while handling a request',
+    ['handler'],
+    buckets=[0, 1, 2, 5, 10, 20, 50, 100, 200, 500, float("inf")],
+)
+
+REQUEST_DB_DURATION_SECONDS = Histogram(
+    'request_db_duration_seconds',
+    'time spent in database queries while handling a request',
+    ['handler'],
+)
+
 SERVER_SPAWN_DURATION_SECONDS = Histogram(
     'server_spawn_duration_seconds',
     'time taken for server spawning operation',
@@ -42,13 +56,21 @@ RUNNING_SERVERS = Gauge(
 TOTAL_USERS = Gauge('total_users', 'total number of users')
 
 CHECK_ROUTES_DURATION_SECONDS = Histogram(
-    'check_routes_duration_seconds', 'Time taken to validate all routes in proxy'
+    'check_routes_duration_seconds',
+    'Time taken to validate all routes in proxy',
+    ['phase'],
 )
 
 HUB_STARTUP_DURATION_SECONDS = Histogram(
     'hub_startup_duration_seconds', 'Time taken for Hub to start'
 )
 
+HUB_STARTUP_PHASE_DURATION_SECONDS = Histogram(
+    'hub_startup_phase_duration_seconds',
+    'Time taken for each phase of Hub startup',
+    ['phase'],
+)
+
 INIT_SPAWNERS_DURATION_SECONDS = Histogram(
     'init_spawners_duration_seconds', 'Time taken for spawners to initialize'
 )
@@ -57,6 +79,51 @@ PROXY_POLL_DURATION_SECONDS = Histogram(
     'proxy_poll_duration_seconds', 'duration for polling all routes from proxy'
 )
 
+SPAWNERS_POLLED = Gauge(
+    'spawners_polled', 'the number of servers scheduled for periodic polling'
+)
+
+SPAWNER_POLL_LAG_SECONDS = Histogram(
+    'spawner_poll_lag_seconds',
+    'delay between when a server poll is due and when it is started',
+)
+
+ACTIVITY_BUFFER_SIZE = Gauge(
+    'activity_buffer_size', 'number of activity updates waiting to be written'
+)
+
+ACTIVITY_FLUSH_DURATION_SECONDS = Histogram(
+    'activity_flush_duration_seconds',
+    'duration for writing buffered activity updates to the database',
+)
+
+DB_EXECUTOR_DURATION_SECONDS = Histogram(
+    'db_executor_duration_seconds',
+    'duration of units of database work run by the database executor',
+)
+
+DB_EXECUTOR_WAIT_SECONDS = Histogram(
+    'db_executor_wait_seconds',
+    'delay between submitting database work and a worker thread starting it',
+)
+
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    'event_loop_lag_seconds',
+    'delay between scheduling a callback on the event loop and running it',
+    buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, float("inf")],
+)
+
+PURGE_EXPIRED_ROWS = Counter(
+    'purge_expired_rows',
+    'number of expired tokens and OAuth codes purged from the database',
+    ['table'],
+)
+
+PURGE_EXPIRED_DURATION_SECONDS = Histogram(
+    'purge_expired_duration_seconds',
+    'duration for purging expired tokens and OAuth codes from the database',
+)
+
 
 class ServerSpawnStatus(Enum):
     """
@@ -78,6 +145,23 @@ for s in ServerSpawnStatus:
     SERVER_SPAWN_DURATION_SECONDS.labels(status=s)
 
 
+class CheckRoutesPhase(Enum):
+    """
+    Possible values for 'phase' label of CHECK_ROUTES_DURATION_SECONDS
+    """
+
+    fetch = 'fetch'
+    diff = 'diff'
+    apply = 'apply'
+
+    def __str__(self):
+        return self.value
+
+
+for s in CheckRoutesPhase:
+    CHECK_ROUTES_DURATION_SECONDS.labels(phase=s)
+
+
 PROXY_ADD_DURATION_SECONDS = Histogram(
     'proxy_add_duration_seconds', 'duration for adding user routes to proxy', ['status']
 )
@@ -170,6 +254,41 @@ for s in ProxyDeleteStatus:
     PROXY_DELETE_DURATION_SECONDS.labels(status=s)
 
 
+PROXY_ROUTE_BATCH_SIZE = Histogram(
+    'proxy_route_batch_size',
+    'number of routes in each batch of proxy route updates',
+    ['action'],
+    buckets=[1, 5, 10, 25, 50, 100, 250, 500, 1000, float("inf")],
+)
+
+PROXY_ROUTE_BATCH_DURATION_SECONDS = Histogram(
+    'proxy_route_batch_duration_seconds',
+    'duration for applying a batch of proxy route updates',
+    ['action'],
+)
+
+
+class ProxyRouteAction(Enum):
+    """
+    Possible values for 'action' label of PROXY_ROUTE_BATCH_SIZE
+    and PROXY_ROUTE_BATCH_DURATION_SECONDS
+
+    Route throughput can be computed from the rate of
+    proxy_route_batch_size_sum over proxy_route_batch_duration_seconds_sum
+    """
+
+    add = 'add'
+    delete = 'delete'
+
+    def __str__(self):
+        return self.value
+
+
+for s in ProxyRouteAction:
+    PROXY_ROUTE_BATCH_SIZE.labels(action=s)
+    PROXY_ROUTE_BATCH_DURATION_SECONDS.labels(action=s)
+
+
 def prometheus_log_method(handler):
     """
     Tornado log handler for recording RED metrics.
@@ -186,8 +305,13 @@ def prometheus_log_method(handler):
     that is the 'log_function' tornado setting. This makes it get called
     at the end of every request, allowing us to record the metrics we need.
     """
+    handler_name = '{}.{}'.format(handler.__class__.__module__, type(handler).__name__)
     REQUEST_DURATION_SECONDS.labels(
-        method=handler.request.method,
-        handler='{}.{}'.format(handler.__class__.__module__, type(handler).__name__),
-        code=handler.get_status(),
+        method=handler.request.method, handler=handler_name, code=handler.get_status(),
     ).observe(handler.request.request_time())
+    query_stats = getattr(handler, 'query_stats', None)
+    if query_stats is not None:
+        REQUEST_DB_QUERIES.labels(handler=handler_name).observe(query_stats.count)
+        REQUEST_DB_DURATION_SECONDS.labels(handler=handler_name).observe(
+            query_stats.duration
+        )
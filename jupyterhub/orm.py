@@ -2,9 +2,14 @@
 # Copyright (c) Jupyter Development Team.
 # Distributed under the terms of the Modified BSD License.
 import enum
+import hashlib
 import json
+import re
+import threading
+import time
 from base64 import decodebytes
 from base64 import encodebytes
+from collections import OrderedDict
 from datetime import datetime
 from datetime import timedelta
 
@@ -28,10 +33,13 @@ from sqlalchemy import Unicode
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import backref
 from sqlalchemy.orm import interfaces
+from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import object_session
 from sqlalchemy.orm import relationship
+from sqlalchemy.orm import selectinload
 from sqlalchemy.orm import Session
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.util import identity_key
 from sqlalchemy.pool import StaticPool
 from sqlalchemy.sql.expression import bindparam
 from sqlalchemy.types import LargeBinary
@@ -39,7 +47,9 @@ from sqlalchemy.types import Text
 from sqlalchemy.types import TypeDecorator
 from tornado.log import app_log
 
+from .querystats import current_query_stats
 from .utils import compare_token
+from .utils import compare_token_async
 from .utils import hash_token
 from .utils import new_token
 from .utils import random_port
@@ -118,10 +128,37 @@ user_group_map = Table(
     'user_group_map',
     Base.metadata,
     Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
-    Column('group_id', ForeignKey('groups.id', ondelete='CASCADE'), primary_key=True),
+    # the primary key (user_id, group_id) covers lookups by user,
+    # lookups of the members of a group need their own index
+    Column(
+        'group_id',
+        ForeignKey('groups.id', ondelete='CASCADE'),
+        primary_key=True,
+        index=True,
+    ),
 )
 
 
+# the number of names per IN query in find_many,
+# below sqlite's default limit of 999 bound parameters
+FIND_MANY_CHUNK_SIZE = 500
+
+
+def _find_many(cls, db, names):
+    """Find objects of a class with a name column by name
+
+    Returns a dict of {name: obj} for the names that exist,
+    with one query per FIND_MANY_CHUNK_SIZE names.
+    """
+    names = list(set(names))
+    found = {}
+    for i in range(0, len(names), FIND_MANY_CHUNK_SIZE):
+        chunk = names[i : i + FIND_MANY_CHUNK_SIZE]
+        for obj in db.query(cls).filter(cls.name.in_(chunk)):
+            found[obj.name] = obj
+    return found
+
+
 class Group(Base):
     """User Groups"""
 
@@ -144,6 +181,24 @@ class Group(Base):
         """
         return db.query(cls).filter(cls.name == name).first()
 
+    @classmethod
+    def find_many(cls, db, names):
+        """Find groups by name.
+
+        Returns a dict of {name: group} for the names that exist.
+        """
+        return _find_many(cls, db, names)
+
+    @classmethod
+    def eager_load_options(cls):
+        """Loader options for the relationships of a group model
+
+        Use with `query.options(*Group.eager_load_options())`
+        when loading many groups,
+        to load their members with one query instead of one per group.
+        """
+        return (selectinload(cls.users),)
+
 
 class User(Base):
     """The User table
@@ -182,7 +237,7 @@ class User(Base):
 
     admin = Column(Boolean, default=False)
     created = Column(DateTime, default=datetime.utcnow)
-    last_activity = Column(DateTime, nullable=True)
+    last_activity = Column(DateTime, nullable=True, index=True)
 
     api_tokens = relationship("APIToken", backref="user", cascade="all, delete-orphan")
     oauth_tokens = relationship(
@@ -221,6 +276,28 @@ class User(Base):
         """
         return db.query(cls).filter(cls.name == name).first()
 
+    @classmethod
+    def find_many(cls, db, names):
+        """Find users by name.
+
+        Returns a dict of {name: user} for the names that exist.
+        """
+        return _find_many(cls, db, names)
+
+    @classmethod
+    def eager_load_options(cls):
+        """Loader options for the relationships of a user model
+
+        Use with `query.options(*User.eager_load_options())`
+        when loading many users,
+        to load their spawners, servers, and groups
+        with a fixed number of queries instead of several per user.
+        """
+        return (
+            selectinload(cls._orm_spawners).joinedload(Spawner.server),
+            selectinload(cls.groups),
+        )
+
 
 class Spawner(Base):
     """"State about a Spawner"""
@@ -228,9 +305,11 @@ class Spawner(Base):
     __tablename__ = 'spawners'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'))
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), index=True)
 
-    server_id = Column(Integer, ForeignKey('servers.id', ondelete='SET NULL'))
+    server_id = Column(
+        Integer, ForeignKey('servers.id', ondelete='SET NULL'), index=True
+    )
     server = relationship(
         Server,
         backref=backref('spawner', uselist=False),
@@ -242,7 +321,7 @@ class Spawner(Base):
     name = Column(Unicode(255))
 
     started = Column(DateTime)
-    last_activity = Column(DateTime, nullable=True)
+    last_activity = Column(DateTime, nullable=True, index=True)
     user_options = Column(JSONDict)
 
     # properties on the spawner wrapper
@@ -310,6 +389,14 @@ class Service(Base):
         """
         return db.query(cls).filter(cls.name == name).first()
 
+    @classmethod
+    def find_many(cls, db, names):
+        """Find services by name.
+
+        Returns a dict of {name: service} for the names that exist.
+        """
+        return _find_many(cls, db, names)
+
 
 class Expiring:
     """Mixin for expiring entries
@@ -335,19 +422,127 @@ class Expiring:
         else:
             return None
 
+    # maximum number of rows deleted by one DELETE statement when purging
+    purge_batch_size = 1000
+
     @classmethod
-    def purge_expired(cls, db):
-        """Purge expired API Tokens from the database"""
-        now = cls.now()
-        deleted = False
-        for obj in (
-            db.query(cls).filter(cls.expires_at != None).filter(cls.expires_at < now)
-        ):
-            app_log.debug("Purging expired %s", obj)
-            deleted = True
-            db.delete(obj)
-        if deleted:
+    def delete_expired_batch(cls, db, batch_size=None):
+        """Delete up to `batch_size` expired rows with one DELETE statement
+
+        The rows are deleted directly in the database,
+        without loading them as objects.
+        Objects for the rows that are already in a session
+        must be removed with forget_deleted.
+
+        Returns the list of ids deleted.
+        """
+        ids = [
+            id
+            for (id,) in db.query(cls.id)
+            .filter(cls.expires_at != None)
+            .filter(cls.expires_at < cls.now())
+            .limit(batch_size or cls.purge_batch_size)
+        ]
+        if ids:
+            db.query(cls).filter(cls.id.in_(ids)).delete(synchronize_session=False)
             db.commit()
+        return ids
+
+    @classmethod
+    def forget_deleted(cls, db, ids):
+        """Remove objects for deleted rows from a session
+
+        Relationships of the deleted objects are expired,
+        as when objects are deleted via the session.
+        """
+        for id in ids:
+            obj = db.identity_map.get(identity_key(cls, id))
+            if obj is not None:
+                _notify_deleted_relationships(db, obj)
+                db.expunge(obj)
+            elif issubclass(cls, Hashed):
+                cls._verified_cache.evict_id(id)
+
+    @classmethod
+    def purge_expired(cls, db, batch_size=None):
+        """Purge expired entries from the database
+
+        Entries are deleted `batch_size` at a time.
+        Returns the number of entries deleted.
+        """
+        deleted = 0
+        while True:
+            ids = cls.delete_expired_batch(db, batch_size)
+            cls.forget_deleted(db, ids)
+            deleted += len(ids)
+            if len(ids) < (batch_size or cls.purge_batch_size):
+                break
+        if deleted:
+            app_log.debug("Purged %i expired %ss", deleted, cls.__name__)
+        return deleted
+
+
+class _VerifiedTokenCache:
+    """Bounded LRU cache of recently verified tokens
+
+    Maps the lookup digest of a token to the id and hashed value
+    of the row it was verified against,
+    so that repeated lookups of the same token
+    skip the prefix query and hash comparisons.
+
+    Entries expire after `max_age` seconds (time.monotonic),
+    and the least-recently used entry is evicted
+    once `max_size` entries are stored.
+
+    The cache may be used from database executor threads.
+    """
+
+    def __init__(self, max_size=10000, max_age=300):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self._digests_by_id = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, digest):
+        """Return (id, hashed) for a digest, or None"""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            id, hashed, timestamp = entry
+            if self.max_age and timestamp + self.max_age < time.monotonic():
+                self.evict_id(id)
+                return None
+            self._entries.move_to_end(digest)
+            return id, hashed
+
+    def set(self, digest, id, hashed):
+        """Record a verified token"""
+        if not self.max_size:
+            return
+        with self._lock:
+            self.evict_id(id)
+            self._entries[digest] = (id, hashed, time.monotonic())
+            self._digests_by_id[id] = digest
+            while len(self._entries) > self.max_size:
+                _, (evicted_id, _, _) = self._entries.popitem(last=False)
+                self._digests_by_id.pop(evicted_id, None)
+
+    def evict_id(self, id):
+        """Evict the entry for a given token id, if any"""
+        with self._lock:
+            digest = self._digests_by_id.pop(id, None)
+            if digest is not None:
+                self._entries.pop(digest, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._digests_by_id.clear()
 
 
 class Hashed(Expiring):
@@ -365,6 +560,35 @@ class Hashed(Expiring):
     generated_salt_bytes = 8
     generated_rounds = 1
 
+    # algorithm for the indexed lookup digest of generated tokens
+    # and the keys of the verified-token cache
+    lookup_algorithm = "sha256"
+
+    # size and max age (seconds) of the per-class verified-token cache
+    # set cache_size = 0 to disable caching
+    cache_size = 10000
+    cache_max_age = 300
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # each table gets its own cache, since ids are only unique per table
+        cls._verified_cache = _VerifiedTokenCache(cls.cache_size, cls.cache_max_age)
+
+    @classmethod
+    def lookup_digest_for(cls, token):
+        """Compute the exact-match lookup digest for a token"""
+        return hashlib.new(
+            cls.lookup_algorithm, token.encode('utf8', 'replace')
+        ).hexdigest()
+
+    @classmethod
+    def is_verified(cls, token):
+        """Has a token been verified recently?
+
+        If so, :meth:`find` only needs to load the token by id.
+        """
+        return cls._verified_cache.get(cls.lookup_digest_for(token)) is not None
+
     @property
     def token(self):
         raise AttributeError("token is write-only")
@@ -379,9 +603,13 @@ class Hashed(Expiring):
             # ref: https://security.stackexchange.com/a/151262/155114
             rounds = self.generated_rounds
             salt_bytes = self.generated_salt_bytes
+            # for the same reason, an unsalted digest can be stored
+            # for an exact-match indexed lookup
+            self.lookup_digest = self.lookup_digest_for(token)
         else:
             rounds = self.rounds
             salt_bytes = self.salt_bytes
+            self.lookup_digest = None
         self.hashed = hash_token(
             token, rounds=rounds, salt=salt_bytes, algorithm=self.algorithm
         )
@@ -390,6 +618,11 @@ class Hashed(Expiring):
         """Is this my token?"""
         return compare_token(self.hashed, token)
 
+    @property
+    def is_expired(self):
+        """Has this token expired?"""
+        return self.expires_at is not None and self.expires_at < type(self).now()
+
     @classmethod
     def check_token(cls, db, token):
         """Check if a token is acceptable"""
@@ -429,13 +662,85 @@ class Hashed(Expiring):
 
         Returns None if not found.
 
-        `kind='user'` only returns API tokens for users
-        `kind='service'` only returns API tokens for services
+        Lookups are tried in order of cost:
+
+        1. the in-memory cache of recently verified tokens
+        2. the indexed lookup digest (generated tokens)
+        3. prefix match + hash comparison
+           (user-provided tokens and tokens created before the lookup digest)
+
+        .. versionchanged:: 1.2
+
+            Use the verified-token cache and indexed lookup digest.
         """
-        prefix_match = cls.find_prefix(db, token)
-        for orm_token in prefix_match:
+        digest = cls.lookup_digest_for(token)
+        found, orm_token = cls._find_by_digest(db, digest)
+        if found:
+            return orm_token
+        for orm_token in cls._hashed_candidates(db, token):
             if orm_token.match(token):
-                return orm_token
+                return cls._matched(db, orm_token, digest)
+
+    @classmethod
+    async def find_async(cls, db, token):
+        """Find a token object by value, without hashing on the event loop
+
+        Like :meth:`find`, but hashes of user-provided tokens
+        are compared on a thread pool.
+
+        .. versionadded:: 1.2
+        """
+        digest = cls.lookup_digest_for(token)
+        found, orm_token = cls._find_by_digest(db, digest)
+        if found:
+            return orm_token
+        for orm_token in cls._hashed_candidates(db, token):
+            if await compare_token_async(orm_token.hashed, token):
+                return cls._matched(db, orm_token, digest)
+
+    @classmethod
+    def _find_by_digest(cls, db, digest):
+        """Find a token by the verified-token cache or indexed lookup digest
+
+        Returns (found, orm_token).
+        If found is False, the token must be looked up by hash comparison.
+        """
+        cached = cls._verified_cache.get(digest)
+        if cached is not None:
+            id, hashed = cached
+            orm_token = db.query(cls).get(id)
+            if (
+                orm_token is not None
+                and orm_token.hashed == hashed
+                and not orm_token.is_expired
+            ):
+                return True, orm_token
+            cls._verified_cache.evict_id(id)
+
+        orm_token = db.query(cls).filter(cls.lookup_digest == digest).first()
+        if orm_token is not None:
+            if orm_token.is_expired:
+                return True, None
+            cls._verified_cache.set(digest, orm_token.id, orm_token.hashed)
+            return True, orm_token
+        return False, None
+
+    @classmethod
+    def _hashed_candidates(cls, db, token):
+        """The tokens without a lookup digest that may match by hash"""
+        return cls.find_prefix(db, token).filter(cls.lookup_digest == None).all()
+
+    @classmethod
+    def _matched(cls, db, orm_token, digest):
+        """Record a token found by hash comparison, and return it"""
+        if orm_token.hashed.split(':')[1] == str(cls.generated_rounds):
+            # generated token from before lookup digests,
+            # store it for indexed lookup next time.
+            # Don't commit here: this is a read path,
+            # and the caller's next commit saves it.
+            orm_token.lookup_digest = digest
+        cls._verified_cache.set(digest, orm_token.id, orm_token.hashed)
+        return orm_token
 
 
 class APIToken(Hashed, Base):
@@ -443,14 +748,20 @@ class APIToken(Hashed, Base):
 
     __tablename__ = 'api_tokens'
 
-    user_id = Column(Integer, ForeignKey('users.id', ondelete="CASCADE"), nullable=True)
+    user_id = Column(
+        Integer, ForeignKey('users.id', ondelete="CASCADE"), nullable=True, index=True
+    )
     service_id = Column(
-        Integer, ForeignKey('services.id', ondelete="CASCADE"), nullable=True
+        Integer,
+        ForeignKey('services.id', ondelete="CASCADE"),
+        nullable=True,
+        index=True,
     )
 
     id = Column(Integer, primary_key=True)
     hashed = Column(Unicode(255), unique=True)
     prefix = Column(Unicode(16), index=True)
+    lookup_digest = Column(Unicode(64), index=True, unique=True, nullable=True)
 
     @property
     def api_id(self):
@@ -459,7 +770,7 @@ class APIToken(Hashed, Base):
     # token metadata for bookkeeping
     now = datetime.utcnow  # for expiry
     created = Column(DateTime, default=datetime.utcnow)
-    expires_at = Column(DateTime, default=None, nullable=True)
+    expires_at = Column(DateTime, default=None, nullable=True, index=True)
     last_activity = Column(DateTime)
     note = Column(Unicode(1023))
 
@@ -487,16 +798,16 @@ class APIToken(Hashed, Base):
         `kind='user'` only returns API tokens for users
         `kind='service'` only returns API tokens for services
         """
-        prefix_match = cls.find_prefix(db, token)
-        if kind == 'user':
-            prefix_match = prefix_match.filter(cls.user_id != None)
-        elif kind == 'service':
-            prefix_match = prefix_match.filter(cls.service_id != None)
-        elif kind is not None:
+        if kind not in {'user', 'service', None}:
             raise ValueError("kind must be 'user', 'service', or None, not %r" % kind)
-        for orm_token in prefix_match:
-            if orm_token.match(token):
-                return orm_token
+        orm_token = super().find(db, token)
+        if orm_token is None:
+            return None
+        if kind == 'user' and orm_token.user_id is None:
+            return None
+        if kind == 'service' and orm_token.service_id is None:
+            return None
+        return orm_token
 
     @classmethod
     def new(
@@ -563,14 +874,16 @@ class OAuthAccessToken(Hashed, Base):
         return 'o%i' % self.id
 
     client_id = Column(
-        Unicode(255), ForeignKey('oauth_clients.identifier', ondelete='CASCADE')
+        Unicode(255),
+        ForeignKey('oauth_clients.identifier', ondelete='CASCADE'),
+        index=True,
     )
     grant_type = Column(Enum(GrantType), nullable=False)
-    expires_at = Column(Integer)
+    expires_at = Column(Integer, index=True)
     refresh_token = Column(Unicode(255))
     # TODO: drop refresh_expires_at. Refresh tokens shouldn't expire
     refresh_expires_at = Column(Integer)
-    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'))
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), index=True)
     service = None  # for API-equivalence with APIToken
 
     # the browser session id associated with a given token
@@ -579,6 +892,7 @@ class OAuthAccessToken(Hashed, Base):
     # from Hashed
     hashed = Column(Unicode(255), unique=True)
     prefix = Column(Unicode(16), index=True)
+    lookup_digest = Column(Unicode(64), index=True, unique=True, nullable=True)
 
     created = Column(DateTime, default=datetime.utcnow)
     last_activity = Column(DateTime, nullable=True)
@@ -611,14 +925,16 @@ class OAuthCode(Expiring, Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     client_id = Column(
-        Unicode(255), ForeignKey('oauth_clients.identifier', ondelete='CASCADE')
+        Unicode(255),
+        ForeignKey('oauth_clients.identifier', ondelete='CASCADE'),
+        index=True,
     )
-    code = Column(Unicode(36))
-    expires_at = Column(Integer)
+    code = Column(Unicode(36), index=True)
+    expires_at = Column(Integer, index=True)
     redirect_uri = Column(Unicode(1023))
     session_id = Column(Unicode(255))
     # state = Column(Unicode(1023))
-    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'))
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), index=True)
 
     @staticmethod
     def now():
@@ -662,13 +978,44 @@ class DatabaseSchemaMismatch(Exception):
     """
 
 
-def register_foreign_keys(engine):
-    """register PRAGMA foreign_keys=on on connection"""
+# PRAGMAs for faster commits with sqlite,
+# for use with JupyterHub.sqlite_pragmas.
+# In WAL mode with synchronous=NORMAL, commits don't wait for fsync,
+# and the last commits may be lost on power failure (but not on a crash),
+# without corrupting the database.
+SQLITE_PERFORMANCE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    # negative cache_size is in KiB: 64MB
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    # milliseconds to wait for a lock held by another connection
+    'busy_timeout': 5000,
+}
+
+_pragma_name_pattern = re.compile(r'^[a-z_]+$')
+_pragma_value_pattern = re.compile(r'^-?\w+$')
+
+
+def register_foreign_keys(engine, pragmas=None):
+    """register PRAGMA foreign_keys=on on connection
+
+    Additional PRAGMAs to set on each connection
+    can be given as a dict of `{name: value}`.
+    """
+    pragmas = dict(pragmas or {})
+    for name, value in pragmas.items():
+        if not _pragma_name_pattern.match(name) or not _pragma_value_pattern.match(
+            str(value)
+        ):
+            raise ValueError("Invalid sqlite PRAGMA %s=%r" % (name, value))
 
     @event.listens_for(engine, "connect")
     def connect(dbapi_con, con_record):
         cursor = dbapi_con.cursor()
         cursor.execute("PRAGMA foreign_keys=ON")
+        for name, value in pragmas.items():
+            cursor.execute("PRAGMA %s=%s" % (name, value))
         cursor.close()
 
 
@@ -706,6 +1053,9 @@ def _notify_deleted_relationships(session, obj):
     for prop in mapper.relationships:
         if prop.back_populates:
             _expire_relationship(obj, prop)
+    if isinstance(obj, Hashed):
+        # deleted tokens must not be found via the verified-token cache
+        obj._verified_cache.evict_id(obj.id)
 
 
 def register_ping_connection(engine):
@@ -718,6 +1068,9 @@ def register_ping_connection(engine):
     https://docs.sqlalchemy.org/en/rel_1_1/core/pooling.html#disconnect-handling-pessimistic
     """
 
+    # pings are not queries made by a request
+    ping = select([1]).execution_options(jupyterhub_query_stats=False)
+
     @event.listens_for(engine, "engine_connect")
     def ping_connection(connection, branch):
         if branch:
@@ -734,7 +1087,7 @@ def register_ping_connection(engine):
             # run a SELECT 1.   use a core select() so that
             # the SELECT of a scalar value without a table is
             # appropriately formatted for the backend
-            connection.scalar(select([1]))
+            connection.scalar(ping)
         except exc.DBAPIError as err:
             # catch SQLAlchemy's DBAPIError, which is a wrapper
             # for the DBAPI's exception.  It includes a .connection_invalidated
@@ -749,7 +1102,7 @@ def register_ping_connection(engine):
                 # itself and establish a new connection.  The disconnect detection
                 # here also causes the whole connection pool to be invalidated
                 # so that all stale connections are discarded.
-                connection.scalar(select([1]))
+                connection.scalar(ping)
             else:
                 raise
         finally:
@@ -757,6 +1110,30 @@ def register_ping_connection(engine):
             connection.should_close_with_result = save_should_close_with_result
 
 
+def register_query_stats(engine):
+    """Record queries in the QueryStats of the current request, if any
+
+    Statements with the execution option `jupyterhub_query_stats=False`
+    are not recorded.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        context._jupyterhub_query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = current_query_stats()
+        if stats is not None and context.execution_options.get(
+            'jupyterhub_query_stats', True
+        ):
+            stats.record(
+                statement, time.perf_counter() - context._jupyterhub_query_start
+            )
+
+
 def check_db_revision(engine):
     """Check the JupyterHub database revision
 
@@ -850,9 +1227,17 @@ def add_row_format(base):
 
 
 def new_session_factory(
-    url="sqlite:///:memory:", reset=False, expire_on_commit=False, **kwargs
+    url="sqlite:///:memory:",
+    reset=False,
+    expire_on_commit=False,
+    sqlite_pragmas=None,
+    **kwargs
 ):
-    """Create a new session at url"""
+    """Create a new session at url
+
+    `sqlite_pragmas` is a dict of PRAGMAs to set on each sqlite connection,
+    e.g. SQLITE_PERFORMANCE_PRAGMAS.
+    """
     if url.startswith('sqlite'):
         kwargs.setdefault('connect_args', {'check_same_thread': False})
 
@@ -866,10 +1251,12 @@ def new_session_factory(
 
     engine = create_engine(url, **kwargs)
     if url.startswith('sqlite'):
-        register_foreign_keys(engine)
+        register_foreign_keys(engine, sqlite_pragmas)
 
     # enable pessimistic disconnect handling
     register_ping_connection(engine)
+    # count queries per request
+    register_query_stats(engine)
 
     if reset:
         Base.metadata.drop_all(engine)
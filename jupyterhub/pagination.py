@@ -1,6 +1,20 @@
 """Basic class to manage pagination utils."""
 # Copyright (c) Jupyter Development Team.
 # Distributed under the terms of the Modified BSD License.
+import base64
+import html
+import json
+import time
+from collections import namedtuple
+from datetime import datetime
+from urllib.parse import parse_qsl
+from urllib.parse import urlencode
+from urllib.parse import urlsplit
+
+from sqlalchemy import and_
+from sqlalchemy import false
+from sqlalchemy import literal
+from sqlalchemy import or_
 
 
 class Pagination:
@@ -19,6 +33,7 @@ class Pagination:
         **total**: total records considered while paginating
         """
         self.page = kwargs.get(self._page_name, 1)
+        self.per_page = kwargs.get(self._per_page_name, self._default_per_page)
 
         if self.per_page > self._max_per_page:
             self.per_page = self._max_per_page
@@ -124,13 +139,25 @@ class Pagination:
         else:
             return list(range(1, total_pages))
 
+    def _page_href(self, page):
+        """The href of the link to a page"""
+        return '?page={page}'.format(page=page)
+
+    def _prev_href(self, page):
+        """The href of the link to the previous page"""
+        return self._page_href(page)
+
+    def _next_href(self, page):
+        """The href of the link to the next page"""
+        return self._page_href(page)
+
     @property
     def links(self):
         """Get the links for the pagination.
            Getting the input from calculate_pages_window(), generates the HTML code
            for the pages to render, plus the arrows to go onwards and backwards (if needed).
            """
-        if self.total_pages == 1:
+        if self.total_pages == 1 and not self.has_next:
             return []
 
         pages_to_render = self.calculate_pages_window()
@@ -138,10 +165,10 @@ class Pagination:
         links = ['<nav>']
         links.append('<ul class="pagination">')
 
-        if self.page > 1:
+        if self.has_prev:
             prev_page = self.page - 1
             links.append(
-                '<li><a href="?page={prev_page}">«</a></li>'.format(prev_page=prev_page)
+                '<li><a href="{href}">«</a></li>'.format(href=self._prev_href(prev_page))
             )
         else:
             links.append(
@@ -161,13 +188,15 @@ class Pagination:
                 )
             else:
                 links.append(
-                    '<li><a href="?page={page}">{page}</a></li>'.format(page=page)
+                    '<li><a href="{href}">{page}</a></li>'.format(
+                        href=self._page_href(page), page=page
+                    )
                 )
 
-        if self.page >= 1 and self.page < self.total_pages:
+        if self.has_next:
             next_page = self.page + 1
             links.append(
-                '<li><a href="?page={next_page}">»</a></li>'.format(next_page=next_page)
+                '<li><a href="{href}">»</a></li>'.format(href=self._next_href(next_page))
             )
         else:
             links.append(
@@ -178,3 +207,198 @@ class Pagination:
         links.append('</nav>')
 
         return ''.join(links)
+
+
+class SortKey(namedtuple('SortKey', ['column', 'ascending', 'nullable'])):
+    """One column of a keyset pagination sort
+
+    Sort keys of nullable columns sort NULL before all other values,
+    in either direction, so that pages are the same on every database.
+    """
+
+    def __new__(cls, column, ascending=True, nullable=False):
+        return super().__new__(cls, column, ascending, nullable)
+
+    def reversed(self):
+        """The same key, sorted in the opposite direction"""
+        return self._replace(ascending=not self.ascending)
+
+
+def keyset_order(sort_keys):
+    """Return the order_by clauses for a list of SortKeys"""
+    ordered = []
+    for key in sort_keys:
+        direction = 'asc' if key.ascending else 'desc'
+        if key.nullable:
+            # `column IS NOT NULL` puts NULL first, in the same direction
+            ordered.append(getattr(key.column.isnot(None), direction)())
+        ordered.append(getattr(key.column, direction)())
+    return ordered
+
+
+def keyset_filter(sort_keys, values):
+    """Return the filter for rows after the row whose sort keys are `values`
+
+    The last of `sort_keys` should be unique, e.g. the primary key,
+    so that no two rows have the same sort key.
+    """
+    clause = false()
+    # build (key0 after) OR (key0 equal AND (key1 after OR ...)) inside out
+    for key, value in reversed(list(zip(sort_keys, values))):
+        column = key.column
+        if value is None:
+            # NULL is the smallest value
+            after = column.isnot(None) if key.ascending else false()
+            equal = column.is_(None)
+        else:
+            # bind as a parameter, since SQLAlchemy doesn't compare
+            # columns with the literal True or False by ordering
+            value = literal(value, column.type)
+            if key.ascending:
+                after = column > value
+            elif key.nullable:
+                after = or_(column < value, column.is_(None))
+            else:
+                after = column < value
+            equal = column == value
+        clause = or_(after, and_(equal, clause))
+    return clause
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'datetime': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        value = value['datetime']
+        # isoformat omits microseconds when they are 0
+        fmt = '%Y-%m-%dT%H:%M:%S.%f' if '.' in value else '%Y-%m-%dT%H:%M:%S'
+        return datetime.strptime(value, fmt)
+    return value
+
+
+def encode_cursor(values, sort=''):
+    """Encode the sort key values of a row as an opaque cursor
+
+    `sort` identifies the sort order the values belong to,
+    so that a cursor isn't used with another sort order.
+    """
+    data = json.dumps(
+        {'sort': sort, 'values': [_encode_value(v) for v in values]},
+        separators=(',', ':'),
+    )
+    return base64.urlsafe_b64encode(data.encode('utf8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort='', length=None):
+    """Decode a cursor created by encode_cursor
+
+    Returns the list of sort key values.
+    Raises ValueError if the cursor is invalid,
+    or doesn't belong to `sort` or have `length` values.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        values = [_decode_value(v) for v in data['values']]
+        cursor_sort = data['sort']
+    except Exception:
+        raise ValueError("Invalid cursor: %r" % cursor)
+    if cursor_sort != sort or (length is not None and len(values) != length):
+        raise ValueError("Cursor %r is not for this sort order" % cursor)
+    return values
+
+
+class CountCache:
+    """Cache the results of count queries
+
+    Counting all the rows of a large table is slow,
+    and an exact count isn't needed for rendering page numbers.
+    Counts are recomputed when they are more than `max_age` seconds old.
+    """
+
+    def __init__(self, max_age=60):
+        self.max_age = max_age
+        self._counts = {}
+
+    def get(self, key):
+        """Return the cached count for key, or None if missing or expired"""
+        cached = self._counts.get(key)
+        if cached is None:
+            return None
+        count, timestamp = cached
+        if time.monotonic() - timestamp > self.max_age:
+            return None
+        return count
+
+    def set(self, key, count):
+        """Store the count for key"""
+        self._counts[key] = (count, time.monotonic())
+
+
+class KeysetPagination(Pagination):
+    """Pagination whose previous and next links use keyset cursors
+
+    Numbered page links still use offsets,
+    but paging through results one page at a time
+    never has the database skip over all the previous rows.
+
+    Additional parameters:
+    **first_cursor**: cursor of the first row on the page
+    **last_cursor**: cursor of the last row on the page
+    **has_more**: whether there are rows after this page, if known
+    """
+
+    _after_name = 'after'
+    _before_name = 'before'
+
+    def __init__(self, *args, **kwargs):
+        self.first_cursor = kwargs.get('first_cursor')
+        self.last_cursor = kwargs.get('last_cursor')
+        self.has_more = kwargs.get('has_more')
+        super().__init__(*args, **kwargs)
+
+    def init_values(self):
+        super().init_values()
+        if self.has_more is not None:
+            # the total may be out of date
+            self.has_next = self.has_more
+
+    @classmethod
+    def get_cursor_args(cls, handler):
+        """Get the `after` and `before` cursors of the request
+
+        At most one of them is not None.
+        """
+        after = handler.get_argument(cls._after_name, None)
+        before = None if after else handler.get_argument(cls._before_name, None)
+        return after, before
+
+    def _href(self, **params):
+        """Link to the current url, with the pagination parameters replaced
+
+        Other parameters, such as the sort order, are kept.
+        """
+        query = [
+            (key, value)
+            for key, value in parse_qsl(urlsplit(self.url).query)
+            if key not in {self._page_name, self._after_name, self._before_name}
+        ]
+        query.extend(params.items())
+        return html.escape('?' + urlencode(query))
+
+    def _page_href(self, page):
+        return self._href(page=page)
+
+    def _prev_href(self, page):
+        if self.first_cursor is None:
+            return self._page_href(page)
+        return self._href(page=page, before=self.first_cursor)
+
+    def _next_href(self, page):
+        if self.last_cursor is None:
+            return self._page_href(page)
+        return self._href(page=page, after=self.last_cursor)
@@ -0,0 +1,204 @@
+"""Shared scheduler for polling running single-user servers"""
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from collections import defaultdict
+
+from tornado.log import app_log
+
+from .metrics import SERVER_POLL_DURATION_SECONDS
+from .metrics import ServerPollStatus
+from .metrics import SPAWNER_POLL_LAG_SECONDS
+from .metrics import SPAWNERS_POLLED
+from .spawner import Spawner
+
+
+def _implements_poll_many(spawner_class):
+    """Does a Spawner class override the default poll_many?"""
+    return spawner_class.poll_many.__func__ is not Spawner.poll_many.__func__
+
+
+class PollScheduler:
+    """Poll all running Spawners from a single task
+
+    Each Spawner is polled every `spawner.poll_interval` seconds.
+    The first poll of each Spawner is scheduled at a random point in its interval,
+    so that servers started (or resumed) at the same time
+    are spread evenly across the interval instead of being polled in bursts.
+
+    At most `concurrency` polls are outstanding at once.
+    Servers of Spawner classes that implement :meth:`.Spawner.poll_many`
+    are instead scheduled together,
+    and checked with a single call per interval.
+    """
+
+    def __init__(self, concurrency=100, log=app_log):
+        self.concurrency = concurrency
+        self.log = log
+        # {spawner: [due, seq, spawner]}
+        self._entries = {}
+        self._heap = []
+        # {spawner class: due} for classes that implement poll_many
+        self._batch_due = {}
+        self._counter = itertools.count()
+        self._semaphore = None
+        self._wakeup = None
+        self._task = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, spawner):
+        return spawner in self._entries
+
+    def add(self, spawner):
+        """Start polling a Spawner
+
+        The first poll happens at a random time within one `poll_interval`.
+        """
+        self.remove(spawner)
+        due = time.monotonic() + random.uniform(0, spawner.poll_interval)
+        if self._task is None or self._task.done():
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+        self._schedule(spawner, self._batch_time(spawner, due))
+
+    def remove(self, spawner):
+        """Stop polling a Spawner"""
+        # entries are removed from the heap lazily
+        self._entries.pop(spawner, None)
+        SPAWNERS_POLLED.set(len(self._entries))
+
+    def stop(self):
+        """Stop polling all Spawners"""
+        self._entries.clear()
+        self._heap = []
+        self._batch_due = {}
+        SPAWNERS_POLLED.set(0)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _batch_time(self, spawner, due):
+        """Align the next poll of a Spawner with the next batch of its class
+
+        Only applies to Spawner classes that implement poll_many.
+        Returns the time the Spawner should be polled.
+        """
+        spawner_class = type(spawner)
+        if not _implements_poll_many(spawner_class):
+            return due
+        batch_due = self._batch_due.get(spawner_class)
+        if batch_due is None or batch_due <= time.monotonic():
+            self._batch_due[spawner_class] = batch_due = due
+        return batch_due
+
+    def _schedule(self, spawner, due):
+        entry = [due, next(self._counter), spawner]
+        self._entries[spawner] = entry
+        heapq.heappush(self._heap, entry)
+        SPAWNERS_POLLED.set(len(self._entries))
+        if self._heap[0] is entry and self._wakeup is not None:
+            # wake up the scheduler if this is the next poll due
+            self._wakeup.set()
+
+    def _pop_due(self, now):
+        """Remove and return the entries that are due to be polled"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if self._entries.get(entry[2]) is entry:
+                due.append(entry)
+        return due
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            by_class = defaultdict(list)
+            for entry in self._pop_due(now):
+                SPAWNER_POLL_LAG_SECONDS.observe(now - entry[0])
+                by_class[type(entry[2])].append(entry)
+            for spawner_class, entries in by_class.items():
+                if _implements_poll_many(spawner_class):
+                    asyncio.ensure_future(self._poll_many(spawner_class, entries))
+                else:
+                    for entry in entries:
+                        asyncio.ensure_future(self._poll_one(entry))
+
+            # drop removed entries at the top of the heap
+            while (
+                self._heap and self._entries.get(self._heap[0][2]) is not self._heap[0]
+            ):
+                heapq.heappop(self._heap)
+            timeout = None
+            if self._heap:
+                timeout = max(self._heap[0][0] - time.monotonic(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _reschedule(self, entry):
+        """Schedule the next poll of a Spawner, if it is still being polled"""
+        due, _, spawner = entry
+        if self._entries.get(spawner) is not entry:
+            return
+        # keep the same offset within the interval, unless we are falling behind
+        next_due = max(due + spawner.poll_interval, time.monotonic())
+        self._schedule(spawner, self._batch_time(spawner, next_due))
+
+    async def _poll_one(self, entry):
+        spawner = entry[2]
+        async with self._semaphore:
+            tic = time.perf_counter()
+            try:
+                status = await spawner.poll()
+            except Exception:
+                self.log.exception("Error polling %s", spawner._log_name)
+                self._reschedule(entry)
+                return
+            SERVER_POLL_DURATION_SECONDS.labels(
+                status=ServerPollStatus.from_status(status)
+            ).observe(time.perf_counter() - tic)
+        await self._finish(entry, status)
+
+    async def _poll_many(self, spawner_class, entries):
+        async with self._semaphore:
+            tic = time.perf_counter()
+            try:
+                statuses = await spawner_class.poll_many(
+                    [entry[2] for entry in entries]
+                )
+            except Exception:
+                self.log.exception(
+                    "Error polling %i %s servers", len(entries), spawner_class.__name__
+                )
+                for entry in entries:
+                    self._reschedule(entry)
+                return
+            # record the duration of the batch shared among its servers
+            duration = (time.perf_counter() - tic) / len(entries)
+        for entry, status in zip(entries, statuses):
+            SERVER_POLL_DURATION_SECONDS.labels(
+                status=ServerPollStatus.from_status(status)
+            ).observe(duration)
+        await asyncio.gather(
+            *(self._finish(entry, status) for entry, status in zip(entries, statuses))
+        )
+
+    async def _finish(self, entry, status):
+        """Handle the result of polling a Spawner"""
+        spawner = entry[2]
+        if self._entries.get(spawner) is not entry:
+            # stopped or restarted while we were polling, ignore the result
+            return
+        if status is None:
+            self._reschedule(entry)
+        else:
+            await spawner._notify_poll_status(status)
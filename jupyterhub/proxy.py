@@ -42,7 +42,11 @@ from traitlets.config import LoggingConfigurable
 
 from . import utils
 from .metrics import CHECK_ROUTES_DURATION_SECONDS
+from .metrics import CheckRoutesPhase
 from .metrics import PROXY_POLL_DURATION_SECONDS
+from .metrics import PROXY_ROUTE_BATCH_DURATION_SECONDS
+from .metrics import PROXY_ROUTE_BATCH_SIZE
+from .metrics import ProxyRouteAction
 from .objects import Server
 from .utils import make_ssl_context
 from .utils import url_path_join
@@ -95,6 +99,29 @@ class Proxy(LoggingConfigurable):
     def db(self):
         return self.db_factory()
 
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # the routes the Hub expects the proxy to have,
+        # of the same form as get_all_routes():
+        # {routespec: {'routespec': ..., 'target': ..., 'data': ...}}
+        # updated by add_user, delete_user, add_service, etc.
+        # and used by check_routes to compute changes
+        self.expected_routes = {}
+        self._expected_routes_loaded = False
+
+    route_batch_size = Integer(
+        100,
+        config=True,
+        help="""The number of routes in each batch of add_routes or delete_routes.
+
+        The default implementations of add_routes and delete_routes
+        send each batch of routes with concurrent calls to add_route or delete_route,
+        waiting for each batch to complete before sending the next.
+
+        .. versionadded:: 1.2
+        """,
+    )
+
     app = Any()
     hub = Any()
     public_url = Unicode()
@@ -184,6 +211,60 @@ class Proxy(LoggingConfigurable):
         """
         pass
 
+    async def add_routes(self, routes):
+        """Add a list of routes to the proxy.
+
+        Args:
+            routes (list): list of dicts with keys
+                'routespec', 'target', and 'data',
+                the same as the arguments of :meth:`add_route`.
+
+        The default implementation calls add_route for each route,
+        in batches of :attr:`route_batch_size`.
+        Subclasses may override this to add routes in fewer requests.
+
+        .. versionadded:: 1.2
+        """
+        await self._in_batches(
+            routes,
+            ProxyRouteAction.add,
+            lambda route: self.add_route(
+                route['routespec'], route['target'], dict(route['data'])
+            ),
+        )
+
+    async def delete_routes(self, routespecs):
+        """Delete a list of routes from the proxy.
+
+        Args:
+            routespecs (list): list of routespecs to delete
+
+        The default implementation calls delete_route for each routespec,
+        in batches of :attr:`route_batch_size`.
+        Subclasses may override this to delete routes in fewer requests.
+
+        .. versionadded:: 1.2
+        """
+        await self._in_batches(routespecs, ProxyRouteAction.delete, self.delete_route)
+
+    async def _in_batches(self, items, action, method):
+        """Call an async method for each item, in concurrent batches
+
+        Records batch size and duration metrics for each batch.
+        """
+        items = list(items)
+        batch_size = max(self.route_batch_size, 1)
+        for i in range(0, len(items), batch_size):
+            batch = items[i : i + batch_size]
+            tic = time.perf_counter()
+            await gen.multi([method(item) for item in batch])
+            toc = time.perf_counter()
+            PROXY_ROUTE_BATCH_SIZE.labels(action=action).observe(len(batch))
+            PROXY_ROUTE_BATCH_DURATION_SECONDS.labels(action=action).observe(toc - tic)
+            self.log.debug(
+                "Applied %i route %s operations in %.3fs", len(batch), action, toc - tic
+            )
+
     async def get_all_routes(self):
         """Fetch and return all the routes associated by JupyterHub from the
         proxy.
@@ -243,13 +324,14 @@ class Proxy(LoggingConfigurable):
             service.server.host,
         )
 
-        await self.add_route(
-            service.proxy_spec, service.server.host, {'service': service.name}
-        )
+        data = {'service': service.name}
+        await self.add_route(service.proxy_spec, service.server.host, dict(data))
+        self._expect_route(service.proxy_spec, service.server.host, data)
 
     async def delete_service(self, service, client=None):
         """Remove a service's server from the proxy table."""
         self.log.info("Removing service %s from proxy", service.name)
+        self.expected_routes.pop(service.proxy_spec, None)
         await self.delete_route(service.proxy_spec)
 
     async def add_user(self, user, server_name='', client=None):
@@ -268,11 +350,9 @@ class Proxy(LoggingConfigurable):
                 % (spawner._log_name, spawner.pending)
             )
 
-        await self.add_route(
-            spawner.proxy_spec,
-            spawner.server.host,
-            {'user': user.name, 'server_name': server_name},
-        )
+        data = {'user': user.name, 'server_name': server_name}
+        await self.add_route(spawner.proxy_spec, spawner.server.host, dict(data))
+        self._expect_route(spawner.proxy_spec, spawner.server.host, data)
 
     async def delete_user(self, user, server_name=''):
         """Remove a user's server from the proxy table."""
@@ -280,131 +360,240 @@ class Proxy(LoggingConfigurable):
         if server_name:
             routespec = url_path_join(user.proxy_spec, server_name, '/')
         self.log.info("Removing user %s from proxy (%s)", user.name, routespec)
+        spawner = user.spawners.get(server_name)
+        if spawner is None or not spawner.ready:
+            # a server that is still running keeps its expected route,
+            # so check_routes restores it.
+            # Stopped servers are removed from the table by check_routes.
+            self.expected_routes.pop(routespec, None)
         await self.delete_route(routespec)
 
+    def _expect_route(self, routespec, target, data):
+        """Record a route in the expected route table"""
+        self.expected_routes[routespec] = {
+            'routespec': routespec,
+            'target': target,
+            'data': data,
+        }
+
+    def _user_routes(self, user_dict):
+        """Yield the routes for all ready user servers"""
+        for user in user_dict.values():
+            for name, spawner in user.spawners.items():
+                if spawner.ready:
+                    yield {
+                        'routespec': spawner.proxy_spec,
+                        'target': spawner.server.host,
+                        'data': {'user': user.name, 'server_name': name},
+                    }
+
+    def _service_routes(self, service_dict):
+        """Yield the routes for all services with a server"""
+        for service in service_dict.values():
+            if service.server:
+                yield {
+                    'routespec': service.proxy_spec,
+                    'target': service.server.host,
+                    'data': {'service': service.name},
+                }
+
+    def load_expected_routes(self, user_dict, service_dict):
+        """Rebuild the expected route table from the Hub's state
+
+        This iterates over all users and services,
+        and is only needed once, at startup.
+        After that, the table is kept up to date
+        by add_user, delete_user, add_service, and delete_service.
+        """
+        self.expected_routes = {}
+        self._expect_route(self.app.hub.routespec, self.hub.host, {'hub': True})
+        for route in self._user_routes(user_dict):
+            self.expected_routes[route['routespec']] = route
+        for route in self._service_routes(service_dict):
+            self.expected_routes[route['routespec']] = route
+        self._expected_routes_loaded = True
+
+    def _adopt_route(self, route, user_dict, service_dict):
+        """Check a route that isn't expected against the Hub's state
+
+        Returns True if the route should be kept,
+        False if it is stale and should be deleted.
+
+        Routes of running servers that became ready without being added
+        (e.g. when resuming after a Hub restart) are added to the expected table.
+        Routes of pending servers are kept, but not expected:
+        they may be about to be added or deleted.
+        """
+        data = route['data']
+        routespec = route['routespec']
+        if 'user' in data:
+            name = data['user']
+            server_name = data.get('server_name', '')
+            if name not in user_dict:
+                return False
+            user = user_dict[name]
+            if server_name not in user.spawners:
+                return False
+            spawner = user.spawners[server_name]
+            if spawner.pending:
+                return True
+            if spawner.ready and spawner.proxy_spec == routespec:
+                self._expect_route(routespec, spawner.server.host, data)
+                return True
+        elif 'service' in data:
+            service = service_dict.get(data['service'])
+            if service and service.server and service.proxy_spec == routespec:
+                self._expect_route(routespec, service.server.host, data)
+                return True
+        return False
+
+    def _route_ready(self, route, user_dict, service_dict):
+        """Check that the server of an expected route is still ready
+
+        Only called for expected routes that the proxy doesn't have,
+        so this is O(changed routes), not O(running servers).
+        """
+        data = route['data']
+        routespec = route['routespec']
+        if 'user' in data:
+            name = data['user']
+            if name not in user_dict:
+                return False
+            spawner = user_dict[name].spawners.get(data.get('server_name', ''))
+            return bool(spawner and spawner.ready and spawner.proxy_spec == routespec)
+        elif 'service' in data:
+            service = service_dict.get(data['service'])
+            return bool(service and service.server and service.proxy_spec == routespec)
+        return True
+
     async def add_all_services(self, service_dict):
         """Update the proxy table from the database.
 
         Used when loading up a new proxy.
         """
-        futures = []
-        for service in service_dict.values():
-            if service.server:
-                futures.append(self.add_service(service))
-        # wait after submitting them all
-        await gen.multi(futures)
+        routes = list(self._service_routes(service_dict))
+        await self.add_routes(routes)
+        for route in routes:
+            self.expected_routes[route['routespec']] = route
 
     async def add_all_users(self, user_dict):
         """Update the proxy table from the database.
 
         Used when loading up a new proxy.
         """
-        futures = []
-        for user in user_dict.values():
-            for name, spawner in user.spawners.items():
-                if spawner.ready:
-                    futures.append(self.add_user(user, name))
-        # wait after submitting them all
-        await gen.multi(futures)
+        routes = list(self._user_routes(user_dict))
+        await self.add_routes(routes)
+        for route in routes:
+            self.expected_routes[route['routespec']] = route
 
     @_one_at_a_time
     async def check_routes(self, user_dict, service_dict, routes=None):
-        """Check that all users are properly routed on the proxy."""
-        start = time.perf_counter()  # timer starts here when user is created
+        """Check that all users are properly routed on the proxy.
+
+        Compares the proxy's routes with the expected route table
+        and adds or deletes routes to make them match.
+
+        Expected routes missing from the proxy are checked
+        against the Hub's state before they are added,
+        and routes of servers that have stopped are removed from the table.
+
+        .. versionchanged:: 1.2
+            Only routes that differ from the expected route table
+            are checked against the Hub's state,
+            instead of checking every route.
+        """
+        start = time.perf_counter()
         if not routes:
             self.log.debug("Fetching routes to check")
             routes = await self.get_all_routes()
+        fetched = time.perf_counter()
+        CHECK_ROUTES_DURATION_SECONDS.labels(phase=CheckRoutesPhase.fetch).observe(
+            fetched - start
+        )
         # log info-level that we are starting the route-checking
         # this may help diagnose performance issues,
         # as we are about
         self.log.info("Checking routes")
 
-        user_routes = {path for path, r in routes.items() if 'user' in r['data']}
-        futures = []
-
-        good_routes = {self.app.hub.routespec}
+        if not self._expected_routes_loaded:
+            self.load_expected_routes(user_dict, service_dict)
 
         hub = self.hub
-        if self.app.hub.routespec not in routes:
-            futures.append(self.add_hub_route(hub))
-        else:
-            route = routes[self.app.hub.routespec]
-            if route['target'] != hub.host:
+        hub_route = self.expected_routes.get(self.app.hub.routespec)
+        if hub_route is None or hub_route['target'] != hub.host:
+            # the Hub may have moved
+            self._expect_route(self.app.hub.routespec, hub.host, {'hub': True})
+
+        to_add = []
+        stopped = []
+        for routespec, expected in self.expected_routes.items():
+            route = routes.get(routespec)
+            if route is None:
+                if not self._route_ready(expected, user_dict, service_dict):
+                    stopped.append(routespec)
+                    continue
                 self.log.warning(
-                    "Updating default route %s → %s", route['target'], hub.host
+                    "Adding missing route for %s (%s)", routespec, expected['target']
                 )
-                futures.append(self.add_hub_route(hub))
-
-        for user in user_dict.values():
-            for name, spawner in user.spawners.items():
-                if spawner.ready:
-                    spec = spawner.proxy_spec
-                    good_routes.add(spec)
-                    if spec not in user_routes:
-                        self.log.warning(
-                            "Adding missing route for %s (%s)", spec, spawner.server
-                        )
-                        futures.append(self.add_user(user, name))
-                    else:
-                        route = routes[spec]
-                        if route['target'] != spawner.server.host:
-                            self.log.warning(
-                                "Updating route for %s (%s → %s)",
-                                spec,
-                                route['target'],
-                                spawner.server,
-                            )
-                            futures.append(self.add_user(user, name))
-                elif spawner.pending:
-                    # don't consider routes stale if the spawner is in any pending event
-                    # wait until after the pending state clears before taking any actions
-                    # they could be pending deletion from the proxy!
-                    good_routes.add(spawner.proxy_spec)
-
-        # check service routes
-        service_routes = {
-            r['data']['service']: r for r in routes.values() if 'service' in r['data']
-        }
-        for service in service_dict.values():
-            if service.server is None:
-                continue
-            good_routes.add(service.proxy_spec)
-            if service.name not in service_routes:
+                to_add.append(expected)
+            elif route['target'] != expected['target']:
                 self.log.warning(
-                    "Adding missing route for %s (%s)", service.name, service.server
+                    "Updating route for %s (%s → %s)",
+                    routespec,
+                    route['target'],
+                    expected['target'],
                 )
-                futures.append(self.add_service(service))
-            else:
-                route = service_routes[service.name]
-                if route['target'] != service.server.host:
-                    self.log.warning(
-                        "Updating route for %s (%s → %s)",
-                        route['routespec'],
-                        route['target'],
-                        service.server.host,
-                    )
-                    futures.append(self.add_service(service))
-
-        # Now delete the routes that shouldn't be there
-        for routespec in routes:
-            if routespec not in good_routes:
+                to_add.append(expected)
+        for routespec in stopped:
+            self.log.debug("Forgetting route of stopped server %s", routespec)
+            self.expected_routes.pop(routespec)
+
+        to_delete = []
+        for routespec, route in routes.items():
+            if routespec in self.expected_routes:
+                continue
+            if not self._adopt_route(route, user_dict, service_dict):
                 self.log.warning("Deleting stale route %s", routespec)
-                futures.append(self.delete_route(routespec))
+                to_delete.append(routespec)
+                continue
+            expected = self.expected_routes.get(routespec)
+            if expected and route['target'] != expected['target']:
+                self.log.warning(
+                    "Updating route for %s (%s → %s)",
+                    routespec,
+                    route['target'],
+                    expected['target'],
+                )
+                to_add.append(expected)
+        diffed = time.perf_counter()
+        CHECK_ROUTES_DURATION_SECONDS.labels(phase=CheckRoutesPhase.diff).observe(
+            diffed - fetched
+        )
 
-        await gen.multi(futures)
-        stop = time.perf_counter()  # timer stops here when user is deleted
-        CHECK_ROUTES_DURATION_SECONDS.observe(stop - start)  # histogram metric
+        # skip routes that have been added or deleted since the diff
+        to_add = [
+            route for route in to_add if route['routespec'] in self.expected_routes
+        ]
+        to_delete = [
+            routespec
+            for routespec in to_delete
+            if routespec not in self.expected_routes
+        ]
+        await gen.multi([self.add_routes(to_add), self.delete_routes(to_delete)])
+        CHECK_ROUTES_DURATION_SECONDS.labels(phase=CheckRoutesPhase.apply).observe(
+            time.perf_counter() - diffed
+        )
 
-    def add_hub_route(self, hub):
+    async def add_hub_route(self, hub):
         """Add the default route for the Hub"""
         self.log.info("Adding default route for Hub: %s => %s", hub.routespec, hub.host)
-        return self.add_route(hub.routespec, self.hub.host, {'hub': True})
+        await self.add_route(hub.routespec, self.hub.host, {'hub': True})
+        self._expect_route(hub.routespec, self.hub.host, {'hub': True})
 
     async def restore_routes(self):
         self.log.info("Setting up routes on new proxy")
-        await self.add_hub_route(self.app.hub)
-        await self.add_all_users(self.app.users)
-        await self.add_all_services(self.app._service_map)
+        self.load_expected_routes(self.app.users, self.app._service_map)
+        await self.add_routes(list(self.expected_routes.values()))
         self.log.info("New proxy back up and good to go")
 
 
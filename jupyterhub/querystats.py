@@ -0,0 +1,80 @@
+"""Per-request database query statistics"""
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+import threading
+from collections import Counter
+from functools import partial
+
+try:
+    import contextvars
+except ImportError:
+    # Python < 3.7, query statistics are not collected
+    contextvars = None
+
+if contextvars is not None:
+    _current_stats = contextvars.ContextVar('jupyterhub_query_stats', default=None)
+else:
+    _current_stats = None
+
+
+class QueryStats:
+    """Count the database queries made while handling a request
+
+    Queries are counted by statement,
+    so that the same query repeated many times
+    (e.g. loading a lazy relationship for each item in a list)
+    can be identified.
+
+    Queries may be recorded from database executor threads.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+        self.statements = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, statement, duration):
+        """Record one query and the time (in seconds) it took"""
+        with self._lock:
+            self.count += 1
+            self.duration += duration
+            self.statements[statement] += 1
+
+    def most_repeated(self):
+        """Return (statement, count) of the most repeated query, or None"""
+        if not self.statements:
+            return None
+        return self.statements.most_common(1)[0]
+
+
+def start_query_stats():
+    """Start collecting query statistics in the current context
+
+    Queries made by the current task,
+    and tasks started from it, are recorded in the returned QueryStats.
+
+    Returns None if statistics can't be collected (Python < 3.7).
+    """
+    if _current_stats is None:
+        return None
+    stats = QueryStats()
+    _current_stats.set(stats)
+    return stats
+
+
+def current_query_stats():
+    """Return the QueryStats of the current context, if any"""
+    if _current_stats is None:
+        return None
+    return _current_stats.get()
+
+
+def bind_query_stats(fn):
+    """Wrap a function to record its queries in the current QueryStats
+
+    For functions called outside the current context, e.g. in another thread.
+    """
+    if _current_stats is None or _current_stats.get() is None:
+        return fn
+    return partial(contextvars.copy_context().run, fn)
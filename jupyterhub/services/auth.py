@@ -9,6 +9,7 @@ model describing the authenticated user.
 authenticate with the Hub.
 
 """
+import asyncio
 import base64
 import json
 import os
@@ -19,15 +20,20 @@ import string
 import time
 import uuid
 import warnings
+from collections import OrderedDict
 from urllib.parse import quote
 from urllib.parse import urlencode
 
 import requests
 from tornado.gen import coroutine
+from tornado.httpclient import AsyncHTTPClient
+from tornado.httpclient import HTTPClientError
+from tornado.httpclient import HTTPRequest
 from tornado.httputil import url_concat
 from tornado.log import app_log
 from tornado.web import HTTPError
 from tornado.web import RequestHandler
+from traitlets import Bool
 from traitlets import default
 from traitlets import Dict
 from traitlets import Instance
@@ -37,30 +43,68 @@ from traitlets import Unicode
 from traitlets import validate
 from traitlets.config import SingletonConfigurable
 
+from ..utils import identity_key
 from ..utils import url_path_join
+from ..utils import verify_identity
 
 
 class _ExpiringDict(dict):
-    """Dict-like cache for Hub API requests
+    """Dict-like LRU cache for Hub API requests
 
     Values will expire after max_age seconds.
+    None values (negative results, e.g. an unrecognized token)
+    expire after negative_max_age seconds instead, if it is set.
 
     A monotonic timer is used (time.monotonic).
 
     A max_age of 0 means cache forever.
+    A max_size of 0 means no limit on the number of entries.
+    Otherwise, the least-recently used entries are evicted
+    when the cache is full.
+
+    Expired entries are removed when they are accessed,
+    and all at once every sweep_interval seconds while new entries are added.
+
+    Counts of hits, misses, evictions, and coalesced misses
+    are available via :meth:`stats`.
     """
 
     max_age = 0
+    max_size = 0
+    negative_max_age = 0
+    sweep_interval = 60
 
-    def __init__(self, max_age=0):
+    def __init__(self, max_age=0, max_size=0, negative_max_age=0):
         self.max_age = max_age
+        self.max_size = max_size
+        self.negative_max_age = negative_max_age
         self.timestamps = {}
-        self.values = {}
+        # ordered by most recent use, oldest first
+        self.values = OrderedDict()
+        # {key: Future} for values being fetched by get_or_fetch
+        self._in_flight = {}
+        self._last_sweep = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self.values)
 
     def __setitem__(self, key, value):
         """Store key and record timestamp"""
-        self.timestamps[key] = time.monotonic()
+        now = time.monotonic()
+        self.timestamps[key] = now
         self.values[key] = value
+        self.values.move_to_end(key)
+        if now - self._last_sweep >= self.sweep_interval:
+            self.sweep()
+        if self.max_size > 0:
+            while len(self.values) > self.max_size:
+                old_key, _ = self.values.popitem(last=False)
+                self.timestamps.pop(old_key)
+                self.evictions += 1
 
     def __repr__(self):
         """include values and timestamps in repr"""
@@ -74,16 +118,33 @@ class _ExpiringDict(dict):
             }
         )
 
+    def _expired(self, key, now):
+        """Has the value for a key expired?"""
+        max_age = self.max_age
+        if self.values[key] is None and self.negative_max_age > 0:
+            max_age = self.negative_max_age
+        return max_age > 0 and self.timestamps[key] + max_age < now
+
     def _check_age(self, key):
         """Check timestamp for a key"""
         if key not in self.values:
             # not registered, nothing to do
             return
-        now = time.monotonic()
-        timestamp = self.timestamps[key]
-        if self.max_age > 0 and timestamp + self.max_age < now:
+        if self._expired(key, time.monotonic()):
+            self.values.pop(key)
+            self.timestamps.pop(key)
+
+    def sweep(self):
+        """Remove all expired values
+
+        Returns the number of values removed.
+        """
+        now = self._last_sweep = time.monotonic()
+        expired = [key for key in self.values if self._expired(key, now)]
+        for key in expired:
             self.values.pop(key)
             self.timestamps.pop(key)
+        return len(expired)
 
     def __contains__(self, key):
         """dict check for `key in dict`"""
@@ -93,7 +154,14 @@ class _ExpiringDict(dict):
     def __getitem__(self, key):
         """Check age before returning value"""
         self._check_age(key)
-        return self.values[key]
+        try:
+            value = self.values[key]
+        except KeyError:
+            self.misses += 1
+            raise
+        self.values.move_to_end(key)
+        self.hits += 1
+        return value
 
     def get(self, key, default=None):
         """dict-like get:"""
@@ -102,6 +170,47 @@ class _ExpiringDict(dict):
         except KeyError:
             return default
 
+    async def get_or_fetch(self, key, fetch):
+        """Get a cached value, or fetch and cache it if it isn't cached
+
+        Concurrent misses for the same key share a single call to fetch.
+
+        Args:
+            key: the cache key
+            fetch: coroutine function returning the value to cache for key
+        """
+        try:
+            return self[key]
+        except KeyError:
+            pass
+        future = self._in_flight.get(key)
+        if future is None:
+            future = self._in_flight[key] = asyncio.ensure_future(
+                self._fetch(key, fetch)
+            )
+        else:
+            self.coalesced += 1
+        # shield the shared fetch from cancellation of any one caller
+        return await asyncio.shield(future)
+
+    async def _fetch(self, key, fetch):
+        try:
+            value = await fetch()
+            self[key] = value
+            return value
+        finally:
+            self._in_flight.pop(key, None)
+
+    def stats(self):
+        """Return a dict of cache counters, for monitoring"""
+        return {
+            'size': len(self.values),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'coalesced': self.coalesced,
+        }
+
     def clear(self):
         """Clear the cache"""
         self.values.clear()
@@ -280,13 +389,96 @@ class HubAuth(SingletonConfigurable):
         Default: 300 (five minutes)
         """,
     ).tag(config=True)
+    cache_max_size = Integer(
+        10000,
+        help="""The maximum number of the Hub's responses to cache.
+
+        When the cache is full, the least-recently used responses are discarded.
+        0 means no limit.
+
+        .. versionadded:: 1.2
+        """,
+    ).tag(config=True)
+    cache_negative_max_age = Integer(
+        30,
+        help="""The maximum time (in seconds) to cache failed authentication.
+
+        Requests with tokens or cookies the Hub doesn't recognize
+        are cached for this long instead of cache_max_age,
+        so that repeated requests with invalid credentials don't all reach the Hub,
+        while newly issued credentials are recognized quickly.
+        0 means use cache_max_age.
+
+        .. versionadded:: 1.2
+        """,
+    ).tag(config=True)
     cache = Instance(_ExpiringDict, allow_none=False)
 
+    identity_tokens = Bool(
+        True,
+        help="""Use signed identity tokens, if the Hub issues them.
+
+        If the Hub is configured with `JupyterHub.identity_token_max_age`,
+        it signs the user model when it identifies a token.
+        HubOAuth stores the identity token in a cookie,
+        and verifies it locally instead of asking the Hub
+        until it expires or is revoked.
+
+        .. versionadded:: 1.2
+        """,
+    ).tag(config=True)
+
+    identity_revocation_interval = Integer(
+        30,
+        help="""Interval (in seconds) at which to check the Hub for revoked identity tokens.
+
+        Revocations are only checked while verifying an identity token.
+
+        .. versionadded:: 1.2
+        """,
+    ).tag(config=True)
+
+    # {username: time} of identity token revocations, from the Hub
+    _identity_revocations = Dict()
+    # identity tokens issued before the Hub last started are not trusted
+    _identity_revocations_since = 0
+    _identity_revocations_checked = 0
+
     @default('cache')
     def _default_cache(self):
-        return _ExpiringDict(self.cache_max_age)
+        return _ExpiringDict(
+            self.cache_max_age,
+            max_size=self.cache_max_size,
+            negative_max_age=self.cache_negative_max_age,
+        )
+
+    session = Instance(
+        requests.Session,
+        help="""The requests Session used for blocking requests to the Hub API
+
+        Reusing a Session keeps connections to the Hub alive between requests.
+        """,
+    )
 
-    def _check_hub_authorization(self, url, cache_key=None, use_cache=True):
+    @default('session')
+    def _default_session(self):
+        return requests.Session()
+
+    @property
+    def http_client(self):
+        """The shared AsyncHTTPClient used for non-blocking requests to the Hub API
+
+        Uses curl, which keeps connections to the Hub alive, if pycurl is available.
+        """
+        try:
+            from tornado.curl_httpclient import CurlAsyncHTTPClient
+        except ImportError:
+            return AsyncHTTPClient()
+        return CurlAsyncHTTPClient()
+
+    def _check_hub_authorization(
+        self, url, cache_key=None, use_cache=True, *, sync=True
+    ):
         """Identify a user with the Hub
         
         Args:
@@ -294,15 +486,19 @@ class HubAuth(SingletonConfigurable):
                        (e.g. http://127.0.0.1:8081/hub/api/authorizations/token/abc-def)
             cache_key (str): The key for checking the cache
             use_cache (bool): Specify use_cache=False to skip cached cookie values (default: True)
+            sync (bool): Specify sync=False to return an awaitable
+                         that doesn't block while waiting for the Hub (default: True)
 
         Returns:
             user_model (dict): The user model, if a user is identified, None if authentication fails.
 
         Raises an HTTPError if the request failed for a reason other than no such user.
         """
+        if use_cache and cache_key is None:
+            raise ValueError("cache_key is required when using cache")
+        if not sync:
+            return self._check_hub_authorization_async(url, cache_key, use_cache)
         if use_cache:
-            if cache_key is None:
-                raise ValueError("cache_key is required when using cache")
             # check for a cached reply, so we don't check with the Hub if we don't have to
             try:
                 return self.cache[cache_key]
@@ -310,70 +506,170 @@ class HubAuth(SingletonConfigurable):
                 app_log.debug("HubAuth cache miss: %s", cache_key)
 
         data = self._api_request('GET', url, allow_404=True)
+        return self._cache_authorization(data, cache_key, use_cache)
+
+    async def _check_hub_authorization_async(self, url, cache_key, use_cache):
+        """Non-blocking implementation of _check_hub_authorization
+
+        Concurrent cache misses for the same key make a single request to the Hub.
+        """
+
+        async def fetch():
+            data = await self._api_request('GET', url, allow_404=True, sync=False)
+            return self._cache_authorization(data, cache_key, use_cache=False)
+
+        if use_cache:
+            return await self.cache.get_or_fetch(cache_key, fetch)
+        return await fetch()
+
+    def _cache_authorization(self, data, cache_key, use_cache):
+        """Log and cache the Hub's reply to an authorization check"""
         if data is None:
             app_log.warning("No Hub user identified for request")
         else:
+            identity = data.pop('identity', None)
+            if identity and cache_key:
+                self.cache['identity:' + cache_key] = identity
             app_log.debug("Received request from Hub user %s", data)
         if use_cache:
             # cache result
             self.cache[cache_key] = data
         return data
 
-    def _api_request(self, method, url, **kwargs):
-        """Make an API request"""
+    def _api_request(self, method, url, *, sync=True, **kwargs):
+        """Make an API request
+
+        Blocking requests use :attr:`session`.
+        If sync is False, an awaitable is returned instead,
+        and the request is made with :attr:`http_client`.
+        """
         allow_404 = kwargs.pop('allow_404', False)
         headers = kwargs.setdefault('headers', {})
         headers.setdefault('Authorization', 'token %s' % self.api_token)
+        if not sync:
+            return self._api_request_async(method, url, allow_404=allow_404, **kwargs)
         if "cert" not in kwargs and self.certfile and self.keyfile:
             kwargs["cert"] = (self.certfile, self.keyfile)
             if self.client_ca:
                 kwargs["verify"] = self.client_ca
         try:
-            r = requests.request(method, url, **kwargs)
+            r = self.session.request(method, url, **kwargs)
         except requests.ConnectionError as e:
-            app_log.error("Error connecting to %s: %s", self.api_url, e)
-            msg = "Failed to connect to Hub API at %r." % self.api_url
+            self._connection_failed(e)
+        return self._api_response(r.status_code, r.reason, r.text, allow_404)
+
+    async def _api_request_async(
+        self, method, url, allow_404=False, headers=None, data=None
+    ):
+        """Non-blocking implementation of _api_request"""
+        req = HTTPRequest(url, method=method, headers=headers, body=data)
+        if self.certfile and self.keyfile:
+            req.client_cert = self.certfile
+            req.client_key = self.keyfile
+            if self.client_ca:
+                req.ca_certs = self.client_ca
+        try:
+            r = await self.http_client.fetch(req, raise_error=False)
+        except (OSError, HTTPClientError) as e:
+            self._connection_failed(e)
+        return self._api_response(
+            r.code, r.reason, r.body.decode('utf8', 'replace'), allow_404
+        )
+
+    def _check_identity_revocations(self, *, sync=True):
+        """Update revocations of identity tokens from the Hub, if they are out of date"""
+        if not sync:
+            return self._check_identity_revocations_async()
+        if self._identity_revocations_stale():
+            url = url_path_join(self.api_url, 'authorizations/revocations')
+            self._set_identity_revocations(self._api_request('GET', url))
+
+    async def _check_identity_revocations_async(self):
+        """Non-blocking implementation of _check_identity_revocations"""
+        if self._identity_revocations_stale():
+            url = url_path_join(self.api_url, 'authorizations/revocations')
+            self._set_identity_revocations(
+                await self._api_request('GET', url, sync=False)
+            )
+
+    def _identity_revocations_stale(self):
+        return (
+            time.monotonic() - self._identity_revocations_checked
+            >= self.identity_revocation_interval
+        )
+
+    def _set_identity_revocations(self, reply):
+        self._identity_revocations = reply['revoked']
+        self._identity_revocations_since = reply.get('since', 0)
+        self._identity_revocations_checked = time.monotonic()
+
+    def _verify_identity(self, identity):
+        """Verify an identity token signed by the Hub
+
+        Revocations must be checked first with :meth:`_check_identity_revocations`.
+
+        Returns the user model, or None if the token is invalid, expired, or revoked.
+        """
+        payload = verify_identity(identity_key(self.api_token), identity)
+        if payload is None:
+            return None
+        model = payload['model']
+        if payload['iat'] < self._identity_revocations_since:
+            return None
+        revoked = self._identity_revocations.get(model.get('name'))
+        if revoked is not None and payload['iat'] <= revoked:
+            return None
+        return model
+
+    def _connection_failed(self, e):
+        """Raise an informative error when the Hub API can't be reached"""
+        app_log.error("Error connecting to %s: %s", self.api_url, e)
+        msg = "Failed to connect to Hub API at %r." % self.api_url
+        msg += (
+            "  Is the Hub accessible at this URL (from host: %s)?"
+            % socket.gethostname()
+        )
+        if '127.0.0.1' in self.api_url:
             msg += (
-                "  Is the Hub accessible at this URL (from host: %s)?"
-                % socket.gethostname()
+                "  Make sure to set c.JupyterHub.hub_ip to an IP accessible to"
+                + " single-user servers if the servers are not on the same host as the Hub."
             )
-            if '127.0.0.1' in self.api_url:
-                msg += (
-                    "  Make sure to set c.JupyterHub.hub_ip to an IP accessible to"
-                    + " single-user servers if the servers are not on the same host as the Hub."
-                )
-            raise HTTPError(500, msg)
+        raise HTTPError(500, msg)
+
+    def _api_response(self, status_code, reason, text, allow_404=False):
+        """Handle a response from the Hub API
 
+        Returns the parsed JSON body,
+        or None for a 404 if allow_404 is True.
+        """
         data = None
-        if r.status_code == 404 and allow_404:
+        if status_code == 404 and allow_404:
             pass
-        elif r.status_code == 403:
+        elif status_code == 403:
             app_log.error(
                 "I don't have permission to check authorization with JupyterHub, my auth token may have expired: [%i] %s",
-                r.status_code,
-                r.reason,
+                status_code,
+                reason,
             )
-            app_log.error(r.text)
+            app_log.error(text)
             raise HTTPError(
                 500, "Permission failure checking authorization, I may need a new token"
             )
-        elif r.status_code >= 500:
+        elif status_code >= 500:
             app_log.error(
-                "Upstream failure verifying auth token: [%i] %s",
-                r.status_code,
-                r.reason,
+                "Upstream failure verifying auth token: [%i] %s", status_code, reason
             )
-            app_log.error(r.text)
+            app_log.error(text)
             raise HTTPError(502, "Failed to check authorization (upstream problem)")
-        elif r.status_code >= 400:
+        elif status_code >= 400:
             app_log.warning(
-                "Failed to check authorization: [%i] %s", r.status_code, r.reason
+                "Failed to check authorization: [%i] %s", status_code, reason
             )
-            app_log.warning(r.text)
+            app_log.warning(text)
             msg = "Failed to check authorization"
             # pass on error from oauth failure
             try:
-                response = r.json()
+                response = json.loads(text)
                 # prefer more specific 'error_description', fallback to 'error'
                 description = response.get(
                     "error_description", response.get("error", "Unknown error")
@@ -384,16 +680,19 @@ class HubAuth(SingletonConfigurable):
                 msg += ": " + description
             raise HTTPError(500, msg)
         else:
-            data = r.json()
+            data = json.loads(text)
 
         return data
 
-    def user_for_cookie(self, encrypted_cookie, use_cache=True, session_id=''):
+    def user_for_cookie(
+        self, encrypted_cookie, use_cache=True, session_id='', *, sync=True
+    ):
         """Ask the Hub to identify the user for a given cookie.
 
         Args:
             encrypted_cookie (str): the cookie value (not decrypted, the Hub will do that)
             use_cache (bool): Specify use_cache=False to skip cached cookie values (default: True)
+            sync (bool): Specify sync=False to return an awaitable (default: True)
 
         Returns:
             user_model (dict): The user model, if a user is identified, None if authentication fails.
@@ -409,26 +708,30 @@ class HubAuth(SingletonConfigurable):
             ),
             cache_key='cookie:{}:{}'.format(session_id, encrypted_cookie),
             use_cache=use_cache,
+            sync=sync,
         )
 
-    def user_for_token(self, token, use_cache=True, session_id=''):
+    def user_for_token(self, token, use_cache=True, session_id='', *, sync=True):
         """Ask the Hub to identify the user for a given token.
 
         Args:
             token (str): the token
             use_cache (bool): Specify use_cache=False to skip cached cookie values (default: True)
+            sync (bool): Specify sync=False to return an awaitable (default: True)
 
         Returns:
             user_model (dict): The user model, if a user is identified, None if authentication fails.
 
             The 'name' field contains the user's name.
         """
+        url = url_path_join(self.api_url, "authorizations/token", quote(token, safe=''))
+        if self.identity_tokens:
+            url = url_concat(url, {'identity': '1'})
         return self._check_hub_authorization(
-            url=url_path_join(
-                self.api_url, "authorizations/token", quote(token, safe='')
-            ),
+            url=url,
             cache_key='token:{}:{}'.format(session_id, token),
             use_cache=use_cache,
+            sync=sync,
         )
 
     auth_header_name = 'Authorization'
@@ -458,6 +761,15 @@ class HubAuth(SingletonConfigurable):
         if encrypted_cookie:
             return self.user_for_cookie(encrypted_cookie, session_id=session_id)
 
+    async def _get_user_cookie_async(self, handler):
+        """Get the user model from a cookie, without blocking"""
+        encrypted_cookie = handler.get_cookie(self.cookie_name)
+        session_id = self.get_session_id(handler)
+        if encrypted_cookie:
+            return await self.user_for_cookie(
+                encrypted_cookie, session_id=session_id, sync=False
+            )
+
     def get_session_id(self, handler):
         """Get the jupyterhub session id
 
@@ -465,19 +777,22 @@ class HubAuth(SingletonConfigurable):
         """
         return handler.get_cookie('jupyterhub-session-id', '')
 
-    def get_user(self, handler):
+    def get_user(self, handler, *, sync=True):
         """Get the Hub user for a given tornado handler.
 
         Checks cookie with the Hub to identify the current user.
 
         Args:
             handler (tornado.web.RequestHandler): the current request handler
+            sync (bool): Specify sync=False to return an awaitable (default: True)
 
         Returns:
             user_model (dict): The user model, if a user is identified, None if authentication fails.
 
             The 'name' field contains the user's name.
         """
+        if not sync:
+            return self._get_user_async(handler)
 
         # only allow this to be called once per handler
         # avoids issues if an error is raised,
@@ -505,6 +820,33 @@ class HubAuth(SingletonConfigurable):
             app_log.debug("No user identified")
         return user_model
 
+    async def _get_user_async(self, handler):
+        """Non-blocking implementation of get_user"""
+        if hasattr(handler, '_cached_hub_user'):
+            return handler._cached_hub_user
+
+        handler._cached_hub_user = user_model = None
+        session_id = self.get_session_id(handler)
+
+        # check token first
+        token = self.get_token(handler)
+        if token:
+            user_model = await self.user_for_token(
+                token, session_id=session_id, sync=False
+            )
+            if user_model:
+                handler._token_authenticated = True
+
+        # no token, check cookie
+        if user_model is None:
+            user_model = await self._get_user_cookie_async(handler)
+
+        # cache result
+        handler._cached_hub_user = user_model
+        if not user_model:
+            app_log.debug("No user identified")
+        return user_model
+
 
 class HubOAuth(HubAuth):
     """HubAuth using OAuth for login instead of cookies set by the Hub.
@@ -542,17 +884,65 @@ class HubOAuth(HubAuth):
         """
         return self.cookie_name + '-oauth-state'
 
+    @property
+    def identity_cookie_name(self):
+        """The cookie name for storing the Hub's signed identity token"""
+        return self.cookie_name + '-identity'
+
     def _get_user_cookie(self, handler):
         token = handler.get_secure_cookie(self.cookie_name)
         session_id = self.get_session_id(handler)
         if token:
             token = token.decode('ascii', 'replace')
+            identity = self._get_identity_cookie(handler)
+            if identity:
+                self._check_identity_revocations()
+                user_model = self._verify_identity(identity)
+                if user_model is not None:
+                    return user_model
             user_model = self.user_for_token(token, session_id=session_id)
-            if user_model is None:
-                app_log.warning("Token stored in cookie may have expired")
-                handler.clear_cookie(self.cookie_name)
+            self._token_cookie_checked(handler, token, session_id, user_model)
+            return user_model
+
+    async def _get_user_cookie_async(self, handler):
+        token = handler.get_secure_cookie(self.cookie_name)
+        session_id = self.get_session_id(handler)
+        if token:
+            token = token.decode('ascii', 'replace')
+            identity = self._get_identity_cookie(handler)
+            if identity:
+                await self._check_identity_revocations(sync=False)
+                user_model = self._verify_identity(identity)
+                if user_model is not None:
+                    return user_model
+            user_model = await self.user_for_token(
+                token, session_id=session_id, sync=False
+            )
+            self._token_cookie_checked(handler, token, session_id, user_model)
             return user_model
 
+    def _get_identity_cookie(self, handler):
+        if not self.identity_tokens:
+            return None
+        identity = handler.get_secure_cookie(self.identity_cookie_name)
+        if identity:
+            return identity.decode('ascii', 'replace')
+
+    def _token_cookie_checked(self, handler, token, session_id, user_model):
+        """Update cookies after checking the token stored in a cookie with the Hub"""
+        if user_model is None:
+            app_log.warning("Token stored in cookie may have expired")
+            handler.clear_cookie(self.cookie_name)
+            handler.clear_cookie(self.identity_cookie_name)
+            return
+        identity = self.cache.get('identity:token:{}:{}'.format(session_id, token))
+        if identity:
+            # store the identity token from the Hub,
+            # so the next request doesn't need to ask the Hub
+            handler.set_secure_cookie(
+                self.identity_cookie_name, identity, **self._cookie_kwargs(handler)
+            )
+
     # HubOAuth API
 
     oauth_client_id = Unicode(
@@ -602,7 +992,7 @@ class HubOAuth(HubAuth):
     def _token_url(self):
         return url_path_join(self.api_url, 'oauth2/token')
 
-    def token_for_code(self, code):
+    def token_for_code(self, code, *, sync=True):
         """Get token for OAuth temporary code
         
         This is the last step of OAuth login.
@@ -610,6 +1000,7 @@ class HubOAuth(HubAuth):
         
         Args:
             code (str): oauth code for finishing OAuth login
+            sync (bool): Specify sync=False to return an awaitable (default: True)
         Returns:
             token (str): JupyterHub API Token
         """
@@ -627,10 +1018,15 @@ class HubOAuth(HubAuth):
             self.oauth_token_url,
             data=urlencode(params).encode('utf8'),
             headers={'Content-Type': 'application/x-www-form-urlencoded'},
+            sync=sync,
         )
-
+        if not sync:
+            return self._access_token_from(token_reply)
         return token_reply['access_token']
 
+    async def _access_token_from(self, token_reply):
+        return (await token_reply)['access_token']
+
     def _encode_state(self, state):
         """Encode a state dict as url-safe base64"""
         # trim trailing `=` because = is itself not url-safe!
@@ -734,13 +1130,17 @@ class HubOAuth(HubAuth):
         state = self._decode_state(b64_state)
         return state.get('cookie_name') or self.state_cookie_name
 
-    def set_cookie(self, handler, access_token):
-        """Set a cookie recording OAuth result"""
+    def _cookie_kwargs(self, handler):
         kwargs = {'path': self.base_url, 'httponly': True}
         if handler.request.protocol == 'https':
             kwargs['secure'] = True
         # load user cookie overrides
         kwargs.update(self.cookie_options)
+        return kwargs
+
+    def set_cookie(self, handler, access_token):
+        """Set a cookie recording OAuth result"""
+        kwargs = self._cookie_kwargs(handler)
         app_log.debug(
             "Setting oauth cookie for %s: %s, %s",
             handler.request.remote_ip,
@@ -752,6 +1152,7 @@ class HubOAuth(HubAuth):
     def clear_cookie(self, handler):
         """Clear the OAuth cookie"""
         handler.clear_cookie(self.cookie_name, path=self.base_url)
+        handler.clear_cookie(self.identity_cookie_name, path=self.base_url)
 
 
 class UserNotAllowed(Exception):
@@ -791,12 +1192,18 @@ class HubAuthenticated(object):
             def get(self):
                 ...
 
+    Set `async_auth = True` to identify the user in :meth:`prepare`
+    without blocking the event loop while waiting for the Hub.
+    Handlers can also `await self.get_current_user_async()`.
     """
 
     hub_services = None  # set of allowed services
     hub_users = None  # set of allowed users
     hub_groups = None  # set of allowed groups
     allow_admin = False  # allow any admin user access
+    # identify the user without blocking in prepare(),
+    # so get_current_user() doesn't need to wait for the Hub
+    async_auth = False
 
     @property
     def allow_all(self):
@@ -887,6 +1294,13 @@ class HubAuthenticated(object):
             app_log.warning("Not allowing Hub user %s", name)
             raise UserNotAllowed(model)
 
+    async def prepare(self):
+        if self.async_auth:
+            await self.get_current_user_async()
+        r = super().prepare()
+        if r is not None:
+            await r
+
     def get_current_user(self):
         """Tornado's authentication method
 
@@ -896,6 +1310,26 @@ class HubAuthenticated(object):
         if hasattr(self, '_hub_auth_user_cache'):
             return self._hub_auth_user_cache
         user_model = self.hub_auth.get_user(self)
+        return self._check_current_user(user_model)
+
+    async def get_current_user_async(self):
+        """Identify the current user without blocking while waiting for the Hub
+
+        The result is cached for the request,
+        so subsequent calls to :meth:`get_current_user` will not block.
+
+        .. versionadded:: 1.2
+
+        Returns:
+            user_model (dict): The user model, if a user is identified, None if authentication fails.
+        """
+        if hasattr(self, '_hub_auth_user_cache'):
+            return self._hub_auth_user_cache
+        user_model = await self.hub_auth.get_user(self, sync=False)
+        return self._check_current_user(user_model)
+
+    def _check_current_user(self, user_model):
+        """Check and cache the user model identified by the Hub"""
         if not user_model:
             self._hub_auth_user_cache = None
             return
@@ -976,10 +1410,11 @@ class HubOAuthCallbackHandler(HubOAuthenticated, RequestHandler):
             app_log.warning("oauth state %r != %r", arg_state, cookie_state)
             raise HTTPError(403, "oauth state does not match. Try logging in again.")
         next_url = self.hub_auth.get_next_url(cookie_state)
-        # TODO: make async (in a Thread?)
-        token = self.hub_auth.token_for_code(code)
+        token = yield self.hub_auth.token_for_code(code, sync=False)
         session_id = self.hub_auth.get_session_id(self)
-        user_model = self.hub_auth.user_for_token(token, session_id=session_id)
+        user_model = yield self.hub_auth.user_for_token(
+            token, session_id=session_id, sync=False
+        )
         if user_model is None:
             raise HTTPError(500, "oauth callback failed to identify a user")
         app_log.info("Logged-in user %s", user_model)
@@ -67,6 +67,23 @@ def _quote_safe(s):
         return repr(s)
 
 
+def _state_flag(name):
+    """A private pending-state flag on Spawner
+
+    Setting the flag updates the user's server state counts.
+    """
+    attr = '_%s_flag' % name
+
+    def get_flag(self):
+        return self.__dict__.get(attr, False)
+
+    def set_flag(self, value):
+        self.__dict__[attr] = value
+        self._update_state_counts()
+
+    return property(get_flag, set_flag)
+
+
 class Spawner(LoggingConfigurable):
     """Base class for spawning single-user notebook servers.
 
@@ -84,14 +101,44 @@ class Spawner(LoggingConfigurable):
     """
 
     # private attributes for tracking status
-    _spawn_pending = False
+    _spawn_pending = _state_flag('spawn_pending')
     _start_pending = False
-    _stop_pending = False
-    _proxy_pending = False
-    _check_pending = False
+    _stop_pending = _state_flag('stop_pending')
+    _proxy_pending = _state_flag('proxy_pending')
+    _check_pending = _state_flag('check_pending')
     _waiting_for_response = False
     _jupyterhub_version = None
     _spawn_future = None
+    # the state keys this spawner is currently counted under
+    _counted_states = ()
+
+    def _current_states(self):
+        """Return the state keys this spawner should be counted under"""
+        states = []
+        pending = self.pending
+        if pending:
+            states.extend(['pending', pending + '_pending'])
+        if self.active:
+            states.append('active')
+        if self.ready:
+            states.append('ready')
+        return tuple(states)
+
+    def _update_state_counts(self):
+        """Update the user's server state counts after a state transition
+
+        Counts are kept by UserDict, with the same keys as
+        :meth:`UserDict.count_active_users`,
+        so that checking them doesn't require iterating over every server.
+        """
+        counts = getattr(self.user, '_server_counts', None)
+        if counts is None:
+            return
+        states = self._current_states()
+        if states != self._counted_states:
+            counts.subtract(self._counted_states)
+            counts.update(states)
+            self._counted_states = states
 
     @property
     def _log_name(self):
@@ -161,6 +208,7 @@ class Spawner(LoggingConfigurable):
             self._server = Server(orm_server=change.new.server)
         else:
             self._server = None
+        self._update_state_counts()
 
     user = Any()
 
@@ -205,6 +253,7 @@ class Spawner(LoggingConfigurable):
                 self.orm_spawner.server = None
             else:
                 self.orm_spawner.server = server.orm_server
+        self._update_state_counts()
 
     @property
     def name(self):
@@ -306,6 +355,13 @@ class Spawner(LoggingConfigurable):
     _callbacks = List()
     _poll_callback = Any()
 
+    poll_scheduler = Any(
+        help="""The shared PollScheduler used by start_polling, if any.
+
+        If not set, each Spawner polls with its own PeriodicCallback.
+        """
+    )
+
     debug = Bool(False, help="Enable debug-logging of the single-user server").tag(
         config=True
     )
@@ -1127,6 +1183,25 @@ class Spawner(LoggingConfigurable):
             "Override in subclass. Must be a Tornado gen.coroutine."
         )
 
+    @classmethod
+    async def poll_many(cls, spawners):
+        """Check if several single-user servers are running
+
+        Returns a list of statuses, one for each Spawner,
+        with the same meaning as the return value of :meth:`poll`.
+
+        The default implementation calls `poll` on each Spawner.
+        Spawners that can check the status of many servers in one request
+        (e.g. listing all containers or pods)
+        may override this classmethod,
+        in which case periodic polling of all running servers of this class
+        will call `poll_many` once per poll interval batch instead of `poll`
+        for each server.
+
+        .. versionadded:: 1.2
+        """
+        return await asyncio.gather(*(spawner.poll() for spawner in spawners))
+
     def add_poll_callback(self, callback, *args, **kwargs):
         """Add a callback to fire when the single-user server stops"""
         if args or kwargs:
@@ -1136,10 +1211,19 @@ class Spawner(LoggingConfigurable):
 
     def stop_polling(self):
         """Stop polling for single-user server's running state"""
+        if self.poll_scheduler is not None:
+            self.poll_scheduler.remove(self)
         if self._poll_callback:
             self._poll_callback.stop()
             self._poll_callback = None
 
+    @property
+    def _polling(self):
+        """Whether start_polling is active"""
+        if self._poll_callback is not None:
+            return True
+        return self.poll_scheduler is not None and self in self.poll_scheduler
+
     def start_polling(self):
         """Start polling periodically for single-user server's running state.
 
@@ -1154,6 +1238,10 @@ class Spawner(LoggingConfigurable):
 
         self.stop_polling()
 
+        if self.poll_scheduler is not None:
+            self.poll_scheduler.add(self)
+            return
+
         self._poll_callback = PeriodicCallback(
             self.poll_and_notify, 1e3 * self.poll_interval
         )
@@ -1162,6 +1250,10 @@ class Spawner(LoggingConfigurable):
     async def poll_and_notify(self):
         """Used as a callback to periodically poll the process and notify any watchers"""
         status = await self.poll()
+        return await self._notify_poll_status(status)
+
+    async def _notify_poll_status(self, status):
+        """Notify watchers if a poll found that the server has stopped"""
         if status is None:
             # still running, nothing to do here
             return
@@ -1218,6 +1310,23 @@ def _try_setcwd(path):
     os.chdir(td)
 
 
+def _pidfd_open(pid):
+    """Open a pidfd for a process, if supported
+
+    A pidfd becomes readable when the process exits,
+    whether or not it is a child of this process.
+
+    Returns None if pidfds are not supported (Linux < 5.3, Python < 3.9)
+    or the process does not exist.
+    """
+    if not hasattr(os, 'pidfd_open'):
+        return None
+    try:
+        return os.pidfd_open(pid)
+    except OSError:
+        return None
+
+
 def set_user_setuid(username, chdir=True):
     """Return a preexec_fn for spawning a single-user server as a particular user.
 
@@ -1342,6 +1451,11 @@ class LocalProcessSpawner(Spawner):
         """,
     )
 
+    # future resolved when the process exits,
+    # if the process can be watched with a pidfd
+    _exit_future = None
+    _pidfd = None
+
     def make_preexec_fn(self, name):
         """
         Return a function that can be used to set the user id of the spawned process to user with name `name`
@@ -1358,6 +1472,7 @@ class LocalProcessSpawner(Spawner):
         super(LocalProcessSpawner, self).load_state(state)
         if 'pid' in state:
             self.pid = state['pid']
+            self._watch_exit()
 
     def get_state(self):
         """Save state that is needed to restore this spawner instance after a hub restore.
@@ -1373,6 +1488,47 @@ class LocalProcessSpawner(Spawner):
         """Clear stored state about this spawner (pid)"""
         super(LocalProcessSpawner, self).clear_state()
         self.pid = 0
+        self._unwatch_exit()
+
+    def _watch_exit(self):
+        """Watch for the process to exit
+
+        Resolves `_exit_future` as soon as the process exits,
+        so that exit is noticed without waiting for the next poll,
+        and poll does not need to check the process while it is running.
+
+        Where pidfds are not available, the process is only polled.
+        """
+        self._unwatch_exit()
+        if not self.pid:
+            return
+        pidfd = _pidfd_open(self.pid)
+        if pidfd is None:
+            return
+        loop = asyncio.get_event_loop()
+        self._pidfd = pidfd
+        self._exit_future = future = loop.create_future()
+
+        def exited():
+            loop.remove_reader(pidfd)
+            if self._pidfd == pidfd:
+                os.close(pidfd)
+                self._pidfd = None
+            if not future.done():
+                future.set_result(None)
+            if self._polling:
+                # notify watchers now, instead of at the next poll
+                asyncio.ensure_future(self.poll_and_notify())
+
+        loop.add_reader(pidfd, exited)
+
+    def _unwatch_exit(self):
+        """Stop watching for the process to exit"""
+        if self._pidfd is not None:
+            asyncio.get_event_loop().remove_reader(self._pidfd)
+            os.close(self._pidfd)
+            self._pidfd = None
+        self._exit_future = None
 
     def user_env(self, env):
         """Augment environment of spawned process with user specific env variables."""
@@ -1476,6 +1632,7 @@ class LocalProcessSpawner(Spawner):
             raise
 
         self.pid = self.proc.pid
+        self._watch_exit()
 
         if self.__class__ is not LocalProcessSpawner:
             # subclasses may not pass through return value of super().start,
@@ -1495,6 +1652,10 @@ class LocalProcessSpawner(Spawner):
         If the process is still running, we return None. If it is not running,
         we return the exit code of the process if we have access to it, or 0 otherwise.
         """
+        if self._exit_future is not None and not self._exit_future.done():
+            # we are watching the process, and it hasn't exited
+            return None
+
         # if we started the process, poll with Popen
         if self.proc is not None:
             status = self.proc.poll()
@@ -1536,6 +1697,19 @@ class LocalProcessSpawner(Spawner):
             raise  # Can be EPERM or EINVAL
         return True  # process exists
 
+    async def wait_for_death(self, timeout=10):
+        """Wait for the single-user server to die, up to timeout seconds
+
+        Returns as soon as the process exits, if it is being watched.
+        """
+        if self._exit_future is None:
+            return await super().wait_for_death(timeout)
+        try:
+            await asyncio.wait_for(asyncio.shield(self._exit_future), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
     async def stop(self, now=False):
         """Stop the single-user server process for the current user.
 
@@ -0,0 +1,74 @@
+"""Tests for buffered activity updates"""
+from datetime import datetime
+from datetime import timedelta
+
+from .. import orm
+from ..activity import ActivityBuffer
+from ..dbexecutor import DatabaseExecutor
+
+
+def test_activity_buffer(db):
+    user = orm.User(name='active')
+    db.add(user)
+    db.commit()
+    spawner = orm.Spawner(user=user, name='')
+    db.add(spawner)
+    db.commit()
+    buffer = ActivityBuffer(db)
+    now = datetime.utcnow()
+    earlier = now - timedelta(minutes=5)
+
+    assert buffer.record(user, earlier)
+    assert buffer.record(user, now)
+    # activity never moves backward
+    assert not buffer.record(user, earlier)
+    assert buffer.record(spawner, now)
+    assert len(buffer) == 2
+    # visible in memory, but not pending in the session
+    assert user.last_activity == now
+    assert user not in db.dirty
+
+    def stored(orm_class, id):
+        return db.execute(
+            orm_class.__table__.select().where(orm_class.__table__.c.id == id)
+        ).first()['last_activity']
+
+    assert stored(orm.User, user.id) is None
+    assert buffer.flush() == 2
+    assert len(buffer) == 0
+    assert stored(orm.User, user.id) == now
+    assert stored(orm.Spawner, spawner.id) == now
+    assert buffer.flush() == 0
+
+
+def test_activity_buffer_never_rewinds(db):
+    user = orm.User(name='rewind')
+    db.add(user)
+    db.commit()
+    now = datetime.utcnow()
+    buffer = ActivityBuffer(db)
+    buffer.record(user, now - timedelta(minutes=1))
+    # another writer stored a more recent value
+    db.execute(
+        orm.User.__table__.update()
+        .where(orm.User.__table__.c.id == user.id)
+        .values(last_activity=now)
+    )
+    buffer.flush()
+    db.expire(user)
+    assert user.last_activity == now
+
+
+async def test_activity_buffer_flush_async(db):
+    user = orm.User(name='async-active')
+    db.add(user)
+    db.commit()
+    buffer = ActivityBuffer(db)
+    executor = DatabaseExecutor(orm.new_session_factory, db, max_workers=0)
+    now = datetime.utcnow()
+    buffer.record(user, now)
+    assert await buffer.flush_async(executor) == 1
+    assert len(buffer) == 0
+    db.expire(user)
+    assert user.last_activity == now
+    assert await buffer.flush_async(executor) == 0
@@ -18,6 +18,8 @@ from tornado import gen
 
 import jupyterhub
 from .. import orm
+from .. import querystats
+from ..apihandlers.base import APIHandler
 from ..utils import url_path_join as ujoin
 from ..utils import utcnow
 from .mocking import public_host
@@ -183,6 +185,119 @@ async def test_get_users(app):
     assert r.status_code == 403
 
 
+@mark.user
+async def test_get_users_filtered(app):
+    db = app.db
+    names = ['paged-%i' % i for i in range(5)]
+    orm_users = [add_user(db, name=name) for name in names]
+    group = orm.Group(name='paged', users=orm_users)
+    db.add(group)
+    for i, orm_user in enumerate(orm_users):
+        orm_user.last_activity = datetime(2000 if i < 2 else 2010, 1, 1)
+    db.commit()
+
+    async def get_names(query):
+        r = await api_request(app, 'users?group=paged&' + query)
+        r.raise_for_status()
+        return [u['name'] for u in r.json()]
+
+    assert await get_names('') == names
+    assert await get_names('offset=1&limit=2') == names[1:3]
+    assert await get_names('offset=4&limit=2') == names[4:]
+    assert await get_names('state=inactive') == names
+    assert await get_names('state=active') == []
+    assert await get_names('state=ready&limit=1') == []
+    assert await get_names('last_activity_before=2001-01-01') == names[:2]
+    assert await get_names('last_activity_after=2001-01-01T00:00Z') == names[2:]
+
+    r = await api_request(app, 'users?group=paged&fields=name,last_activity')
+    r.raise_for_status()
+    for model in r.json():
+        assert sorted(model) == ['last_activity', 'name']
+
+    r = await api_request(app, 'users?group=paged&limit=1&fields=name,servers')
+    r.raise_for_status()
+    assert r.json() == [{'name': names[0], 'servers': {}}]
+
+    # follow the cursors in Link headers
+    pages = []
+    query = 'group=paged&limit=2'
+    while query:
+        r = await api_request(app, 'users?' + query)
+        r.raise_for_status()
+        pages.append([u['name'] for u in r.json()])
+        link = r.headers.get('Link')
+        query = link and urlparse(link[1 : link.index('>')]).query
+    assert pages == [names[:2], names[2:4], names[4:]]
+
+    for query in (
+        'limit=0',
+        'offset=x',
+        'state=bogus',
+        'fields=name,bogus',
+        'after=bogus',
+    ):
+        r = await api_request(app, 'users?' + query)
+        assert r.status_code == 400
+
+
+@mark.user
+@mark.skipif(querystats.contextvars is None, reason="requires contextvars")
+async def test_get_users_query_count(app):
+    """Listing users takes the same number of queries for any page size"""
+    db = app.db
+    orm_users = [add_user(db, name='counted-%i' % i) for i in range(10)]
+    for orm_user in orm_users:
+        db.add(orm.Spawner(user=orm_user, name=''))
+    db.add(orm.Group(name='counted', users=orm_users))
+    db.commit()
+    log_function = app.tornado_settings['log_function']
+    query_counts = []
+
+    def count_queries(handler):
+        query_counts.append(handler.query_stats.count)
+        log_function(handler)
+
+    with mock.patch.dict(app.tornado_settings, {'log_function': count_queries}):
+        for limit in (2, 10):
+            # relationships are not loaded yet
+            db.expire_all()
+            r = await api_request(app, 'users?group=counted&limit=%i' % limit)
+            r.raise_for_status()
+            assert len(r.json()) == limit
+    assert query_counts[0] == query_counts[1]
+
+
+@mark.user
+async def test_get_users_ndjson(app):
+    db = app.db
+    ndjson = {'Accept': 'application/x-ndjson'}
+    names = ['streamed-%i' % i for i in range(3)]
+    orm_users = [add_user(db, name=name) for name in names]
+    db.add(orm.Group(name='streamed', users=orm_users))
+    db.commit()
+
+    r = await api_request(app, 'users', headers=ndjson)
+    r.raise_for_status()
+    assert r.headers['Content-Type'] == 'application/x-ndjson'
+    streamed = [json.loads(line) for line in r.text.splitlines()]
+    r = await api_request(app, 'users')
+    r.raise_for_status()
+    assert streamed == sorted(r.json(), key=lambda u: find_user(db, u['name']).id)
+
+    with mock.patch.object(APIHandler, 'stream_chunk_size', 2):
+        r = await api_request(
+            app, 'users?group=streamed&offset=1&fields=name', headers=ndjson
+        )
+    r.raise_for_status()
+    assert r.text == ''.join(json.dumps({'name': name}) + '\n' for name in names[1:])
+
+    r = await api_request(app, 'groups', headers=ndjson)
+    r.raise_for_status()
+    groups = [json.loads(line) for line in r.text.splitlines()]
+    assert {'kind': 'group', 'name': 'streamed', 'users': names} in groups
+
+
 @mark.user
 async def test_get_self(app):
     db = app.db
@@ -1491,6 +1606,43 @@ async def test_group_delete_users(app):
     assert sorted([u.name for u in group.users]) == sorted(names[2:])
 
 
+@mark.group
+async def test_group_membership_revokes_identity(app):
+    db = app.db
+    names = ['wolfsbane', 'cannonball']
+    for name in names:
+        find_user(db, name=name) or add_user(db, app=app, name=name)
+    settings = {'identity_token_max_age': 60, 'identity_revocations': {}}
+    with mock.patch.dict(app.tornado_settings, settings):
+        r = await api_request(
+            app, 'groups/newmutants', method='post', data=json.dumps({'users': names})
+        )
+        r.raise_for_status()
+        revocations = app.tornado_settings['identity_revocations']
+        assert sorted(revocations) == sorted(names)
+
+        revocations.clear()
+        r = await api_request(
+            app,
+            'groups/newmutants/users',
+            method='delete',
+            data=json.dumps({'users': names[:1]}),
+        )
+        r.raise_for_status()
+        assert sorted(revocations) == names[:1]
+
+        revocations.clear()
+        r = await api_request(app, 'groups/newmutants', method='delete')
+        r.raise_for_status()
+        assert sorted(revocations) == names[1:]
+
+        r = await api_request(app, 'authorizations/revocations')
+        r.raise_for_status()
+        reply = r.json()
+        assert sorted(reply['revoked']) == names[1:]
+        assert reply['since'] == app.tornado_settings['identity_revocations_since']
+
+
 # -----------------
 # Service API tests
 # -----------------
@@ -1,4 +1,5 @@
 """Test the JupyterHub entry point"""
+import asyncio
 import binascii
 import os
 import re
@@ -19,6 +20,8 @@ from traitlets.config import Config
 from .. import orm
 from ..app import COOKIE_SECRET_BYTES
 from ..app import JupyterHub
+from ..app import RotateAuthStateKey
+from ..crypto import CryptKeeper
 from .mocking import MockHub
 from .test_api import add_user
 
@@ -41,6 +44,79 @@ def test_token_app():
     assert re.match(r'^[a-z0-9]+$', out)
 
 
+def test_rotate_auth_state_key_app():
+    from cryptography.fernet import Fernet
+
+    old_key, new_key = Fernet.generate_key(), Fernet.generate_key()
+    cmd = [sys.executable, '-m', 'jupyterhub', 'rotate-auth-state-key']
+    with TemporaryDirectory() as td:
+        db_url = 'sqlite:///' + os.path.join(td, 'jupyterhub.sqlite')
+        db = orm.new_session_factory(db_url)()
+        for i in range(3):
+            user = orm.User(name='rotate-%i' % i)
+            user.encrypted_auth_state = Fernet(old_key).encrypt(b'{"i": %i}' % i)
+            db.add(user)
+        db.add(orm.User(name='no-auth-state'))
+        db.commit()
+
+        env = dict(os.environ)
+        env['JUPYTERHUB_CRYPT_KEY'] = ';'.join(
+            key.decode('ascii') for key in (new_key, old_key)
+        )
+        out = check_output(
+            cmd + ['--db', db_url, '--batch-size', '2'], cwd=td, env=env
+        ).decode('utf8', 'replace')
+        assert 'for 3 users' in out
+
+        db.expire_all()
+        for user in db.query(orm.User).filter(orm.User.name.startswith('rotate-')):
+            i = int(user.name.split('-')[1])
+            assert Fernet(new_key).decrypt(user.encrypted_auth_state) == b'{"i": %i}' % i
+        db.close()
+
+
+async def test_rotate_auth_state_concurrent_change():
+    from cryptography.fernet import Fernet
+
+    # a private db, so only these users have auth_state to rotate
+    db = orm.new_session_factory('sqlite:///:memory:')()
+    old_key, new_key = Fernet.generate_key(), Fernet.generate_key()
+    users = []
+    for i in range(3):
+        user = orm.User(name='rotate-concurrent-%i' % i)
+        user.encrypted_auth_state = Fernet(old_key).encrypt(b'"before"')
+        db.add(user)
+        users.append(user)
+    db.commit()
+
+    ck = CryptKeeper(keys=[new_key, old_key])
+    rotate_many = ck.rotate_many
+
+    async def save_during_rotation(items):
+        # the Hub saves new auth_state after the batch was read
+        if users[0].encrypted_auth_state in items:
+            db.execute(
+                orm.User.__table__.update()
+                .where(orm.User.id == users[0].id)
+                .values(encrypted_auth_state=Fernet(old_key).encrypt(b'"after"'))
+            )
+            db.commit()
+        return await rotate_many(items)
+
+    rotate_app = RotateAuthStateKey(batch_size=2)
+    with patch.object(ck, 'rotate_many', save_during_rotation):
+        count, changed = await rotate_app.rotate(db, ck)
+    assert count == 3
+    assert changed == []
+    db.expire_all()
+    assert [Fernet(new_key).decrypt(user.encrypted_auth_state) for user in users] == [
+        b'"after"',
+        b'"before"',
+        b'"before"',
+    ]
+    db.close()
+
+
 def test_raise_error_on_missing_specified_config():
     """
     Using the -f or --config flag when starting JupyterHub should require the
@@ -201,6 +277,47 @@ def test_cookie_secret_env(tmpdir, request):
     assert not os.path.exists(hub.cookie_secret_file)
 
 
+async def test_init_users(tmpdir, request):
+    kwargs = {'db_url': str(tmpdir.join('jupyterhub.sqlite'))}
+    ssl_enabled = getattr(request.module, "ssl_enabled", False)
+    if ssl_enabled:
+        kwargs['internal_certs_location'] = str(tmpdir)
+    hub = MockHub(init_users_concurrency=3, **kwargs)
+    hub.init_db()
+    allowed_users = {'allowed-%i' % i for i in range(10)}
+    hub.authenticator.admin_users = {'admin-0', 'allowed-0'}
+    hub.authenticator.allowed_users = allowed_users
+    hub.authenticator.delete_invalid_users = True
+    db = hub.db
+    db.add(orm.User(name='invalid'))
+    db.commit()
+
+    running = 0
+    max_running = 0
+
+    async def add_user(user):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(running, max_running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if user.name == 'invalid':
+            raise KeyError("No such user")
+
+    with patch.object(hub.authenticator, 'add_user', add_user):
+        await hub.init_users()
+    assert max_running == 3
+
+    users = {user.name: user for user in db.query(orm.User)}
+    assert sorted(users) == sorted(allowed_users | {'admin-0'})
+    assert sorted(name for name, user in users.items() if user.admin) == [
+        'admin-0',
+        'allowed-0',
+    ]
+    assert all(user.created and user.cookie_id for user in users.values())
+    assert len({user.cookie_id for user in users.values()}) == len(users)
+
+
 async def test_load_groups(tmpdir, request):
     to_load = {
         'blue': ['cyclops', 'rogue', 'wolverine'],
@@ -222,6 +339,10 @@ async def test_load_groups(tmpdir, request):
     assert gold is not None
     assert sorted([u.name for u in gold.users]) == sorted(to_load['gold'])
 
+    # loading again doesn't duplicate members
+    await hub.init_groups()
+    assert sorted([u.name for u in blue.users]) == sorted(to_load['blue'])
+
 
 async def test_resume_spawners(tmpdir, request):
     if not os.getenv('JUPYTERHUB_TEST_DB_URL'):
@@ -84,3 +84,33 @@ async def test_missing_keys(crypt_keeper):
 
     with pytest.raises(crypto.NoEncryptionKeys):
         await decrypt(b'whatever')
+
+
+@pytest.mark.parametrize("executor_type", ["thread", "process"])
+async def test_many_roundtrip(crypt_keeper, executor_type):
+    ck = crypto.CryptKeeper(
+        keys=crypt_keeper.keys, executor_type=executor_type, batch_size=3
+    )
+    data = [{'key': i} for i in range(10)]
+    try:
+        encrypted = await ck.encrypt_many(data)
+        assert len(encrypted) == len(data)
+        assert await ck.decrypt_many(encrypted) == data
+        assert await ck.decrypt(encrypted[0]) == data[0]
+        assert await ck.decrypt(await ck.encrypt(data[1])) == data[1]
+        assert await ck.encrypt_many([]) == []
+    finally:
+        ck.executor.shutdown()
+
+
+async def test_rotate_many(crypt_keeper):
+    old_key, new_key = crypt_keeper.keys
+    crypt_keeper.keys = [old_key]
+    data = [{'key': i} for i in range(5)]
+    encrypted = await crypto.encrypt_many(data)
+    crypt_keeper.keys = [new_key, old_key]
+    rotated = await crypt_keeper.rotate_many(encrypted)
+    crypt_keeper.keys = [new_key]
+    assert await crypto.decrypt_many(rotated) == data
+    with pytest.raises(crypto.InvalidToken):
+        await crypto.decrypt_many(encrypted)
@@ -0,0 +1,55 @@
+"""Tests for running database work off the event loop"""
+import threading
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from .. import orm
+from ..dbexecutor import DatabaseExecutor
+
+
+@pytest.fixture
+def session_factory(tmpdir):
+    return orm.new_session_factory('sqlite:///%s' % tmpdir.join('jupyterhub.sqlite'))
+
+
+async def test_db_executor_threads(session_factory):
+    db = session_factory()
+    db.add(orm.User(name='threaded'))
+    db.commit()
+    executor = DatabaseExecutor(session_factory, db, max_workers=2)
+    main_thread = threading.current_thread()
+
+    def find_user(session, name):
+        assert threading.current_thread() is not main_thread
+        assert session is not db
+        return orm.User.find(session, name).id
+
+    try:
+        user_id = await executor.run(find_user, 'threaded')
+        assert user_id == orm.User.find(db, 'threaded').id
+
+        def add_duplicate_user(session):
+            session.add(orm.User(name='new'))
+            session.add(orm.User(name='threaded'))
+            session.commit()
+
+        with pytest.raises(IntegrityError):
+            await executor.run(add_duplicate_user)
+        # rolled back, and the Hub's session is unaffected
+        assert orm.User.find(db, 'new') is None
+        assert db.is_active
+    finally:
+        executor.shutdown()
+
+
+async def test_db_executor_inline(db):
+    executor = DatabaseExecutor(orm.new_session_factory, db, max_workers=0)
+    main_thread = threading.current_thread()
+
+    def work(session):
+        assert threading.current_thread() is main_thread
+        return session
+
+    assert await executor.run(work) is db
+    executor.shutdown()
@@ -13,6 +13,7 @@ from tornado import gen
 from .. import crypto
 from .. import objects
 from .. import orm
+from .. import querystats
 from ..emptyclass import EmptyClass
 from ..user import User
 from .mocking import MockSpawner
@@ -74,6 +75,18 @@ def test_user(db):
     assert found is None
 
 
+def test_find_many(db):
+    names = ['find-many-%i' % i for i in range(12)]
+    for name in names[:10]:
+        db.add(orm.User(name=name))
+    db.commit()
+    with mock.patch.object(orm, 'FIND_MANY_CHUNK_SIZE', 5):
+        found = orm.User.find_many(db, names)
+    assert sorted(found) == sorted(names[:10])
+    assert all(found[name].name == name for name in found)
+    assert orm.User.find_many(db, []) == {}
+
+
 def test_user_escaping(db):
     orm_user = orm.User(name='company\\user@company.com,\"quoted\"')
     db.add(orm_user)
@@ -216,6 +229,144 @@ def test_token_find(db):
     assert found is None
 
 
+def test_token_lookup_digest(db):
+    user = orm.User(name='lookup')
+    db.add(user)
+    db.commit()
+    token = user.new_api_token()
+    orm_token = orm.APIToken.find(db, token)
+    assert orm_token.lookup_digest == orm.APIToken.lookup_digest_for(token)
+
+    # user-provided tokens have no lookup digest, found by prefix
+    secret = 'super-secret-lookup-token'
+    user.new_api_token(secret, generated=False)
+    orm_secret = orm.APIToken.find(db, secret)
+    assert orm_secret.lookup_digest is None
+    assert orm_secret.match(secret)
+
+    # generated tokens without a digest get one on first use,
+    # saved by the next commit without committing other pending changes
+    orm_token.lookup_digest = None
+    db.commit()
+    orm.APIToken._verified_cache.clear()
+    db.add(orm.User(name='uncommitted'))
+    assert orm.APIToken.find(db, token) is orm_token
+    assert orm_token.lookup_digest == orm.APIToken.lookup_digest_for(token)
+    db.rollback()
+    assert orm.User.find(db, 'uncommitted') is None
+    orm.APIToken._verified_cache.clear()
+    orm.APIToken.find(db, token)
+    db.commit()
+    db.expire(orm_token)
+    assert orm_token.lookup_digest == orm.APIToken.lookup_digest_for(token)
+
+
+async def test_token_find_async(db):
+    user = orm.User(name='async-find')
+    db.add(user)
+    db.commit()
+    secret = 'super-secret-async-token'
+    user.new_api_token(secret, generated=False)
+    orm.APIToken._verified_cache.clear()
+    orm_token = await orm.APIToken.find_async(db, secret)
+    assert orm_token is orm.APIToken.find(db, secret)
+    assert orm_token.user is user
+    assert await orm.APIToken.find_async(db, secret + 'x') is None
+
+    token = user.new_api_token()
+    assert await orm.APIToken.find_async(db, token) is orm.APIToken.find(db, token)
+
+
+def test_token_verified_cache(db):
+    user = orm.User(name='cached')
+    db.add(user)
+    db.commit()
+    cache = orm.APIToken._verified_cache
+    cache.clear()
+    token = user.new_api_token()
+    orm_token = orm.APIToken.find(db, token)
+    assert len(cache) == 1
+    with mock.patch.object(orm.APIToken, 'match') as match:
+        assert orm.APIToken.find(db, token) is orm_token
+    match.assert_not_called()
+
+    # entries are evicted when the token is deleted
+    db.delete(orm_token)
+    db.commit()
+    assert len(cache) == 0
+    assert orm.APIToken.find(db, token) is None
+
+
+def test_token_verified_cache_bounds():
+    cache = orm._VerifiedTokenCache(max_size=2, max_age=60)
+    cache.set('a', 1, 'hash-a')
+    cache.set('b', 2, 'hash-b')
+    assert cache.get('a') == (1, 'hash-a')
+    cache.set('c', 3, 'hash-c')
+    # 'b' was least recently used
+    assert cache.get('b') is None
+    assert cache.get('a') == (1, 'hash-a')
+    assert len(cache) == 2
+    with mock.patch('time.monotonic', lambda: float('inf')):
+        assert cache.get('a') is None
+    assert len(cache) == 1
+
+
+@pytest.mark.skipif(querystats.contextvars is None, reason="requires contextvars")
+def test_query_stats(db):
+    def count_queries():
+        stats = querystats.start_query_stats()
+        for i in range(3):
+            db.query(orm.User).filter(orm.User.id == i).first()
+        db.query(orm.Group).all()
+        return stats
+
+    stats = querystats.contextvars.copy_context().run(count_queries)
+    assert stats.count == 4
+    assert stats.duration > 0
+    statement, repeated = stats.most_repeated()
+    assert repeated == 3
+    assert 'FROM users' in statement
+    # queries outside the context are not counted
+    db.query(orm.User).first()
+    assert stats.count == 4
+
+
+@pytest.mark.skipif(querystats.contextvars is None, reason="requires contextvars")
+def test_eager_load_query_count():
+    db = orm.new_session_factory('sqlite:///:memory:')()
+    group = orm.Group(name='eager')
+    for i in range(10):
+        user = orm.User(name='eager-%i' % i, groups=[group])
+        db.add(user)
+        db.add(orm.Spawner(user=user, name='', server=orm.Server()))
+    db.commit()
+
+    def count_queries(limit):
+        # start from an empty session, as after a restart
+        db.expunge_all()
+        db.commit()
+
+        def load_page():
+            stats = querystats.start_query_stats()
+            users = (
+                db.query(orm.User)
+                .options(*orm.User.eager_load_options())
+                .order_by(orm.User.id)
+                .limit(limit)
+                .all()
+            )
+            for user in users:
+                [g.name for g in user.groups]
+                [bool(s.server) for s in user._orm_spawners]
+            assert len(users) == limit
+            return stats.count
+
+        return querystats.contextvars.copy_context().run(load_page)
+
+    assert count_queries(2) == count_queries(10)
+
+
 async def test_spawn_fails(db):
     orm_user = orm.User(name='aeofel')
     db.add(orm_user)
@@ -557,3 +708,32 @@ def test_expiring_oauth_code(app, user):
         assert orm_code in db.query(orm.OAuthCode)
         orm.OAuthCode.purge_expired(db)
         assert orm_code not in db.query(orm.OAuthCode)
+
+
+def test_purge_expired_batches(db):
+    now = orm.OAuthCode.now()
+    codes = [orm.OAuthCode(code='batch-%i' % i, expires_at=now - 10) for i in range(25)]
+    codes.append(orm.OAuthCode(code='not-expired', expires_at=now + 60))
+    db.add_all(codes)
+    db.commit()
+    expired = codes[0]
+
+    assert orm.OAuthCode.purge_expired(db, batch_size=10) == 25
+    remaining = db.query(orm.OAuthCode).filter(orm.OAuthCode.code.like('%-%')).all()
+    assert [code.code for code in remaining] == ['not-expired']
+    # deleted objects are removed from the session
+    assert expired not in db
+
+
+def test_sqlite_pragmas(tmpdir):
+    url = 'sqlite:///%s' % tmpdir.join('jupyterhub.sqlite')
+    db = orm.new_session_factory(url, sqlite_pragmas=orm.SQLITE_PERFORMANCE_PRAGMAS)()
+    assert db.execute('PRAGMA journal_mode').scalar().lower() == 'wal'
+    # 1 is NORMAL
+    assert db.execute('PRAGMA synchronous').scalar() == 1
+    assert db.execute('PRAGMA busy_timeout').scalar() == 5000
+    assert db.execute('PRAGMA foreign_keys').scalar() == 1
+    db.close()
+
+    with pytest.raises(ValueError):
+        orm.new_session_factory(url, sqlite_pragmas={'synchronous=OFF; --': 'FULL'})
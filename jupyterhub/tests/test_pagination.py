@@ -0,0 +1,115 @@
+"""Tests for keyset pagination"""
+from datetime import datetime
+from unittest import mock
+
+import pytest
+
+from .. import orm
+from ..pagination import CountCache
+from ..pagination import decode_cursor
+from ..pagination import encode_cursor
+from ..pagination import keyset_filter
+from ..pagination import keyset_order
+from ..pagination import KeysetPagination
+from ..pagination import SortKey
+
+
+def test_cursor_roundtrip():
+    values = [None, True, 'name', 5, datetime(2020, 1, 2, 3, 4, 5)]
+    cursor = encode_cursor(values, 'admin:desc')
+    assert decode_cursor(cursor, 'admin:desc') == values
+    values[-1] = values[-1].replace(microsecond=10)
+    cursor = encode_cursor(values, 'admin:desc')
+    assert decode_cursor(cursor, 'admin:desc', length=len(values)) == values
+
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, 'name:asc')
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, 'admin:desc', length=2)
+    with pytest.raises(ValueError):
+        decode_cursor('not a cursor!', 'admin:desc')
+
+
+@pytest.mark.parametrize(
+    'ascending, nullable', [(True, True), (False, True), (True, False)]
+)
+def test_keyset_pages(db, ascending, nullable):
+    prefix = 'keyset-%s-%s-' % (ascending, nullable)
+    for i in range(10):
+        orm_user = orm.User(name=prefix + str(i))
+        if i % 3:
+            orm_user.last_activity = datetime(2020, 1, 1 + i % 4)
+        db.add(orm_user)
+    db.commit()
+    in_test = orm.User.name.startswith(prefix)
+    column = orm.User.last_activity if nullable else orm.User.name
+    sort_keys = [SortKey(column, ascending, nullable), SortKey(orm.User.id)]
+    query = db.query(orm.User).filter(in_test).order_by(*keyset_order(sort_keys))
+    expected = [u.name for u in query]
+    if nullable:
+        # NULL is smallest, in either direction
+        null_names = [u.name for u in query if u.last_activity is None]
+        if ascending:
+            assert expected[: len(null_names)] == null_names
+        else:
+            assert expected[-len(null_names) :] == null_names
+
+    # page through, three at a time
+    names = []
+    last = None
+    while True:
+        page = query
+        if last is not None:
+            page = page.filter(keyset_filter(sort_keys, last))
+        page = page.limit(3).all()
+        names.extend(u.name for u in page)
+        if len(page) < 3:
+            break
+        last = [getattr(page[-1], key.column.key) for key in sort_keys]
+    assert names == expected
+
+    # and backward, from the end
+    reversed_keys = [key.reversed() for key in sort_keys]
+    first = [getattr(query[-3], key.column.key) for key in sort_keys]
+    before = (
+        db.query(orm.User)
+        .filter(in_test)
+        .filter(keyset_filter(reversed_keys, first))
+        .order_by(*keyset_order(reversed_keys))
+        .limit(3)
+    )
+    assert [u.name for u in before][::-1] == expected[-6:-3]
+
+
+def test_count_cache():
+    cache = CountCache(max_age=10)
+    assert cache.get('users') is None
+    with mock.patch('time.monotonic', return_value=100):
+        cache.set('users', 5)
+    with mock.patch('time.monotonic', return_value=105):
+        assert cache.get('users') == 5
+    with mock.patch('time.monotonic', return_value=111):
+        assert cache.get('users') is None
+
+
+def test_keyset_pagination_links():
+    pagination = KeysetPagination(
+        url='/hub/admin?sort=name&order=asc&page=2&after=x',
+        total=500,
+        page=2,
+        per_page=100,
+        first_cursor='first',
+        last_cursor='last',
+        has_more=True,
+    )
+    links = pagination.links
+    assert 'href="?sort=name&amp;order=asc&amp;page=1&amp;before=first"' in links
+    assert 'href="?sort=name&amp;order=asc&amp;page=3&amp;after=last"' in links
+    assert 'href="?sort=name&amp;order=asc&amp;page=4"' in links
+
+    # the count may be out of date
+    pagination = KeysetPagination(
+        url='/hub/admin', total=100, page=1, per_page=100, has_more=True
+    )
+    assert pagination.has_next
+    assert 'href="?page=2"' in pagination.links
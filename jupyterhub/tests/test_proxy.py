@@ -4,6 +4,7 @@ import os
 from contextlib import contextmanager
 from queue import Queue
 from subprocess import Popen
+from unittest import mock
 from urllib.parse import quote
 from urllib.parse import urlparse
 
@@ -11,6 +12,9 @@ import pytest
 from traitlets.config import Config
 
 from .. import orm
+from ..objects import Server
+from ..proxy import Proxy
+from ..user import UserDict
 from ..utils import url_path_join as ujoin
 from ..utils import wait_for_http_server
 from .mocking import MockHub
@@ -28,6 +32,104 @@ def disable_check_routes(app):
         app.last_activity_callback.start()
 
 
+class InMemoryProxy(Proxy):
+    """A Proxy that keeps its routes in a dict, counting changes"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.routes = {}
+        self.added = []
+        self.deleted = []
+
+    async def add_route(self, routespec, target, data):
+        self.added.append(routespec)
+        self.routes[routespec] = {
+            'routespec': routespec,
+            'target': target,
+            'data': data,
+        }
+
+    async def delete_route(self, routespec):
+        self.deleted.append(routespec)
+        self.routes.pop(routespec, None)
+
+    async def get_all_routes(self):
+        return {routespec: dict(route) for routespec, route in self.routes.items()}
+
+
+async def test_route_reconciliation(db):
+    hub = Server(ip='127.0.0.1', port=8081)
+    hub.routespec = '/'
+    users = UserDict(db_factory=lambda: db, settings={})
+    app = mock.Mock(hub=hub, users=users, _service_map={})
+    proxy = InMemoryProxy(app=app, hub=hub)
+    running = users[add_user(db, name='running').id]
+    pending = users[add_user(db, name='pending').id]
+    orm_server = orm.Server(ip='127.0.0.1', port=12345, base_url=running.url)
+    db.add(orm_server)
+    db.commit()
+    running.spawner.server = Server(orm_server=orm_server)
+    pending.spawner._spawn_pending = True
+    db.commit()
+
+    # first check loads the table from the Hub's state
+    await proxy.check_routes(users, {})
+    assert sorted(proxy.routes) == sorted(['/', running.spawner.proxy_spec])
+    proxy.added.clear()
+
+    # nothing to do when routes match,
+    # and later checks don't walk every user's servers
+    with mock.patch.object(proxy, '_user_routes') as user_routes:
+        await proxy.check_routes(users, {})
+    user_routes.assert_not_called()
+    assert proxy.added == proxy.deleted == []
+
+    # lost routes are restored, unknown routes are removed,
+    # routes of pending servers are left alone
+    proxy.routes.pop(running.spawner.proxy_spec)
+    proxy.routes['/stale/'] = {
+        'routespec': '/stale/',
+        'target': 'http://127.0.0.1:1',
+        'data': {'user': 'nobody', 'server_name': ''},
+    }
+    proxy.routes[pending.spawner.proxy_spec] = {
+        'routespec': pending.spawner.proxy_spec,
+        'target': 'http://127.0.0.1:2',
+        'data': {'user': pending.name, 'server_name': ''},
+    }
+    await proxy.check_routes(users, {})
+    assert proxy.added == [running.spawner.proxy_spec]
+    assert proxy.deleted == ['/stale/']
+    assert pending.spawner.proxy_spec in proxy.routes
+
+    # routes are applied in batches
+    proxy.route_batch_size = 2
+    proxy.added.clear()
+    proxy.routes.clear()
+    await proxy.restore_routes()
+    assert sorted(proxy.added) == sorted(proxy.expected_routes)
+    assert sorted(proxy.routes) == sorted(['/', running.spawner.proxy_spec])
+    await proxy.delete_routes(['/', '/missing/', running.spawner.proxy_spec])
+    assert proxy.routes == {}
+
+    # servers that are still running keep their expected route,
+    # so check_routes restores it
+    await proxy.delete_user(running)
+    assert running.spawner.proxy_spec in proxy.expected_routes
+    await proxy.check_routes(users, {})
+    assert running.spawner.proxy_spec in proxy.routes
+
+    # routes of servers that have stopped are forgotten, not restored
+    await proxy.delete_user(running)
+    running.spawner.server = None
+    proxy.added.clear()
+    await proxy.check_routes(users, {})
+    assert running.spawner.proxy_spec not in proxy.expected_routes
+    assert proxy.added == []
+    await proxy.delete_user(running)
+    assert running.spawner.proxy_spec not in proxy.expected_routes
+
+
 async def test_external_proxy(request):
     auth_token = 'secret!'
     proxy_ip = '127.0.0.1'
@@ -4,6 +4,7 @@ import copy
 import json
 import os
 import sys
+import time
 from binascii import hexlify
 from functools import partial
 from queue import Queue
@@ -27,6 +28,10 @@ from .. import orm
 from ..services.auth import _ExpiringDict
 from ..services.auth import HubAuth
 from ..services.auth import HubAuthenticated
+from ..services.auth import HubOAuth
+from ..utils import identity_key
+from ..utils import random_port
+from ..utils import sign_identity
 from ..utils import url_path_join
 from .mocking import public_host
 from .mocking import public_url
@@ -74,6 +79,66 @@ def test_expiring_dict():
         assert cache.get('key', 'default') == 'cached value'
 
 
+def test_expiring_dict_lru():
+    cache = _ExpiringDict(max_age=30, max_size=2, negative_max_age=5)
+    cache['a'] = 'a'
+    cache['b'] = 'b'
+    # using 'a' makes 'b' the least-recently used
+    assert cache['a'] == 'a'
+    cache['c'] = 'c'
+    assert 'b' not in cache
+    assert 'a' in cache
+    assert 'c' in cache
+    with raises(KeyError):
+        cache['b']
+    assert cache.stats() == {
+        'size': 2,
+        'hits': 1,
+        'misses': 1,
+        'evictions': 1,
+        'coalesced': 0,
+    }
+
+    # negative results expire sooner
+    cache['none'] = None
+    now = time.monotonic()
+    with mock.patch('time.monotonic', lambda: now + 10):
+        assert 'none' not in cache
+        assert 'c' in cache
+    # expired values are swept when new values are added
+    with mock.patch('time.monotonic', lambda: now + 100):
+        cache['d'] = 'd'
+        assert list(cache.values) == ['d']
+
+
+async def test_expiring_dict_coalesce():
+    cache = _ExpiringDict(max_age=30)
+    calls = []
+    fetched = asyncio.Event()
+
+    async def fetch():
+        calls.append(1)
+        await fetched.wait()
+        return 'value'
+
+    futures = [
+        asyncio.ensure_future(cache.get_or_fetch('key', fetch)) for i in range(5)
+    ]
+    await asyncio.sleep(0)
+    fetched.set()
+    assert await asyncio.gather(*futures) == ['value'] * 5
+    assert len(calls) == 1
+    assert cache['key'] == 'value'
+    assert cache.coalesced == 4
+    # errors are not cached
+    async def fail():
+        raise ValueError("no")
+
+    with raises(ValueError):
+        await cache.get_or_fetch('bad', fail)
+    assert 'bad' not in cache
+
+
 def test_hub_auth():
     auth = HubAuth(cookie_name='foo')
     mock_model = {'name': 'onyxia'}
@@ -111,6 +176,153 @@ def test_hub_auth():
     assert exc_info.value.status_code == 500
 
 
+async def test_hub_auth_async():
+    replies = {'good': (200, {'name': 'nandi'}), 'gone': (404, None)}
+    requests_seen = []
+
+    class MockHubAPIHandler(RequestHandler):
+        def get(self, token):
+            requests_seen.append(token)
+            status, model = replies.get(token, (500, None))
+            self.set_status(status)
+            self.write(json.dumps(model))
+
+    http_server = HTTPServer(
+        Application([(r'/hub/api/authorizations/token/(.*)', MockHubAPIHandler)])
+    )
+    port = random_port()
+    http_server.listen(port, '127.0.0.1')
+    try:
+        auth = HubAuth(api_url='http://127.0.0.1:%i/hub/api' % port)
+        user_model = await auth.user_for_token('good', sync=False)
+        assert user_model == {'name': 'nandi'}
+        # cached
+        assert await auth.user_for_token('good', sync=False) == user_model
+        assert requests_seen == ['good']
+
+        # concurrent misses make one request
+        replies['new'] = (200, {'name': 'ada'})
+        user_models = await asyncio.gather(
+            *(auth.user_for_token('new', sync=False) for i in range(3))
+        )
+        assert user_models == [{'name': 'ada'}] * 3
+        assert requests_seen == ['good', 'new']
+
+        assert await auth.user_for_token('gone', sync=False) is None
+
+        with raises(HTTPError) as exc_info:
+            await auth.user_for_token('broken', use_cache=False, sync=False)
+        assert exc_info.value.status_code == 502
+    finally:
+        http_server.stop()
+
+
+async def test_hub_oauth_identity_cookie():
+    api_token = 'service-api-token'
+    model = {'kind': 'user', 'name': 'ruth', 'admin': False, 'groups': []}
+    revoked = {}
+    hub_started = [0]
+    requests_seen = []
+
+    class MockTokenHandler(RequestHandler):
+        def get(self, token):
+            requests_seen.append(token)
+            reply = dict(model)
+            if self.get_argument('identity', ''):
+                reply['identity'] = sign_identity(identity_key(api_token), model, 60)
+            self.write(json.dumps(reply))
+
+    class MockRevocationsHandler(RequestHandler):
+        def get(self):
+            requests_seen.append('revocations')
+            self.write(json.dumps({'revoked': revoked, 'since': hub_started[0]}))
+
+    class MockHandler:
+        """Just enough of a RequestHandler for cookies"""
+
+        def __init__(self, cookies):
+            self.cookies = cookies
+            self.request = mock.Mock(protocol='http')
+
+        def get_cookie(self, name, default=None):
+            return default
+
+        def get_secure_cookie(self, name):
+            value = self.cookies.get(name)
+            return value.encode('ascii') if value else None
+
+        def set_secure_cookie(self, name, value, **kwargs):
+            self.cookies[name] = value
+
+        def clear_cookie(self, name, **kwargs):
+            self.cookies.pop(name, None)
+
+    http_server = HTTPServer(
+        Application(
+            [
+                (r'/hub/api/authorizations/token/(.*)', MockTokenHandler),
+                (r'/hub/api/authorizations/revocations', MockRevocationsHandler),
+            ]
+        )
+    )
+    port = random_port()
+    http_server.listen(port, '127.0.0.1')
+    api_url = 'http://127.0.0.1:%i/hub/api' % port
+    try:
+        auth = HubOAuth(
+            api_url=api_url, api_token=api_token, oauth_client_id='service-x'
+        )
+        cookies = {auth.cookie_name: 'oauth-token'}
+        handler = MockHandler(cookies)
+        assert await auth._get_user_cookie_async(handler) == model
+        assert requests_seen == ['oauth-token']
+        assert auth.identity_cookie_name in cookies
+
+        # another instance of the service, without a cached reply,
+        # verifies the identity cookie without checking the token
+        other_auth = HubOAuth(
+            api_url=api_url, api_token=api_token, oauth_client_id='service-x'
+        )
+        assert await other_auth._get_user_cookie_async(MockHandler(cookies)) == model
+        assert requests_seen == ['oauth-token', 'revocations']
+        # the synchronous API makes blocking requests to the mock Hub,
+        # which runs on this event loop, so call it from a thread
+        loop = asyncio.get_event_loop()
+
+        def get_user_cookie(auth):
+            return loop.run_in_executor(
+                None, auth._get_user_cookie, MockHandler(cookies)
+            )
+
+        assert await get_user_cookie(other_auth) == model
+        assert requests_seen == ['oauth-token', 'revocations']
+
+        # revoked identity tokens are checked with the Hub
+        revoked['ruth'] = time.time()
+        third_auth = HubOAuth(
+            api_url=api_url, api_token=api_token, oauth_client_id='service-x'
+        )
+        assert await get_user_cookie(third_auth) == model
+        assert requests_seen == [
+            'oauth-token',
+            'revocations',
+            'revocations',
+            'oauth-token',
+        ]
+
+        # revocations don't survive a Hub restart,
+        # so identity tokens issued before it are checked with the Hub
+        revoked.clear()
+        hub_started[0] = time.time() + 1
+        fourth_auth = HubOAuth(
+            api_url=api_url, api_token=api_token, oauth_client_id='service-x'
+        )
+        assert await fourth_auth._get_user_cookie_async(MockHandler(cookies)) == model
+        assert requests_seen[-2:] == ['revocations', 'oauth-token']
+    finally:
+        http_server.stop()
+
+
 def test_hub_authenticated(request):
     auth = HubAuth(cookie_name='jubal')
     mock_model = {'name': 'jubalearly', 'groups': ['lions']}
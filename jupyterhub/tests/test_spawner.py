@@ -1,6 +1,7 @@
 """Tests for process spawning"""
 # Copyright (c) Jupyter Development Team.
 # Distributed under the terms of the Modified BSD License.
+import asyncio
 import logging
 import os
 import signal
@@ -15,9 +16,11 @@ import pytest
 from tornado import gen
 
 from .. import orm
+from .. import poller
 from .. import spawner as spawnermod
 from ..objects import Hub
 from ..objects import Server
+from ..poller import PollScheduler
 from ..spawner import LocalProcessSpawner
 from ..spawner import Spawner
 from ..user import User
@@ -183,6 +186,119 @@ async def test_spawner_poll(db):
     assert status is not None
 
 
+async def test_spawner_exit_watch(db):
+    spawner = new_spawner(db, poll_interval=30)
+    await spawner.start()
+    if spawner._exit_future is None:
+        await spawner.stop(now=True)
+        pytest.skip("Process exit can't be watched on this platform")
+    stopped = []
+    spawner.add_poll_callback(stopped.append, True)
+    spawner.start_polling()
+    assert await spawner.poll() is None
+
+    # exit is noticed without waiting for the next poll
+    spawner.proc.terminate()
+    for i in range(20):
+        if stopped:
+            break
+        await gen.sleep(0.1)
+    assert stopped == [True]
+    assert spawner._exit_future is None
+    assert await spawner.poll() == -signal.SIGTERM
+
+
+class StatusSpawner(Spawner):
+    """Spawner whose poll status is set by the test"""
+
+    status = None
+    polls = 0
+
+    async def start(self):
+        pass
+
+    async def stop(self, now=False):
+        pass
+
+    async def poll(self):
+        self.polls += 1
+        return self.status
+
+
+class BatchStatusSpawner(StatusSpawner):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # sizes of the batches this spawner was polled in
+        self.batches = []
+
+    @classmethod
+    async def poll_many(cls, spawners):
+        for spawner in spawners:
+            spawner.polls += 1
+            spawner.batches.append(len(spawners))
+        return [spawner.status for spawner in spawners]
+
+
+async def test_poll_scheduler(db):
+    now = 1000
+    # real time passes much more slowly than the scheduler's clock,
+    # which is advanced by the test
+    clock = mock.Mock(monotonic=lambda: now, perf_counter=time.perf_counter)
+    scheduler = PollScheduler(concurrency=2)
+
+    async def advance(seconds):
+        nonlocal now
+        now += seconds
+        scheduler._wakeup.set()
+        # let the scheduler start and finish its polls
+        for i in range(20):
+            await asyncio.sleep(0)
+
+    user = User(db.query(orm.User).first(), {})
+    spawners = [
+        StatusSpawner(user=user, poll_interval=60, poll_scheduler=scheduler)
+        for i in range(3)
+    ] + [
+        BatchStatusSpawner(user=user, poll_interval=60, poll_scheduler=scheduler)
+        for i in range(3)
+    ]
+    stopped = []
+    with mock.patch.object(poller, 'time', clock), mock.patch.object(
+        poller.random, 'uniform', lambda low, high: high / 2
+    ):
+        for spawner in spawners:
+            spawner.add_poll_callback(stopped.append, spawner)
+            spawner.start_polling()
+        assert len(scheduler) == len(spawners)
+        try:
+            await advance(10)
+            assert [spawner.polls for spawner in spawners] == [0] * 6
+            await advance(20)
+            assert [spawner.polls for spawner in spawners] == [1] * 6
+            # batch spawners are polled together
+            for spawner in spawners[3:]:
+                assert spawner.batches == [3]
+
+            # stopped servers trigger callbacks and are no longer polled
+            spawners[0].status = 0
+            spawners[3].status = 0
+            await advance(60)
+            assert [spawner.polls for spawner in spawners] == [2] * 6
+            assert set(stopped) == {spawners[0], spawners[3]}
+            assert spawners[0] not in scheduler
+            assert spawners[3] not in scheduler
+            spawners[1].stop_polling()
+            assert spawners[1] not in scheduler
+            await advance(60)
+            assert [spawner.polls for spawner in spawners] == [2, 2, 3, 2, 3, 3]
+            assert spawners[4].batches == [3, 3, 2]
+            assert len(scheduler) == 3
+        finally:
+            scheduler.stop()
+            # let the cancelled scheduler task finish
+            await advance(0)
+
+
 def test_setcwd():
     cwd = os.getcwd()
     with tempfile.TemporaryDirectory() as td:
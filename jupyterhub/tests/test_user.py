@@ -1,5 +1,14 @@
+import os
+from unittest import mock
+
 import pytest
+from prometheus_client import REGISTRY
 
+from .. import crypto
+from .. import orm
+from .. import user as user_module
+from ..user import AuthStateCache
+from ..user import User
 from ..user import UserDict
 from .utils import add_user
 
@@ -20,3 +29,189 @@ async def test_userdict_get(db, attr):
     assert userdict.get(key).id == u.id
     # `in` should find it now
     assert key in userdict
+
+
+async def test_userdict_name_index(db):
+    u = add_user(db, name="finn", app=False)
+    userdict = UserDict(db_factory=lambda: db, settings={})
+    user = userdict[u.id]
+    assert "finn" in userdict
+    # cached lookup by name doesn't query the db
+    with mock.patch.object(db, 'query') as query:
+        assert userdict["finn"] is user
+    query.assert_not_called()
+
+    user.name = "fn-2187"
+    assert "finn" not in userdict
+    assert "fn-2187" in userdict
+    user.name = "finn"
+    db.commit()
+
+    del userdict[u.id]
+    assert "finn" not in userdict
+    assert userdict["finn"].id == u.id
+
+
+async def test_userdict_cookie_id_index(db):
+    u = add_user(db, name="poe", app=False)
+    userdict = UserDict(db_factory=lambda: db, settings={})
+    cookie_id = u.cookie_id
+    user = userdict.find_by_cookie_id(cookie_id)
+    assert user.id == u.id
+    # cached lookup by cookie id doesn't query the db
+    with mock.patch.object(db, 'query') as query:
+        assert userdict.find_by_cookie_id(cookie_id) is user
+    query.assert_not_called()
+
+    # a changed cookie id is not accepted
+    u.cookie_id = "rotated"
+    db.commit()
+    assert userdict.find_by_cookie_id(cookie_id) is None
+    assert userdict.find_by_cookie_id("rotated") is user
+
+    # forgotten with the user
+    del userdict[u.id]
+    assert "rotated" not in userdict._cookie_ids
+    assert userdict.find_by_cookie_id("rotated").id == u.id
+    assert userdict.find_by_cookie_id("nosuchcookie") is None
+
+
+async def test_userdict_eviction(db):
+    orm_users = [add_user(db, name="evict-%i" % i, app=False) for i in range(4)]
+    userdict = UserDict(db_factory=lambda: db, settings={}, max_size=2)
+    first = userdict[orm_users[0].id]
+    # an active server keeps the user in the cache
+    first.spawner._spawn_pending = True
+    second = userdict[orm_users[1].id]
+    userdict[orm_users[2].id]
+    assert len(userdict) == 2
+    assert first.id in userdict
+    assert second.id not in userdict
+    assert "evict-1" not in userdict
+
+    # least-recently used idle user is evicted next
+    userdict[orm_users[3].id]
+    assert len(userdict) == 2
+    assert orm_users[2].id not in userdict
+    assert orm_users[3].id in userdict
+
+    # evicted users are reloaded from the db
+    first.spawner._spawn_pending = False
+    assert userdict["evict-1"].name == "evict-1"
+    assert len(userdict) == 2
+
+    # evicted users still in use stay in the session,
+    # so their changes are saved
+    in_use = userdict[orm_users[2].id]
+    userdict[orm_users[0].id]
+    userdict[orm_users[3].id]
+    assert in_use.id not in userdict
+    assert in_use.orm_user in db
+    in_use.orm_user.admin = True
+    db.commit()
+    reloaded = userdict[in_use.id]
+    assert reloaded.orm_user is in_use.orm_user
+    assert db.query(orm.User.admin).filter(orm.User.id == in_use.id).scalar()
+
+
+async def test_userdict_eviction_min_idle(db):
+    orm_users = [add_user(db, name="evict-idle-%i" % i, app=False) for i in range(3)]
+    userdict = UserDict(db_factory=lambda: db, settings={}, max_size=1, min_idle=60)
+    with mock.patch('time.monotonic', return_value=1000):
+        held = userdict[orm_users[0].id]
+        userdict[orm_users[1].id]
+    # recently used users are not evicted,
+    # so a request still holding a wrapper gets the same one again
+    assert len(userdict) == 2
+    with mock.patch('time.monotonic', return_value=1030):
+        assert userdict["evict-idle-0"] is held
+        assert userdict[orm_users[0].id] is held
+
+    total = REGISTRY.get_sample_value('total_users')
+    with mock.patch('time.monotonic', return_value=1100):
+        userdict[orm_users[2].id]
+    # users idle for min_idle are evicted, and no longer counted
+    assert len(userdict) == 1
+    assert held.id not in userdict
+    assert REGISTRY.get_sample_value('total_users') == total - 1
+    with mock.patch('time.monotonic', return_value=1100):
+        assert userdict[held.id] is not held
+    assert REGISTRY.get_sample_value('total_users') == total
+
+
+async def test_userdict_server_counts(db):
+    u = add_user(db, name="counted", app=False)
+    userdict = UserDict(db_factory=lambda: db, settings={})
+    spawner = userdict[u.id].spawner
+    assert userdict.count_active_users()['active'] == 0
+
+    spawner._spawn_pending = True
+    counts = userdict.count_active_users()
+    assert counts['pending'] == 1
+    assert counts['spawn_pending'] == 1
+    assert counts['active'] == 1
+    assert counts['ready'] == 0
+
+    spawner._spawn_pending = False
+    counts = userdict.count_active_users()
+    assert counts['pending'] == 0
+    assert counts['active'] == 0
+    assert userdict.check_active_users() == userdict.count_active_users()
+
+    # drift is corrected by a full check
+    userdict._server_counts['active'] += 3
+    assert userdict.count_active_users()['active'] == 3
+    assert userdict.check_active_users()['active'] == 0
+    assert userdict.count_active_users()['active'] == 0
+
+
+def test_auth_state_cache_bounds():
+    cache = AuthStateCache(max_size=2, ttl=10)
+    with mock.patch('time.monotonic', return_value=100):
+        cache.set(1, b'one', {'n': 1})
+        cache.set(2, b'two', {'n': 2})
+        assert cache.get(1, b'one') == (True, {'n': 1})
+        cache.set(3, b'three', {'n': 3})
+    # least-recently used entry is evicted
+    assert len(cache) == 2
+    with mock.patch('time.monotonic', return_value=105):
+        assert cache.get(2, b'two') == (False, None)
+        # only used for the same ciphertext
+        assert cache.get(1, b'changed') == (False, None)
+        found, auth_state = cache.get(3, b'three')
+        assert found
+        # cached values are copies
+        auth_state['n'] = 'modified'
+        assert cache.get(3, b'three') == (True, {'n': 3})
+    with mock.patch('time.monotonic', return_value=111):
+        assert cache.get(3, b'three') == (False, None)
+
+
+async def test_auth_state_cache(db):
+    ck = crypto.CryptKeeper.instance()
+    save_keys = ck.keys
+    ck.keys = [os.urandom(32)]
+    orm_user = add_user(db, name="leia", app=False)
+    cache = AuthStateCache()
+    user = User(orm_user, settings={'auth_state_cache': cache})
+    try:
+        await user.save_auth_state({'token': 'first'})
+        with mock.patch.object(
+            user_module, 'decrypt', wraps=user_module.decrypt
+        ) as decrypt:
+            assert await user.get_auth_state() == {'token': 'first'}
+            decrypt.assert_not_called()
+            cache.clear()
+            assert await user.get_auth_state() == {'token': 'first'}
+            assert await user.get_auth_state() == {'token': 'first'}
+            assert decrypt.call_count == 1
+
+        await user.save_auth_state({'token': 'second'})
+        assert await user.get_auth_state() == {'token': 'second'}
+        # changing the stored value directly invalidates the entry
+        user.encrypted_auth_state = await crypto.encrypt({'token': 'third'})
+        assert await user.get_auth_state() == {'token': 'third'}
+        await user.save_auth_state(None)
+        assert len(cache) == 0
+    finally:
+        ck.keys = save_keys
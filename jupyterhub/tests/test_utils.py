@@ -1,12 +1,22 @@
 """Tests for utilities"""
 import asyncio
+import hashlib
+import time
+from unittest import mock
 
 import pytest
 from async_generator import aclosing
 from async_generator import async_generator
 from async_generator import yield_
 
+from .. import utils
+from ..utils import compare_token
+from ..utils import compare_token_async
+from ..utils import hash_token
+from ..utils import identity_key
 from ..utils import iterate_until
+from ..utils import sign_identity
+from ..utils import verify_identity
 
 
 @async_generator
@@ -60,3 +70,53 @@ async def test_iterate_until_ready_after_deadline(io_loop):
         async for item in items:
             yielded.append(item)
     assert yielded == list(range(5))
+
+
+def test_identity_token():
+    key = identity_key('secret-token')
+    model = {'kind': 'user', 'name': 'ruth', 'admin': False, 'groups': []}
+    identity = sign_identity(key, model, 60)
+    payload = verify_identity(key, identity)
+    assert payload['model'] == model
+    assert payload['exp'] == payload['iat'] + 60
+
+    # only the same key can verify
+    assert verify_identity(identity_key('other-token'), identity) is None
+    # tampering is detected
+    encoded, signature = identity.split('.')
+    assert verify_identity(key, encoded[:-4] + 'AAA=.' + signature) is None
+    assert verify_identity(key, 'garbage') is None
+    # expired
+    now = time.time()
+    with mock.patch('time.time', lambda: now + 61):
+        assert verify_identity(key, identity) is None
+
+
+def check_hash_rounds(token, rounds):
+    """Check hash_token against hashing the token once per round"""
+    h = hashlib.sha512(b'abcdef')
+    for i in range(rounds):
+        h.update(token.encode('utf8'))
+    hashed = hash_token(token, salt='abcdef', rounds=rounds)
+    assert hashed == 'sha512:%i:abcdef:%s' % (rounds, h.hexdigest())
+    assert compare_token(hashed, token)
+    assert not compare_token(hashed, token + 'x')
+
+
+@pytest.mark.parametrize("rounds", [1, 5, 1024, 1500, 16384])
+def test_hash_token_rounds(rounds):
+    check_hash_rounds('ünicode-token', rounds)
+
+
+@pytest.mark.parametrize("length", [1, 100, 70000])
+def test_hash_token_long(length):
+    # tokens longer than a chunk are hashed one repetition per update
+    with mock.patch.object(utils, '_HASH_CHUNK_BYTES', 250):
+        check_hash_rounds('x' * length, 7)
+
+
+async def test_compare_token_async():
+    hashed = hash_token('secret-token', rounds=16384)
+    assert await compare_token_async(hashed, 'secret-token')
+    assert not await compare_token_async(hashed, 'wrong-token')
+    assert await compare_token_async(hash_token('generated', rounds=1), 'generated')
@@ -1,8 +1,13 @@
 # Copyright (c) Jupyter Development Team.
 # Distributed under the terms of the Modified BSD License.
+import copy
+import hashlib
 import json
+import time
 import warnings
+from collections import Counter
 from collections import defaultdict
+from collections import OrderedDict
 from datetime import datetime
 from datetime import timedelta
 from urllib.parse import quote
@@ -51,11 +56,37 @@ class UserDict(dict):
 
     .. versionchanged:: 1.2
         ``'username' in userdict`` pattern is now supported
+
+    If `max_size` is set, wrappers of the least-recently-used users
+    with no active or pending servers are evicted
+    once the cache holds more than `max_size` users.
+    Users used within the last `min_idle` seconds are not evicted,
+    since a request may still hold their wrapper,
+    so the cache may exceed `max_size` while many users are in use.
+    Evicted users are reloaded from the database the next time they are requested.
+
+    Users found by their login cookie with `find_by_cookie_id`
+    are also indexed by cookie id.
+
+    .. versionadded:: 1.2
+        name and cookie id indexes, `max_size`, and `min_idle`
     """
 
-    def __init__(self, db_factory, settings):
+    def __init__(self, db_factory, settings, max_size=0, min_idle=0):
         self.db_factory = db_factory
         self.settings = settings
+        self.max_size = max_size
+        self.min_idle = min_idle
+        # username: id index of cached users
+        self._names = {}
+        # cookie_id: id index of cached users, and its inverse
+        self._cookie_ids = {}
+        self._cookie_ids_by_user = {}
+        # id: time.monotonic() of last use, for cached users,
+        # least-recently used first
+        self._lru = OrderedDict()
+        # counts of servers by state, updated by Spawner state transitions
+        self._server_counts = Counter()
         super().__init__()
 
     @property
@@ -72,6 +103,113 @@ class UserDict(dict):
             TOTAL_USERS.inc()
         return self[orm_user.id]
 
+    def __setitem__(self, id, user):
+        dict.__setitem__(self, id, user)
+        user._user_dict = self
+        user._server_counts = self._server_counts
+        self._names[user.name] = id
+        self._touch(id)
+        if self.max_size and len(self) > self.max_size:
+            self._evict_idle(keep=id)
+
+    def _touch(self, id):
+        """Mark a cached user as the most-recently used"""
+        self._lru[id] = time.monotonic()
+        self._lru.move_to_end(id)
+
+    def _id_for_name(self, name):
+        """Get the id of a cached user by name, or None"""
+        id = self._names.get(name)
+        if id is None:
+            return None
+        user = dict.get(self, id)
+        if user is None or user.name != name:
+            # stale entry, e.g. renamed directly on the orm.User
+            self._names.pop(name, None)
+            return None
+        return id
+
+    def find_by_cookie_id(self, cookie_id):
+        """Get the User whose login cookie id is `cookie_id`, or None
+
+        Cached users are found by cookie id without querying the database.
+        Index entries are checked against the user's current cookie_id,
+        so a cookie id that has been changed is never accepted.
+        """
+        id = self._cookie_ids.get(cookie_id)
+        if id is not None:
+            user = dict.get(self, id)
+            if user is not None and user.orm_user.cookie_id == cookie_id:
+                return self[id]
+            self._forget_cookie_id(id)
+        orm_user = (
+            self.db.query(orm.User).filter(orm.User.cookie_id == cookie_id).first()
+        )
+        if orm_user is None:
+            return None
+        user = self[orm_user]
+        self._forget_cookie_id(user.id)
+        self._cookie_ids[cookie_id] = user.id
+        self._cookie_ids_by_user[user.id] = cookie_id
+        return user
+
+    def _forget_cookie_id(self, id):
+        """Remove a user from the cookie id index"""
+        cookie_id = self._cookie_ids_by_user.pop(id, None)
+        if cookie_id is not None and self._cookie_ids.get(cookie_id) == id:
+            self._cookie_ids.pop(cookie_id)
+
+    def _rename(self, user, new_name):
+        """Update the name index when a cached user is renamed"""
+        if self._names.get(user.name) == user.id:
+            self._names.pop(user.name)
+        self._names[new_name] = user.id
+
+    def _evict_idle(self, keep=None):
+        """Evict least-recently-used users with no active servers
+
+        until at most max_size users are cached.
+        Users with active servers, or used within min_idle seconds,
+        are never evicted.
+
+        Evicted users' orm objects are not expunged from the session,
+        since a request may still be using them.
+        The session's identity map releases them once they are unreferenced.
+        """
+        now = time.monotonic()
+        for id, last_used in list(self._lru.items()):
+            if len(self) <= self.max_size:
+                break
+            if now - last_used < self.min_idle:
+                # all the remaining users were used more recently
+                break
+            if id == keep:
+                continue
+            user = dict.__getitem__(self, id)
+            if any(spawner.active for spawner in user.spawners.values()):
+                continue
+            app_log.debug("Evicting idle user %s from cache", user.name)
+            self._forget(id)
+            # evicted users are counted again by add when they are reloaded
+            TOTAL_USERS.dec()
+
+    def _expunge(self, user):
+        """Expunge a user's orm objects from the session"""
+        for orm_spawner in user.orm_user._orm_spawners:
+            if orm_spawner in self.db:
+                self.db.expunge(orm_spawner)
+        if user.orm_user in self.db:
+            self.db.expunge(user.orm_user)
+
+    def _forget(self, id):
+        """Remove a user id from the cache and its indexes"""
+        user = dict.pop(self, id)
+        self._lru.pop(id, None)
+        if self._names.get(user.name) == id:
+            self._names.pop(user.name)
+        self._forget_cookie_id(id)
+        user._user_dict = None
+
     def __contains__(self, key):
         """key in userdict checks presence in the cache
 
@@ -80,11 +218,7 @@ class UserDict(dict):
         if isinstance(key, (User, orm.User)):
             key = key.id
         elif isinstance(key, str):
-            # username lookup, O(N)
-            for user in self.values():
-                if user.name == key:
-                    key = user.id
-                    break
+            key = self._id_for_name(key)
         return dict.__contains__(self, key)
 
     def __getitem__(self, key):
@@ -98,11 +232,17 @@ class UserDict(dict):
         if isinstance(key, User):
             key = key.id
         elif isinstance(key, str):
-            orm_user = self.db.query(orm.User).filter(orm.User.name == key).first()
-            if orm_user is None:
-                raise KeyError("No such user: %s" % key)
+            id = self._id_for_name(key)
+            if id is not None:
+                key = id
             else:
-                key = orm_user.id
+                orm_user = (
+                    self.db.query(orm.User).filter(orm.User.name == key).first()
+                )
+                if orm_user is None:
+                    raise KeyError("No such user: %s" % key)
+                else:
+                    key = orm_user.id
         if isinstance(key, orm.User):
             # users[orm_user] returns User(orm_user)
             orm_user = key
@@ -111,6 +251,7 @@ class UserDict(dict):
                 return user
             user = dict.__getitem__(self, orm_user.id)
             user.db = self.db
+            self._touch(orm_user.id)
             return user
         elif isinstance(key, int):
             id = key
@@ -121,6 +262,7 @@ class UserDict(dict):
                 user = self.add(orm_user)
             else:
                 user = dict.__getitem__(self, id)
+                self._touch(id)
             return user
         else:
             raise KeyError(repr(key))
@@ -141,12 +283,8 @@ class UserDict(dict):
 
     def __delitem__(self, key):
         user = self[key]
-        for orm_spawner in user.orm_user._orm_spawners:
-            if orm_spawner in self.db:
-                self.db.expunge(orm_spawner)
-        if user.orm_user in self.db:
-            self.db.expunge(user.orm_user)
-        dict.__delitem__(self, user.id)
+        self._expunge(user)
+        self._forget(user.id)
 
     def delete(self, key):
         """Delete a user from the cache and the database"""
@@ -161,23 +299,109 @@ class UserDict(dict):
     def count_active_users(self):
         """Count the number of user servers that are active/pending/ready
 
+        Counts are maintained incrementally by Spawner state transitions,
+        so this does not iterate over users.
+
+        Returns dict with counts of active/pending/ready servers
+        """
+        counts = defaultdict(lambda: 0)
+        counts.update((key, n) for key, n in self._server_counts.items() if n)
+        return counts
+
+    def check_active_users(self):
+        """Recount active/pending/ready servers by iterating over every server
+
+        If the result differs from the incrementally maintained counts,
+        the drift is logged and the counts are corrected.
+
         Returns dict with counts of active/pending/ready servers
         """
         counts = defaultdict(lambda: 0)
         for user in self.values():
             for spawner in user.spawners.values():
-                pending = spawner.pending
-                if pending:
-                    counts['pending'] += 1
-                    counts[pending + '_pending'] += 1
-                if spawner.active:
-                    counts['active'] += 1
-                if spawner.ready:
-                    counts['ready'] += 1
-
+                states = spawner._current_states()
+                for key in states:
+                    counts[key] += 1
+                # future transitions are counted relative to the actual state
+                spawner._counted_states = states
+
+        tracked = self.count_active_users()
+        drift = {
+            key: counts[key] - tracked[key]
+            for key in set(counts).union(tracked)
+            if counts[key] != tracked[key]
+        }
+        if drift:
+            app_log.warning("Correcting drift in server counts: %s", drift)
+            self._server_counts.clear()
+            self._server_counts.update(counts)
         return counts
 
 
+class AuthStateCache:
+    """Bounded cache of decrypted auth_state, by user id
+
+    Each entry is stored with a digest of the encrypted auth_state
+    it was decrypted from,
+    and is only used for that same encrypted value,
+    so changes to auth_state are never hidden by the cache.
+
+    Entries expire `ttl` seconds after they are stored.
+    The least-recently used entries are evicted
+    when there are more than `max_size`.
+
+    Cached values are copied, so callers can modify the auth_state they get.
+
+    .. versionadded:: 1.2
+    """
+
+    def __init__(self, max_size=1000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        # user id: (ciphertext digest, auth_state, timestamp)
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _digest(encrypted):
+        return hashlib.sha256(encrypted).digest()
+
+    def get(self, user_id, encrypted):
+        """Return (found, auth_state) for a user's encrypted auth_state"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return False, None
+        digest, auth_state, timestamp = entry
+        if (
+            digest != self._digest(encrypted)
+            or time.monotonic() - timestamp > self.ttl
+        ):
+            self._entries.pop(user_id)
+            return False, None
+        self._entries.move_to_end(user_id)
+        return True, copy.deepcopy(auth_state)
+
+    def set(self, user_id, encrypted, auth_state):
+        """Store the decrypted auth_state of a user"""
+        self._entries[user_id] = (
+            self._digest(encrypted),
+            copy.deepcopy(auth_state),
+            time.monotonic(),
+        )
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def evict(self, user_id):
+        """Remove a user's entry, if any"""
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
 class _SpawnerDict(dict):
     def __init__(self, spawner_factory):
         self.spawner_factory = spawner_factory
@@ -197,6 +421,10 @@ class User:
     log = app_log
     settings = None
     _auth_refreshed = None
+    # the UserDict caching this user, if any
+    _user_dict = None
+    # server state counts of the UserDict, updated by my spawners
+    _server_counts = None
 
     def __init__(self, orm_user, settings=None, db=None):
         self.db = db or inspect(orm_user).session
@@ -224,19 +452,37 @@ class User:
     def spawner_class(self):
         return self.settings.get('spawner_class', LocalProcessSpawner)
 
+    @property
+    def auth_state_cache(self):
+        return self.settings.get('auth_state_cache')
+
     async def save_auth_state(self, auth_state):
         """Encrypt and store auth_state"""
+        cache = self.auth_state_cache
         if auth_state is None:
             self.encrypted_auth_state = None
+            if cache is not None:
+                cache.evict(self.id)
         else:
             self.encrypted_auth_state = await encrypt(auth_state)
+            if cache is not None:
+                cache.set(self.id, self.encrypted_auth_state, auth_state)
         self.db.commit()
 
     async def get_auth_state(self):
-        """Retrieve and decrypt auth_state for the user"""
+        """Retrieve and decrypt auth_state for the user
+
+        If JupyterHub.auth_state_cache_ttl is set,
+        recently decrypted auth_state is reused.
+        """
         encrypted = self.encrypted_auth_state
         if encrypted is None:
             return None
+        cache = self.auth_state_cache
+        if cache is not None:
+            found, auth_state = cache.get(self.id, encrypted)
+            if found:
+                return auth_state
         try:
             auth_state = await decrypt(encrypted)
         except (ValueError, InvalidToken, EncryptionUnavailable) as e:
@@ -246,6 +492,8 @@ class User:
                 e,
             )
             return
+        if cache is not None:
+            cache.set(self.id, encrypted, auth_state)
         # loading auth_state
         if auth_state:
             # Crypt has multiple keys, store again with new key for rotation.
@@ -318,6 +566,7 @@ class User:
             oauth_client_id=client_id,
             cookie_options=self.settings.get('cookie_options', {}),
             trusted_alt_names=trusted_alt_names,
+            poll_scheduler=self.settings.get('poll_scheduler'),
         )
 
         if self.settings.get('internal_ssl'):
@@ -351,6 +600,9 @@ class User:
             raise AttributeError(attr)
 
     def __setattr__(self, attr, value):
+        if attr == 'name' and self._user_dict is not None and self.orm_user:
+            # keep the UserDict name index up to date
+            self._user_dict._rename(self, value)
         if not attr.startswith('_') and self.orm_user and hasattr(self.orm_user, attr):
             setattr(self.orm_user, attr, value)
         else:
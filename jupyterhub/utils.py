@@ -2,16 +2,20 @@
 # Copyright (c) Jupyter Development Team.
 # Distributed under the terms of the Modified BSD License.
 import asyncio
+import base64
 import concurrent.futures
 import errno
 import hashlib
+import hmac
 import inspect
+import json
 import os
 import random
 import socket
 import ssl
 import sys
 import threading
+import time
 import uuid
 import warnings
 from binascii import b2a_hex
@@ -307,10 +311,18 @@ def new_token(*args, **kwargs):
     return uuid.uuid4().hex
 
 
+# approximate size in bytes of the repeated token hashed with one update
+# when hashing many rounds.
+# Sized in bytes, so that long tokens don't make large allocations.
+_HASH_CHUNK_BYTES = 65536
+
+
 def hash_token(token, salt=8, rounds=16384, algorithm='sha512'):
     """Hash a token, and return it as `algorithm:salt:hash`.
 
     If `salt` is an integer, a random salt of that many bytes will be used.
+
+    The digest is of the salt followed by `rounds` repetitions of the token.
     """
     h = hashlib.new(algorithm)
     if isinstance(salt, int):
@@ -322,8 +334,16 @@ def hash_token(token, salt=8, rounds=16384, algorithm='sha512'):
         bsalt = salt.encode('utf8')
     btoken = token.encode('utf8', 'replace')
     h.update(bsalt)
-    for i in range(rounds):
-        h.update(btoken)
+    # hashing the repeated token in large chunks
+    # gives the same digest as hashing it once per round,
+    # with far fewer calls into hashlib
+    chunk_rounds = max(1, _HASH_CHUNK_BYTES // max(len(btoken), 1))
+    chunks, remainder = divmod(rounds, chunk_rounds)
+    if chunks:
+        chunk = btoken * chunk_rounds
+        for i in range(chunks):
+            h.update(chunk)
+    h.update(btoken * remainder)
     digest = h.hexdigest()
 
     return "{algorithm}:{rounds}:{salt}:{digest}".format(**locals())
@@ -344,6 +364,85 @@ def compare_token(compare, token):
     return False
 
 
+# thread pool for comparing tokens with expensive hashes, created on first use
+_hash_executor = None
+_hash_executor_lock = threading.Lock()
+_hash_executor_workers = 4
+
+
+def _get_hash_executor():
+    global _hash_executor
+    with _hash_executor_lock:
+        if _hash_executor is None:
+            _hash_executor = concurrent.futures.ThreadPoolExecutor(
+                _hash_executor_workers, thread_name_prefix='jupyterhub-hash'
+            )
+    return _hash_executor
+
+
+async def compare_token_async(compare, token):
+    """Compare a token with a hashed token, without blocking the event loop
+
+    Hashes with more than one round are compared on a thread pool.
+    hashlib releases the GIL while hashing,
+    so comparisons run in parallel with the event loop.
+    """
+    srounds = compare.split(':')[1]
+    if srounds == '1':
+        return compare_token(compare, token)
+    return await asyncio.get_event_loop().run_in_executor(
+        _get_hash_executor(), compare_token, compare, token
+    )
+
+
+def identity_key(api_token):
+    """Derive the key for signing identity tokens for the holder of an API token
+
+    Only the Hub and the holder of the API token can sign or verify
+    identity tokens with this key.
+    """
+    return hmac.new(
+        api_token.encode('utf8'), b'jupyterhub-identity', hashlib.sha256
+    ).digest()
+
+
+def sign_identity(key, model, max_age):
+    """Sign a user model as an identity token that expires after max_age seconds
+
+    Returns the identity token as a string.
+    The token is not encrypted, only signed.
+    """
+    now = time.time()
+    payload = json.dumps(
+        {'model': model, 'iat': now, 'exp': now + max_age}, separators=(',', ':')
+    ).encode('utf8')
+    encoded = base64.urlsafe_b64encode(payload)
+    signature = base64.urlsafe_b64encode(
+        hmac.new(key, encoded, hashlib.sha256).digest()
+    )
+    return (encoded + b'.' + signature).decode('ascii')
+
+
+def verify_identity(key, identity):
+    """Verify an identity token signed by :func:`sign_identity`
+
+    Returns the payload dict with the user `model`, and when it was issued (`iat`)
+    and expires (`exp`) as unix timestamps,
+    or None if the signature is invalid or the token has expired.
+    """
+    try:
+        encoded, signature = identity.encode('ascii').split(b'.')
+    except (UnicodeEncodeError, ValueError):
+        return None
+    expected = base64.urlsafe_b64encode(hmac.new(key, encoded, hashlib.sha256).digest())
+    if not compare_digest(signature, expected):
+        return None
+    payload = json.loads(base64.urlsafe_b64decode(encoded).decode('utf8'))
+    if payload['exp'] < time.time():
+        return None
+    return payload
+
+
 def url_path_join(*pieces):
     """Join components of url into a relative url.
 
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+"""Show query plans of the Hub's hot lookups, with and without indexes
+
+Fills a database with bulk data, then prints the query plan and timing
+of each lookup, first without the indexes added in alembic revision
+b7d2c4e1f0a9, then with them.
+
+Usage:
+
+    python tools/explain_queries.py [--users N] [db_url]
+
+The database defaults to a temporary sqlite file.
+Other databases, e.g. postgresql://localhost/jupyterhub_explain,
+should be empty, as the JupyterHub tables are created in them.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from datetime import timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from jupyterhub import orm
+
+# the indexes added by revision b7d2c4e1f0a9
+INDEXES = [
+    'ix_users_last_activity',
+    'ix_user_group_map_group_id',
+    'ix_spawners_user_id',
+    'ix_spawners_server_id',
+    'ix_spawners_last_activity',
+    'ix_api_tokens_user_id',
+    'ix_api_tokens_service_id',
+    'ix_api_tokens_expires_at',
+    'ix_oauth_access_tokens_user_id',
+    'ix_oauth_access_tokens_client_id',
+    'ix_oauth_access_tokens_expires_at',
+    'ix_oauth_codes_user_id',
+    'ix_oauth_codes_client_id',
+    'ix_oauth_codes_code',
+    'ix_oauth_codes_expires_at',
+]
+
+
+def populate(engine, n_users):
+    """Insert n_users users, with servers, tokens and OAuth codes
+
+    Rows are inserted in bulk, without creating ORM objects.
+    """
+    now = datetime.utcnow()
+    n_clients = max(n_users // 100, 1)
+    n_groups = max(n_users // 1000, 1)
+    tables = orm.Base.metadata.tables
+
+    def insert(table, rows):
+        with engine.begin() as conn:
+            conn.execute(tables[table].insert(), rows)
+
+    insert(
+        'users',
+        [
+            {
+                'id': i,
+                'name': 'user-%i' % i,
+                'cookie_id': 'cookie-%i' % i,
+                'created': now,
+                'last_activity': now - timedelta(minutes=i % 10000),
+            }
+            for i in range(1, n_users + 1)
+        ],
+    )
+    insert(
+        'groups', [{'id': i, 'name': 'group-%i' % i} for i in range(1, n_groups + 1)]
+    )
+    insert(
+        'user_group_map',
+        [
+            {'user_id': i, 'group_id': i % n_groups + 1}
+            for i in range(1, n_users + 1)
+        ],
+    )
+    insert('services', [{'id': 1, 'name': 'service'}])
+    # one in ten users has a running server
+    insert(
+        'servers', [{'id': i, 'port': 8000} for i in range(1, n_users + 1, 10)],
+    )
+    insert(
+        'spawners',
+        [
+            {
+                'id': i,
+                'user_id': i,
+                'name': '',
+                'server_id': i if i % 10 == 1 else None,
+                'last_activity': now - timedelta(minutes=i % 10000),
+            }
+            for i in range(1, n_users + 1)
+        ],
+    )
+    insert(
+        'oauth_clients',
+        [
+            {'id': i, 'identifier': 'client-%i' % i, 'secret': 'secret'}
+            for i in range(1, n_clients + 1)
+        ],
+    )
+    # half of the tokens and codes are expired
+    insert(
+        'api_tokens',
+        [
+            {
+                'id': i,
+                'user_id': (i // 2) + 1,
+                'hashed': 'api-%i' % i,
+                'prefix': 'api%i' % (i % 1000),
+                'created': now,
+                'expires_at': now + timedelta(hours=1 if i % 2 else -1),
+            }
+            for i in range(1, 2 * n_users)
+        ],
+    )
+    insert(
+        'oauth_access_tokens',
+        [
+            {
+                'id': i,
+                'user_id': (i // 2) + 1,
+                'client_id': 'client-%i' % (i % n_clients + 1),
+                'grant_type': orm.GrantType.authorization_code,
+                'hashed': 'oauth-%i' % i,
+                'prefix': 'oau%i' % (i % 1000),
+                'expires_at': int(now.timestamp()) + (3600 if i % 2 else -3600),
+            }
+            for i in range(1, 2 * n_users)
+        ],
+    )
+    insert(
+        'oauth_codes',
+        [
+            {
+                'id': i,
+                'user_id': i,
+                'client_id': 'client-%i' % (i % n_clients + 1),
+                'code': 'code-%i' % i,
+                'expires_at': int(now.timestamp()) + (60 if i % 2 else -60),
+            }
+            for i in range(1, n_users + 1)
+        ],
+    )
+
+
+def hot_queries(db, n_users):
+    """The lookups to explain, as {label: query}"""
+    now = datetime.utcnow()
+    user_id = n_users // 2 + 1
+    return {
+        "spawners of a user": db.query(orm.Spawner).filter(
+            orm.Spawner.user_id == user_id
+        ),
+        "spawner of a server": db.query(orm.Spawner).filter(
+            orm.Spawner.server_id == user_id
+        ),
+        "members of a group": db.query(orm.user_group_map.c.user_id).filter(
+            orm.user_group_map.c.group_id == 1
+        ),
+        "users inactive for a day": db.query(orm.User.id).filter(
+            orm.User.last_activity < now - timedelta(days=1)
+        ),
+        "tokens of a user": db.query(orm.APIToken).filter(
+            orm.APIToken.user_id == user_id
+        ),
+        "tokens of a service": db.query(orm.APIToken).filter(
+            orm.APIToken.service_id == 1
+        ),
+        "expired api tokens": db.query(orm.APIToken.id)
+        .filter(orm.APIToken.expires_at < now)
+        .limit(orm.APIToken.purge_batch_size),
+        "oauth tokens of a user": db.query(orm.OAuthAccessToken).filter(
+            orm.OAuthAccessToken.user_id == user_id
+        ),
+        "oauth tokens of a client": db.query(orm.OAuthAccessToken).filter(
+            orm.OAuthAccessToken.client_id == 'client-1'
+        ),
+        "expired oauth tokens": db.query(orm.OAuthAccessToken.id)
+        .filter(orm.OAuthAccessToken.expires_at < now.timestamp())
+        .limit(orm.OAuthAccessToken.purge_batch_size),
+        "oauth code": db.query(orm.OAuthCode).filter(
+            orm.OAuthCode.code == 'code-%i' % user_id
+        ),
+        "expired oauth codes": db.query(orm.OAuthCode.id)
+        .filter(orm.OAuthCode.expires_at < now.timestamp())
+        .limit(orm.OAuthCode.purge_batch_size),
+    }
+
+
+def explain(conn, query):
+    """Return the lines of the query plan of a query"""
+    compiled = query.statement.compile(dialect=conn.dialect)
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+    if conn.dialect.name == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    else:
+        prefix = 'EXPLAIN '
+    rows = conn.execute(prefix + str(compiled), params)
+    return [' '.join(str(col) for col in row) for row in rows]
+
+
+def report(engine, n_users, repeat):
+    with engine.connect() as conn:
+        conn.execute('ANALYZE')
+    db = sessionmaker(bind=engine)()
+    try:
+        for label, query in hot_queries(db, n_users).items():
+            times = []
+            for i in range(repeat):
+                tic = time.perf_counter()
+                query.all()
+                times.append(time.perf_counter() - tic)
+                db.expunge_all()
+            print("%s: %.3fms" % (label, 1e3 * statistics.median(times)))
+            for line in explain(db.connection(), query):
+                print("    " + line)
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('db_url', nargs='?', help="database url (default: sqlite)")
+    parser.add_argument('--users', type=int, default=10000, help="number of users")
+    parser.add_argument(
+        '--repeat', type=int, default=10, help="number of times to run each query"
+    )
+    args = parser.parse_args()
+
+    db_url = args.db_url
+    if not db_url:
+        tmpdir = tempfile.mkdtemp()
+        db_url = 'sqlite:///' + os.path.join(tmpdir, 'jupyterhub.sqlite')
+    print("Populating %s with %i users" % (db_url, args.users))
+    engine = create_engine(db_url)
+    orm.Base.metadata.create_all(engine)
+    populate(engine, args.users)
+
+    indexes = {
+        index.name: index
+        for table in orm.Base.metadata.tables.values()
+        for index in table.indexes
+    }
+    for name in INDEXES:
+        indexes[name].drop(engine)
+    print("\nWithout indexes\n")
+    report(engine, args.users, args.repeat)
+
+    for name in INDEXES:
+        indexes[name].create(engine)
+    print("\nWith indexes\n")
+    report(engine, args.users, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
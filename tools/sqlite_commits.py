@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""Measure the throughput of commit-heavy Hub operations on sqlite
+
+Runs simulated activity updates and server start/stop cycles,
+each committed like the Hub does,
+with sqlite's default PRAGMAs and with SQLITE_PERFORMANCE_PRAGMAS.
+
+Usage:
+
+    python tools/sqlite_commits.py [--count N] [directory]
+
+The databases are created in a temporary directory by default.
+Pass a directory on the disk the Hub's database will be on
+for representative results, since the cost of a commit is mostly fsync.
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from jupyterhub import orm
+
+
+def activity_updates(db, users, count):
+    """Update users' last_activity, one commit per update"""
+    for i in range(count):
+        user = users[i % len(users)]
+        user.last_activity = datetime.utcnow()
+        db.commit()
+
+
+def spawn_cycles(db, users, count):
+    """Start and stop servers, with the commits of spawn and stop"""
+    for i in range(count // 2):
+        spawner = users[i % len(users)]._orm_spawners[0]
+        spawner.server = orm.Server()
+        spawner.started = datetime.utcnow()
+        db.commit()
+        db.delete(spawner.server)
+        spawner.server = None
+        db.commit()
+
+
+def run(db_url, pragmas, count):
+    """Return {benchmark: commits per second} for one database"""
+    db = orm.new_session_factory(db_url, sqlite_pragmas=pragmas)()
+    users = []
+    for i in range(10):
+        user = orm.User(name='user-%i' % i)
+        db.add(user)
+        db.add(orm.Spawner(user=user, name=''))
+        users.append(user)
+    db.commit()
+
+    results = {}
+    for benchmark in (activity_updates, spawn_cycles):
+        tic = time.perf_counter()
+        benchmark(db, users, count)
+        results[benchmark.__name__] = count / (time.perf_counter() - tic)
+    db.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        'directory', nargs='?', help="directory for the databases (default: temp)"
+    )
+    parser.add_argument(
+        '--count', type=int, default=1000, help="number of commits per benchmark"
+    )
+    args = parser.parse_args()
+    directory = args.directory or tempfile.mkdtemp()
+
+    profiles = {'default': {}, 'performance': orm.SQLITE_PERFORMANCE_PRAGMAS}
+    results = {}
+    for name, pragmas in profiles.items():
+        path = os.path.join(directory, 'jupyterhub-%s.sqlite' % name)
+        if os.path.exists(path):
+            os.remove(path)
+        results[name] = run('sqlite:///' + path, pragmas, args.count)
+
+    print("%-18s %14s %14s" % ("commits/s", *profiles))
+    for benchmark in results['default']:
+        print(
+            "%-18s %14.0f %14.0f"
+            % (
+                benchmark,
+                results['default'][benchmark],
+                results['performance'][benchmark],
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()